@@ -5,11 +5,33 @@ Application de gestion d'inventaire complète - Flask + SQLite/PostgreSQL
 """
 
 import os
+import sys
 import sqlite3
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file, make_response
-from datetime import datetime
+import threading
+import time
+from dataclasses import dataclass, field
+from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file, make_response, g, Response, stream_with_context, has_request_context
+from datetime import datetime, timedelta
 import io
 import csv
+import json
+import base64
+import re
+import unicodedata
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+import hashlib
+import hmac
+import bisect
+import random
+import zlib
+import itertools
+import zipfile
+import click
+from xml.sax.saxutils import escape as echapper_xml
+
+import etiquettes
 
 app = Flask(__name__)
 
@@ -34,43 +56,799 @@ if USE_POSTGRES:
         print("⚠️ psycopg2 non disponible, utilisation de SQLite")
         USE_POSTGRES = False
 
+# Exports Parquet / Arrow (optionnels)
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Profil de performance SQLite (appliqué une fois à chaque nouvelle connexion)
+#   - standard : WAL + synchronous=NORMAL. Les lectures ne bloquent plus l'écriture
+#     du scanner et inversement ; un commit n'attend plus le fsync (seul le dernier
+#     commit peut être perdu en cas de coupure de courant, jamais la base).
+#   - kiosque  : WAL + synchronous=FULL et peu de mémoire. Pour les boîtiers en
+#     boutique sans onduleur : chaque commit est durable, au prix d'un fsync par scan.
+#   - defaut   : réglages d'origine de SQLite (journal rollback, synchronous=FULL).
+# SQLITE_PRAGMAS permet de surcharger un réglage : "cache_size=-32000,mmap_size=0"
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'boutique_mobile.db')
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'standard')
+SQLITE_STATEMENT_CACHE = int(os.environ.get('SQLITE_STATEMENT_CACHE', '256'))
+
+SQLITE_PROFILS = {
+    'standard': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 268435456,   # 256 Mo
+        'cache_size': -65536,     # 64 Mo
+        'temp_store': 'MEMORY',
+    },
+    'kiosque': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'busy_timeout': 10000,
+        'mmap_size': 33554432,    # 32 Mo
+        'cache_size': -8192,      # 8 Mo
+        'temp_store': 'MEMORY',
+    },
+    'defaut': {},
+}
+
+def get_sqlite_pragmas():
+    """Réglages PRAGMA du profil SQLite actif, surcharges SQLITE_PRAGMAS comprises"""
+    pragmas = dict(SQLITE_PROFILS.get(SQLITE_PROFILE, SQLITE_PROFILS['standard']))
+    for reglage in os.environ.get('SQLITE_PRAGMAS', '').split(','):
+        if '=' in reglage:
+            nom, valeur = reglage.split('=', 1)
+            pragmas[nom.strip()] = valeur.strip()
+    return pragmas
+
+def appliquer_profil_sqlite(conn):
+    """Applique les PRAGMA du profil à une connexion SQLite"""
+    for nom, valeur in get_sqlite_pragmas().items():
+        conn.execute(f'PRAGMA {nom} = {valeur}')
+
 def get_db_connection():
     """Connexion universelle SQLite (local) ou PostgreSQL (production)"""
     if USE_POSTGRES:
-        conn = psycopg2.connect(DATABASE_URL)
+        conn = psycopg2.connect(DATABASE_URL, cursor_factory=CurseurPGMesure)
         return conn
     else:
-        conn = sqlite3.connect('boutique_mobile.db')
+        busy_timeout = int(get_sqlite_pragmas().get('busy_timeout', 5000))
+        # check_same_thread=False : une connexion du pool peut servir des threads différents
+        conn = sqlite3.connect(SQLITE_PATH,
+                               timeout=busy_timeout / 1000,
+                               cached_statements=SQLITE_STATEMENT_CACHE,
+                               check_same_thread=False,
+                               factory=ConnexionSQLiteMesuree)
         conn.row_factory = sqlite3.Row
+        appliquer_profil_sqlite(conn)
         return conn
 
+# Pool de connexions : un pool borné par worker gunicorn, les connexions
+# sont réutilisées d'une requête à l'autre au lieu d'être rouvertes.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '5'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+DB_POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800'))
+DB_POOL_HEALTHCHECK_IDLE = float(os.environ.get('DB_POOL_HEALTHCHECK_IDLE', '30'))
+
+class PoolConnexions:
+    """Pool borné de connexions avec vérification de santé et recyclage par âge
+
+    - au plus `taille` connexions empruntées en même temps (les suivantes attendent)
+    - une connexion restée inactive plus de `verif_inactivite` secondes est testée
+      (SELECT 1) avant d'être rendue à une requête
+    - une connexion plus vieille que `duree_max` secondes est fermée et remplacée
+    - taille = 0 désactive le pool (une connexion neuve par requête)
+    """
+
+    def __init__(self, taille, attente_max, duree_max, verif_inactivite):
+        self.taille = taille
+        self.attente_max = attente_max
+        self.duree_max = duree_max
+        self.verif_inactivite = verif_inactivite
+        self.pid = os.getpid()
+        self._libres = []  # (conn, date_creation, date_retour)
+        self._creees = {}  # id(conn) -> date_creation
+        self._verrou = threading.Lock()
+        self._places = threading.BoundedSemaphore(taille) if taille > 0 else None
+        self.stats = {'ouvertes': 0, 'reutilisees': 0, 'recyclees': 0, 'invalides': 0}
+
+    def acquerir(self):
+        """Emprunte une connexion (réutilisée si possible, sinon ouverte)"""
+        if self._places is None:
+            self.stats['ouvertes'] += 1
+            return get_db_connection()
+        if not self._places.acquire(timeout=self.attente_max):
+            raise RuntimeError('Database connection pool exhausted')
+        try:
+            while True:
+                with self._verrou:
+                    if not self._libres:
+                        break
+                    conn, cree_le, rendu_le = self._libres.pop()
+                maintenant = time.monotonic()
+                if maintenant - cree_le > self.duree_max:
+                    self.stats['recyclees'] += 1
+                    self._fermer(conn)
+                    continue
+                if maintenant - rendu_le > self.verif_inactivite and not self._est_valide(conn):
+                    self.stats['invalides'] += 1
+                    self._fermer(conn)
+                    continue
+                self.stats['reutilisees'] += 1
+                return conn
+            conn = get_db_connection()
+            with self._verrou:
+                self._creees[id(conn)] = time.monotonic()
+            self.stats['ouvertes'] += 1
+            return conn
+        except Exception:
+            self._places.release()
+            raise
+
+    def liberer(self, conn):
+        """Rend une connexion au pool (transaction en cours annulée)"""
+        if self._places is None:
+            self._fermer(conn)
+            return
+        try:
+            try:
+                conn.rollback()
+            except Exception:
+                self.stats['invalides'] += 1
+                self._fermer(conn)
+                return
+            cree_le = self._creees.get(id(conn), 0)
+            maintenant = time.monotonic()
+            if maintenant - cree_le > self.duree_max:
+                self.stats['recyclees'] += 1
+                self._fermer(conn)
+                return
+            with self._verrou:
+                self._libres.append((conn, cree_le, maintenant))
+        finally:
+            self._places.release()
+
+    def fermer_tout(self):
+        """Ferme toutes les connexions inactives du pool"""
+        with self._verrou:
+            libres, self._libres = self._libres, []
+        for conn, _, _ in libres:
+            self._fermer(conn)
+
+    def _est_valide(self, conn):
+        try:
+            if USE_POSTGRES and conn.closed:
+                return False
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _fermer(self, conn):
+        with self._verrou:
+            self._creees.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+_pool = None
+_pool_verrou = threading.Lock()
+
+def get_pool():
+    """Pool du processus courant (recréé après un fork de gunicorn)"""
+    global _pool
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_verrou:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = PoolConnexions(DB_POOL_SIZE, DB_POOL_TIMEOUT,
+                                       DB_POOL_MAX_LIFETIME, DB_POOL_HEALTHCHECK_IDLE)
+    return _pool
+
+def get_db():
+    """Connexion de la requête courante : empruntée au pool une seule fois, rendue au teardown"""
+    if 'db' not in g:
+        g.db = get_pool().acquerir()
+    return g.db
+
+def annuler_transaction():
+    """Annule la transaction en échec de la requête courante pour pouvoir continuer à lire"""
+    conn = g.get('db')
+    if conn is not None:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+@app.teardown_appcontext
+def liberer_db(exception):
+    """Rend la connexion de la requête au pool"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().liberer(conn)
+
+# Mesures par requête HTTP : durée, requêtes SQL (nombre et durée), lignes lues
+# et octets envoyés, par endpoint. Chaque curseur est mesuré (fabriques de
+# get_db_connection) : deux lectures d'horloge et un ajout à la mesure de la
+# requête en cours (thread-local), les histogrammes ne sont mis à jour qu'une
+# fois par requête HTTP. Chaque worker écrit ses totaux dans METRIQUES_DIR,
+# /metrics additionne ceux de tous les workers vivants.
+METRIQUES_DIR = os.environ.get('METRIQUES_DIR', 'metriques')
+METRIQUES_ECRITURE = float(os.environ.get('METRIQUES_ECRITURE', '5'))
+SEUILS_DUREE = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SEUILS_DUREE_SQL = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+
+# nom -> (type, labels, aide[, seuils])
+DEFINITIONS_METRIQUES = {
+    'http_requests_total': ('counter', ('endpoint', 'method', 'status'), 'HTTP requests handled'),
+    'http_request_duration_seconds': ('histogram', ('endpoint', 'method'),
+                                      'Time from request start until the response body is sent', SEUILS_DUREE),
+    'http_response_bytes_total': ('counter', ('endpoint',), 'Response body bytes sent'),
+    'db_queries_total': ('counter', ('endpoint',), 'SQL statements executed'),
+    'db_query_duration_seconds': ('histogram', ('endpoint',), 'SQL statement execution time', SEUILS_DUREE_SQL),
+    'db_rows_fetched_total': ('counter', ('endpoint',), 'Rows fetched from the database'),
+}
+
+_mesure_locale = threading.local()
+
+class MesureRequete:
+    """Compteurs de la requête HTTP en cours (un seul thread y écrit)"""
+    __slots__ = ('endpoint', 'methode', 'debut', 'durees_sql', 'lignes', 'octets')
+
+    def __init__(self, endpoint, methode):
+        self.endpoint = endpoint
+        self.methode = methode
+        self.debut = time.perf_counter()
+        self.durees_sql = []
+        self.lignes = 0
+        self.octets = 0
+
+class CurseurMesure:
+    """Mixin de curseur : chronomètre execute/executemany/copy_expert et compte les lignes lues
+
+    Une requête plus lente que REQUETES_LENTES_SEUIL_MS est transmise à noter_requete_lente.
+    """
+
+    def execute(self, *args):
+        mesure = getattr(_mesure_locale, 'requete', None)
+        if mesure is None:
+            return super().execute(*args)
+        debut = time.perf_counter()
+        try:
+            resultat = super().execute(*args)
+        except Exception:
+            mesure.durees_sql.append(time.perf_counter() - debut)
+            raise
+        duree = time.perf_counter() - debut
+        mesure.durees_sql.append(duree)
+        if duree >= SEUIL_REQUETE_LENTE:
+            noter_requete_lente(self, mesure, duree, *args)
+        return resultat
+
+    def executemany(self, *args):
+        mesure = getattr(_mesure_locale, 'requete', None)
+        if mesure is None:
+            return super().executemany(*args)
+        debut = time.perf_counter()
+        try:
+            resultat = super().executemany(*args)
+        except Exception:
+            mesure.durees_sql.append(time.perf_counter() - debut)
+            raise
+        duree = time.perf_counter() - debut
+        mesure.durees_sql.append(duree)
+        if duree >= SEUIL_REQUETE_LENTE:
+            noter_requete_lente(self, mesure, duree, *args, plusieurs=True)
+        return resultat
+
+    def copy_expert(self, sql, *args):
+        mesure = getattr(_mesure_locale, 'requete', None)
+        if mesure is None:
+            return super().copy_expert(sql, *args)
+        debut = time.perf_counter()
+        try:
+            resultat = super().copy_expert(sql, *args)
+        except Exception:
+            mesure.durees_sql.append(time.perf_counter() - debut)
+            raise
+        duree = time.perf_counter() - debut
+        mesure.durees_sql.append(duree)
+        if duree >= SEUIL_REQUETE_LENTE:
+            noter_requete_lente(self, mesure, duree, sql)
+        return resultat
+
+    def fetchone(self):
+        ligne = super().fetchone()
+        mesure = getattr(_mesure_locale, 'requete', None)
+        if mesure is not None and ligne is not None:
+            mesure.lignes += 1
+        return ligne
+
+    def fetchmany(self, *args):
+        lignes = super().fetchmany(*args)
+        mesure = getattr(_mesure_locale, 'requete', None)
+        if mesure is not None:
+            mesure.lignes += len(lignes)
+        return lignes
+
+    def fetchall(self):
+        lignes = super().fetchall()
+        mesure = getattr(_mesure_locale, 'requete', None)
+        if mesure is not None:
+            mesure.lignes += len(lignes)
+        return lignes
+
+class CurseurSQLiteMesure(CurseurMesure, sqlite3.Cursor):
+    pass
+
+class ConnexionSQLiteMesuree(sqlite3.Connection):
+    def cursor(self, factory=None):
+        return super().cursor(factory or CurseurSQLiteMesure)
+
+if USE_POSTGRES:
+    class CurseurPGMesure(CurseurMesure, psycopg2.extensions.cursor):
+        pass
+
+    class CurseurDictPGMesure(CurseurMesure, RealDictCursor):
+        pass
+
+class Metriques:
+    """Compteurs et histogrammes du worker courant
+
+    series : nom -> {labels: valeur} pour un compteur, {labels: [effectif par seau..., somme]}
+    pour un histogramme (le dernier seau est +Inf, les effectifs ne sont pas cumulés).
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.verrou = threading.Lock()
+        self.series = {nom: {} for nom in DEFINITIONS_METRIQUES}
+        self.derniere_ecriture = time.monotonic()
+
+    def _observer(self, nom, labels, valeur):
+        seuils = DEFINITIONS_METRIQUES[nom][3]
+        serie = self.series[nom].get(labels)
+        if serie is None:
+            serie = self.series[nom][labels] = [0] * (len(seuils) + 1) + [0.0]
+        serie[bisect.bisect_left(seuils, valeur)] += 1
+        serie[-1] += valeur
+
+    def _ajouter(self, nom, labels, valeur):
+        serie = self.series[nom]
+        serie[labels] = serie.get(labels, 0) + valeur
+
+    def enregistrer(self, endpoint, methode, statut, duree, mesure):
+        with self.verrou:
+            self._ajouter('http_requests_total', (endpoint, methode, str(statut)), 1)
+            self._observer('http_request_duration_seconds', (endpoint, methode), duree)
+            self._ajouter('http_response_bytes_total', (endpoint,), mesure.octets)
+            self._ajouter('db_queries_total', (endpoint,), len(mesure.durees_sql))
+            self._ajouter('db_rows_fetched_total', (endpoint,), mesure.lignes)
+            for duree_sql in mesure.durees_sql:
+                self._observer('db_query_duration_seconds', (endpoint,), duree_sql)
+        if time.monotonic() - self.derniere_ecriture > METRIQUES_ECRITURE:
+            self.ecrire()
+
+    def ecrire(self):
+        """Écrit les totaux du worker dans METRIQUES_DIR/worker-<pid>.json (remplacement atomique)"""
+        self.derniere_ecriture = time.monotonic()
+        with self.verrou:
+            instantane = {nom: [[list(labels), valeur] for labels, valeur in serie.items()]
+                          for nom, serie in self.series.items()}
+        try:
+            os.makedirs(METRIQUES_DIR, exist_ok=True)
+            chemin = os.path.join(METRIQUES_DIR, f'worker-{self.pid}.json')
+            temporaire = f'{chemin}.{threading.get_ident()}.tmp'
+            with open(temporaire, 'w') as fichier:
+                json.dump(instantane, fichier, separators=(',', ':'))
+            os.replace(temporaire, chemin)
+        except OSError:
+            pass
+
+def agreger_metriques(metriques):
+    """Additionne les totaux de tous les workers vivants (fichiers des workers arrêtés supprimés)"""
+    metriques.ecrire()
+    total = {nom: {} for nom in DEFINITIONS_METRIQUES}
+    try:
+        fichiers = [nom for nom in os.listdir(METRIQUES_DIR) if nom.startswith('worker-') and nom.endswith('.json')]
+    except OSError:
+        fichiers = []
+    for nom_fichier in fichiers:
+        chemin = os.path.join(METRIQUES_DIR, nom_fichier)
+        pid = int(nom_fichier[len('worker-'):-len('.json')])
+        if pid != metriques.pid:
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                try:
+                    os.remove(chemin)
+                except OSError:
+                    pass
+                continue
+            except PermissionError:
+                pass
+        try:
+            with open(chemin) as fichier:
+                series = json.load(fichier)
+        except (OSError, ValueError):
+            continue
+        for nom, valeurs in series.items():
+            if nom not in total:
+                continue
+            serie = total[nom]
+            for labels, valeur in valeurs:
+                labels = tuple(labels)
+                if isinstance(valeur, list):
+                    cumul = serie.get(labels)
+                    serie[labels] = valeur if cumul is None else [a + b for a, b in zip(cumul, valeur)]
+                else:
+                    serie[labels] = serie.get(labels, 0) + valeur
+    return total
+
+def format_prometheus(series, prefixe='gestion_stock_'):
+    """Texte d'exposition Prometheus (version 0.0.4) des séries agrégées"""
+    def etiquettes_prometheus(noms, valeurs):
+        paires = []
+        for nom, valeur in zip(noms, valeurs):
+            valeur = str(valeur).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            paires.append(f'{nom}="{valeur}"')
+        return '{' + ','.join(paires) + '}' if paires else ''
+
+    lignes = []
+    for nom, definition in DEFINITIONS_METRIQUES.items():
+        type_metrique, noms_labels, aide = definition[:3]
+        nom_complet = prefixe + nom
+        lignes.append(f'# HELP {nom_complet} {aide}')
+        lignes.append(f'# TYPE {nom_complet} {type_metrique}')
+        for labels, valeur in sorted(series.get(nom, {}).items()):
+            if type_metrique == 'histogram':
+                cumul = 0
+                for seuil, effectif in zip(list(definition[3]) + ['+Inf'], valeur[:-1]):
+                    cumul += effectif
+                    lignes.append(f'{nom_complet}_bucket'
+                                  f'{etiquettes_prometheus(noms_labels + ("le",), labels + (seuil,))} {cumul}')
+                lignes.append(f'{nom_complet}_sum{etiquettes_prometheus(noms_labels, labels)} {valeur[-1]}')
+                lignes.append(f'{nom_complet}_count{etiquettes_prometheus(noms_labels, labels)} {cumul}')
+            else:
+                lignes.append(f'{nom_complet}{etiquettes_prometheus(noms_labels, labels)} {valeur}')
+    return '\n'.join(lignes) + '\n'
+
+_metriques = None
+_metriques_verrou = threading.Lock()
+
+def get_metriques():
+    """Métriques du processus courant (recréées après un fork de gunicorn)"""
+    global _metriques
+    if _metriques is None or _metriques.pid != os.getpid():
+        with _metriques_verrou:
+            if _metriques is None or _metriques.pid != os.getpid():
+                _metriques = Metriques()
+    return _metriques
+
+def compter_octets(morceaux, mesure):
+    """Réémet un corps de réponse en flux en comptant ses octets"""
+    for morceau in morceaux:
+        mesure.octets += len(morceau)
+        yield morceau
+
+@app.before_request
+def debut_mesure():
+    _mesure_locale.requete = MesureRequete(request.endpoint or 'inconnu', request.method)
+
+@app.after_request
+def fin_mesure(reponse):
+    """Compte les octets envoyés et enregistre la requête une fois le corps entièrement envoyé"""
+    mesure = getattr(_mesure_locale, 'requete', None)
+    if mesure is None:
+        return reponse
+    statut = reponse.status_code
+    if reponse.content_length is not None:
+        mesure.octets = reponse.content_length
+    elif reponse.is_streamed:
+        reponse.response = compter_octets(reponse.response, mesure)
+
+    def terminer():
+        if getattr(_mesure_locale, 'requete', None) is mesure:
+            _mesure_locale.requete = None
+        get_metriques().enregistrer(mesure.endpoint, mesure.methode, statut, time.perf_counter() - mesure.debut, mesure)
+
+    reponse.call_on_close(terminer)
+    return reponse
+
+class CacheLRU:
+    """Cache LRU borné, thread-safe, avec expiration et compteurs de succès/échecs
+
+    Une entrée marquée négative (clé inconnue, valeur None par défaut) a sa
+    propre durée de vie `ttl_negatif`.
+    """
+
+    def __init__(self, taille_max, ttl, ttl_negatif=None):
+        self.taille_max = taille_max
+        self.ttl = ttl
+        self.ttl_negatif = ttl if ttl_negatif is None else ttl_negatif
+        self._entrees = OrderedDict()  # cle -> (valeur, expiration, negatif)
+        self._verrou = threading.Lock()
+        self.stats = {'hits': 0, 'hits_negatifs': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, cle):
+        """Retourne (trouve, valeur) ; trouve est faux si absent ou expiré"""
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is None or entree[1] < time.monotonic():
+                if entree is not None:
+                    del self._entrees[cle]
+                self.stats['misses'] += 1
+                return False, None
+            self._entrees.move_to_end(cle)
+            self.stats['hits_negatifs' if entree[2] else 'hits'] += 1
+            return True, entree[0]
+
+    def set(self, cle, valeur, negatif=None):
+        negatif = valeur is None if negatif is None else negatif
+        ttl = self.ttl_negatif if negatif else self.ttl
+        if self.taille_max <= 0 or ttl <= 0:
+            return
+        with self._verrou:
+            self._entrees[cle] = (valeur, time.monotonic() + ttl, negatif)
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.taille_max:
+                self._entrees.popitem(last=False)
+
+    def invalider(self, cle=None):
+        """Retire une clé, ou vide tout le cache si cle est None"""
+        with self._verrou:
+            self.stats['invalidations'] += 1
+            if cle is None:
+                self._entrees.clear()
+            else:
+                self._entrees.pop(cle, None)
+
+    def get_stats(self):
+        with self._verrou:
+            return dict(self.stats, taille=len(self._entrees), taille_max=self.taille_max)
+
+# Cache code-barres -> produit du scanner (par worker). Les écritures du worker
+# invalident l'entrée concernée ; les TTL courts bornent le retard sur les
+# écritures faites par les autres workers gunicorn. Chaque entrée garde la
+# version des produits sous laquelle elle a été lue (voir produit_en_cache).
+CACHE_PRODUITS_TAILLE = int(os.environ.get('CACHE_PRODUITS_TAILLE', '2048'))
+CACHE_PRODUITS_TTL = float(os.environ.get('CACHE_PRODUITS_TTL', '5'))
+CACHE_PRODUITS_TTL_NEGATIF = float(os.environ.get('CACHE_PRODUITS_TTL_NEGATIF', '10'))
+cache_produits = CacheLRU(CACHE_PRODUITS_TAILLE, CACHE_PRODUITS_TTL, CACHE_PRODUITS_TTL_NEGATIF)
+
+# Journal des requêtes lentes : toute requête SQL d'une requête HTTP qui dépasse
+# le seuil est journalisée (SQL normalisé, forme des paramètres, plan d'exécution)
+# et gardée dans un tampon circulaire par worker, consultable sur /admin/requetes-lentes.
+# Sur PostgreSQL, une fraction des plans est relevée avec EXPLAIN (ANALYZE, BUFFERS),
+# qui réexécute la requête dans un point de sauvegarde aussitôt annulé.
+REQUETES_LENTES_SEUIL_MS = float(os.environ.get('REQUETES_LENTES_SEUIL_MS', '200'))
+REQUETES_LENTES_TAILLE = int(os.environ.get('REQUETES_LENTES_TAILLE', '200'))
+EXPLAIN_ANALYZE_ECHANTILLON = float(os.environ.get('EXPLAIN_ANALYZE_ECHANTILLON', '0.1'))
+SEUIL_REQUETE_LENTE = REQUETES_LENTES_SEUIL_MS / 1000 if REQUETES_LENTES_SEUIL_MS > 0 else float('inf')
+REQUETES_EXPLICABLES = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'VALUES')
+
+requetes_lentes = deque(maxlen=REQUETES_LENTES_TAILLE)
+_erreurs_requetes_lentes = set()  # types d'erreur du journal déjà signalés
+cache_plans = CacheLRU(256, 60)  # un EXPLAIN par requête normalisée et par minute au plus
+
+_SQL_LITTERAUX = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SQL_LISTES = re.compile(r'\(\?(?:\s*,\s*\?)+\)')
+_SQL_LIGNES = re.compile(r'\(\?, \.\.\.\)(?:\s*,\s*\(\?, \.\.\.\))+')
+
+def normaliser_sql(sql):
+    """SQL sans valeurs littérales ni listes de paramètres, pour regrouper les requêtes identiques"""
+    sql = ' '.join(sql.split()).replace('%s', '?')
+    sql = _SQL_LITTERAUX.sub('?', sql)
+    sql = _SQL_LISTES.sub('(?, ...)', sql)
+    return _SQL_LIGNES.sub('(?, ...), ...', sql)
+
+def forme_parametres(params):
+    """Types des paramètres, sans leurs valeurs : ['str', 'int×3'] ou {'nom': 'str'}"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {cle: type(valeur).__name__ for cle, valeur in params.items()}
+    forme = []
+    for nom, suite in itertools.groupby(type(valeur).__name__ for valeur in params):
+        nombre = sum(1 for _ in suite)
+        forme.append(f'{nom}×{nombre}' if nombre > 1 else nom)
+    return forme
+
+def expliquer_requete(conn, sql, params, analyser):
+    """Plan d'exécution texte (EXPLAIN QUERY PLAN sur SQLite, EXPLAIN sur PostgreSQL)
+
+    Le curseur utilisé n'est pas mesuré, pour ne pas se journaliser lui-même.
+    """
+    if USE_POSTGRES:
+        cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+        options = '(ANALYZE, BUFFERS) ' if analyser else ''
+        if conn.autocommit:
+            if analyser:
+                return None
+            cursor.execute(f'EXPLAIN {sql}', params)
+            return '\n'.join(ligne[0] for ligne in cursor.fetchall())
+        cursor.execute('SAVEPOINT requete_lente')
+        try:
+            cursor.execute(f'EXPLAIN {options}{sql}', params)
+            return '\n'.join(ligne[0] for ligne in cursor.fetchall())
+        finally:
+            cursor.execute('ROLLBACK TO SAVEPOINT requete_lente')
+            cursor.execute('RELEASE SAVEPOINT requete_lente')
+    cursor = conn.cursor(sqlite3.Cursor)
+    cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params or ())
+    profondeurs, lignes = {}, []
+    for id_noeud, parent, _, detail in cursor.fetchall():
+        profondeurs[id_noeud] = profondeurs.get(parent, -1) + 1
+        lignes.append('  ' * profondeurs[id_noeud] + detail)
+    return '\n'.join(lignes)
+
+def noter_requete_lente(cursor, mesure, duree, sql, params=None, plusieurs=False):
+    """Journalise une requête SQL lente et l'ajoute au tampon avec son plan d'exécution
+
+    sql peut être en bytes (execute_values de psycopg2, valeurs déjà incluses)
+    ou un objet psycopg2.sql composé.
+    """
+    try:
+        if isinstance(sql, bytes):
+            sql = sql.decode('utf-8', 'replace')
+        elif not isinstance(sql, str):
+            sql = sql.as_string(cursor)
+        nb_lignes = None
+        if plusieurs:
+            nb_lignes = len(params) if hasattr(params, '__len__') else None
+            params = params[0] if nb_lignes else None
+        sql_normalise = normaliser_sql(sql)
+        
+        plan, analyse = None, False
+        if sql.lstrip()[:6].upper() in {mot[:6] for mot in REQUETES_EXPLICABLES}:
+            trouve, entree = cache_plans.get(sql_normalise)
+            if trouve:
+                plan, analyse = entree
+            else:
+                analyse = USE_POSTGRES and random.random() < EXPLAIN_ANALYZE_ECHANTILLON
+                try:
+                    plan = expliquer_requete(cursor.connection, sql, params, analyse)
+                except Exception as e:
+                    plan = f'EXPLAIN failed: {e}'
+                cache_plans.set(sql_normalise, (plan, analyse))
+        
+        entree = {
+            'date': datetime.utcnow().isoformat(timespec='seconds'),
+            'endpoint': mesure.endpoint,
+            'methode': mesure.methode,
+            'duree_ms': round(duree * 1000, 2),
+            'sql': sql_normalise,
+            'parametres': forme_parametres(params),
+            'nb_lignes_parametres': nb_lignes,
+            'plan': plan,
+            'analyse': analyse
+        }
+        requetes_lentes.append(entree)
+        app.logger.warning('Slow query (%.1f ms) in %s: %s', entree['duree_ms'], mesure.endpoint, sql_normalise)
+    except (TypeError, ValueError, LookupError, AttributeError) as e:
+        # Le journal ne fait pas échouer la requête mesurée, mais chaque type d'erreur est signalé une fois
+        if type(e) not in _erreurs_requetes_lentes:
+            _erreurs_requetes_lentes.add(type(e))
+            app.logger.exception('Could not record slow query')
+
 def get_cursor(conn):
     """Crée un cursor approprié selon le type de base de données"""
     if USE_POSTGRES:
-        return conn.cursor(cursor_factory=RealDictCursor)
+        return conn.cursor(cursor_factory=CurseurDictPGMesure)
     else:
         return conn.cursor()
 
-def init_database():
-    """Initialise la base de données (PostgreSQL ou SQLite)"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Syntaxe SQL adaptée selon la base
-    if USE_POSTGRES:
-        # PostgreSQL
+# Recalcul complet des compteurs stats_categories à partir de produits
+RECONSTRUCTION_STATS = [
+    'DELETE FROM stats_categories',
+    '''INSERT INTO stats_categories (categorie, nb_produits, ruptures, stock_faible, stock_total, valeur_stock)
+       SELECT COALESCE(categorie, ''),
+              COUNT(*),
+              SUM(CASE WHEN stock = 0 THEN 1 ELSE 0 END),
+              SUM(CASE WHEN stock > 0 AND stock <= 5 THEN 1 ELSE 0 END),
+              COALESCE(SUM(stock), 0),
+              COALESCE(SUM(stock * prix), 0)
+       FROM produits
+       GROUP BY COALESCE(categorie, '')''',
+]
+
+# Mouvement d'ouverture (delta nul) pour les produits sans aucun historique de
+# stock : leur stock courant vaut alors pour toute date passée
+OUVERTURE_MOUVEMENTS = '''
+    INSERT INTO stock_mouvements (produit_id, delta, stock_apres, action)
+    SELECT p.id, 0, p.stock, 'ouverture' FROM produits p
+    WHERE NOT EXISTS (SELECT 1 FROM stock_mouvements m WHERE m.produit_id = p.id)
+      AND NOT EXISTS (SELECT 1 FROM stock_journalier j WHERE j.produit_id = p.id)
+'''
+
+def creer_recherche_sqlite(cursor):
+    """Index plein texte FTS5 (sans accents ni casse, préfixes) synchronisé par triggers"""
+    try:
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS categories (
+            CREATE VIRTUAL TABLE IF NOT EXISTS produits_fts USING fts5(
+                nom, code_barres,
+                content='produits', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        ''')
+    except sqlite3.OperationalError:
+        print("⚠️ FTS5 not available in this SQLite build, search falls back to LIKE")
+        return
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_produits_fts_insert AFTER INSERT ON produits BEGIN
+            INSERT INTO produits_fts (rowid, nom, code_barres)
+            VALUES (NEW.id, NEW.nom, NEW.code_barres);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_produits_fts_delete AFTER DELETE ON produits BEGIN
+            INSERT INTO produits_fts (produits_fts, rowid, nom, code_barres)
+            VALUES ('delete', OLD.id, OLD.nom, OLD.code_barres);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_produits_fts_update AFTER UPDATE OF nom, code_barres ON produits BEGIN
+            INSERT INTO produits_fts (produits_fts, rowid, nom, code_barres)
+            VALUES ('delete', OLD.id, OLD.nom, OLD.code_barres);
+            INSERT INTO produits_fts (rowid, nom, code_barres)
+            VALUES (NEW.id, NEW.nom, NEW.code_barres);
+        END
+    ''')
+    cursor.execute("INSERT INTO produits_fts (produits_fts) VALUES ('rebuild')")
+
+def creer_recherche_postgres(cursor):
+    """Index tsvector + trigrammes sur le nom sans accents (extensions unaccent et pg_trgm)"""
+    cursor.execute('SAVEPOINT recherche')
+    try:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS unaccent')
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except Exception:
+        cursor.execute('ROLLBACK TO SAVEPOINT recherche')
+        print("⚠️ unaccent/pg_trgm extensions not available, search falls back to ILIKE")
+        return
+    # unaccent() n'est pas IMMUTABLE : enveloppe utilisable dans un index
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text AS
+        $$ SELECT public.unaccent('public.unaccent', $1) $$
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_produits_recherche ON produits
+        USING GIN (to_tsvector('simple', f_unaccent(nom || ' ' || code_barres)))
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_produits_nom_trgm ON produits
+        USING GIN (f_unaccent(lower(nom)) gin_trgm_ops)
+    ''')
+
+# Index des tris de paginer() sur colonne nullable (même expression que l'ORDER BY)
+INDEX_TRI_CATEGORIE = "CREATE INDEX IF NOT EXISTS idx_produits_tri_categorie ON produits ((COALESCE(categorie, '')), id)"
+INDEX_TRI_DATE = "CREATE INDEX IF NOT EXISTS idx_produits_tri_date ON produits ((COALESCE(date_creation, '1970-01-01 00:00:00')), id)"
+
+# Migrations du schéma : chaque étape est appliquée une seule fois, dans l'ordre,
+# et enregistrée dans schema_version. Pour faire évoluer le schéma, ajouter une
+# étape en fin de liste (ne jamais modifier une étape déjà déployée).
+# Une étape est soit une liste de requêtes communes, soit un dict
+# {'sqlite': [...], 'postgres': [...]} quand la syntaxe diffère. Une requête
+# peut être remplacée par une fonction cursor -> None (étape conditionnelle).
+
+MIGRATIONS = [
+    (1, 'Tables categories et produits', {
+        'postgres': [
+            '''CREATE TABLE IF NOT EXISTS categories (
                 id SERIAL PRIMARY KEY,
                 nom TEXT NOT NULL UNIQUE,
-                emoji TEXT DEFAULT '\ud83d\udce6',
+                emoji TEXT DEFAULT '📦',
                 description TEXT,
                 date_creation TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS produits (
+            )''',
+            '''CREATE TABLE IF NOT EXISTS produits (
                 id SERIAL PRIMARY KEY,
                 nom TEXT NOT NULL,
                 code_barres TEXT UNIQUE NOT NULL,
@@ -78,25 +856,17 @@ def init_database():
                 stock INTEGER NOT NULL DEFAULT 0,
                 categorie TEXT DEFAULT 'Other',
                 date_creation TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        placeholder = '%s'
-        insert_ignore = 'INSERT INTO categories (emoji, nom, description) VALUES (%s, %s, %s) ON CONFLICT (nom) DO NOTHING'
-    else:
-        # SQLite
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS categories (
+            )''',
+        ],
+        'sqlite': [
+            '''CREATE TABLE IF NOT EXISTS categories (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 nom TEXT NOT NULL UNIQUE,
-                emoji TEXT DEFAULT '\ud83d\udce6',
+                emoji TEXT DEFAULT '📦',
                 description TEXT,
                 date_creation TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS produits (
+            )''',
+            '''CREATE TABLE IF NOT EXISTS produits (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 nom TEXT NOT NULL,
                 code_barres TEXT UNIQUE NOT NULL,
@@ -104,9 +874,436 @@ def init_database():
                 stock INTEGER NOT NULL DEFAULT 0,
                 categorie TEXT DEFAULT 'Other',
                 date_creation TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
+            )''',
+        ],
+    }),
+    (2, 'Index des filtres et tris de /produits, /ruptures, /stock-faible, /imprimer-codes-barres', [
+        # Filtre par catégorie trié par nom (voir_produits, imprimer_codes_barres)
+        'CREATE INDEX IF NOT EXISTS idx_produits_categorie_nom ON produits (categorie, nom)',
+        # Tris de voir_produits / codes_barres / api_produits
+        'CREATE INDEX IF NOT EXISTS idx_produits_nom ON produits (nom)',
+        'CREATE INDEX IF NOT EXISTS idx_produits_prix ON produits (prix)',
+        'CREATE INDEX IF NOT EXISTS idx_produits_stock ON produits (stock)',
+        'CREATE INDEX IF NOT EXISTS idx_produits_date_creation ON produits (date_creation)',
+        # Index partiels : ruptures() trie par nom, stock_faible() par stock
+        'CREATE INDEX IF NOT EXISTS idx_produits_ruptures ON produits (nom) WHERE stock = 0',
+        'CREATE INDEX IF NOT EXISTS idx_produits_stock_faible ON produits (stock) WHERE stock > 0 AND stock <= 5',
+        'ANALYZE produits',
+    ]),
+    (3, 'Compteurs stats_categories maintenus par triggers', {
+        'postgres': [
+            '''CREATE TABLE IF NOT EXISTS stats_categories (
+                categorie TEXT PRIMARY KEY,
+                nb_produits INTEGER NOT NULL DEFAULT 0,
+                ruptures INTEGER NOT NULL DEFAULT 0,
+                stock_faible INTEGER NOT NULL DEFAULT 0,
+                stock_total BIGINT NOT NULL DEFAULT 0,
+                valeur_stock DOUBLE PRECISION NOT NULL DEFAULT 0
+            )''',
+            '''CREATE OR REPLACE FUNCTION maj_stats_categories() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    INSERT INTO stats_categories AS s (categorie, nb_produits, ruptures, stock_faible, stock_total, valeur_stock)
+                    VALUES (COALESCE(OLD.categorie, ''), -1,
+                            -(CASE WHEN OLD.stock = 0 THEN 1 ELSE 0 END),
+                            -(CASE WHEN OLD.stock > 0 AND OLD.stock <= 5 THEN 1 ELSE 0 END),
+                            -OLD.stock, -(OLD.stock * OLD.prix))
+                    ON CONFLICT (categorie) DO UPDATE SET
+                        nb_produits = s.nb_produits + EXCLUDED.nb_produits,
+                        ruptures = s.ruptures + EXCLUDED.ruptures,
+                        stock_faible = s.stock_faible + EXCLUDED.stock_faible,
+                        stock_total = s.stock_total + EXCLUDED.stock_total,
+                        valeur_stock = s.valeur_stock + EXCLUDED.valeur_stock;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO stats_categories AS s (categorie, nb_produits, ruptures, stock_faible, stock_total, valeur_stock)
+                    VALUES (COALESCE(NEW.categorie, ''), 1,
+                            CASE WHEN NEW.stock = 0 THEN 1 ELSE 0 END,
+                            CASE WHEN NEW.stock > 0 AND NEW.stock <= 5 THEN 1 ELSE 0 END,
+                            NEW.stock, NEW.stock * NEW.prix)
+                    ON CONFLICT (categorie) DO UPDATE SET
+                        nb_produits = s.nb_produits + EXCLUDED.nb_produits,
+                        ruptures = s.ruptures + EXCLUDED.ruptures,
+                        stock_faible = s.stock_faible + EXCLUDED.stock_faible,
+                        stock_total = s.stock_total + EXCLUDED.stock_total,
+                        valeur_stock = s.valeur_stock + EXCLUDED.valeur_stock;
+                END IF;
+                DELETE FROM stats_categories WHERE nb_produits <= 0;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql''',
+            'DROP TRIGGER IF EXISTS trg_stats_produits ON produits',
+            '''CREATE TRIGGER trg_stats_produits
+                AFTER INSERT OR UPDATE OF stock, prix, categorie OR DELETE ON produits
+                FOR EACH ROW EXECUTE PROCEDURE maj_stats_categories()''',
+            *RECONSTRUCTION_STATS,
+        ],
+        'sqlite': [
+            '''CREATE TABLE IF NOT EXISTS stats_categories (
+                categorie TEXT PRIMARY KEY NOT NULL,
+                nb_produits INTEGER NOT NULL DEFAULT 0,
+                ruptures INTEGER NOT NULL DEFAULT 0,
+                stock_faible INTEGER NOT NULL DEFAULT 0,
+                stock_total INTEGER NOT NULL DEFAULT 0,
+                valeur_stock REAL NOT NULL DEFAULT 0
+            )''',
+            '''CREATE TRIGGER IF NOT EXISTS trg_stats_produits_insert AFTER INSERT ON produits
+            BEGIN
+                INSERT INTO stats_categories (categorie, nb_produits, ruptures, stock_faible, stock_total, valeur_stock)
+                VALUES (COALESCE(NEW.categorie, ''), 1, NEW.stock = 0, NEW.stock > 0 AND NEW.stock <= 5,
+                        NEW.stock, NEW.stock * NEW.prix)
+                ON CONFLICT (categorie) DO UPDATE SET
+                    nb_produits = nb_produits + excluded.nb_produits,
+                    ruptures = ruptures + excluded.ruptures,
+                    stock_faible = stock_faible + excluded.stock_faible,
+                    stock_total = stock_total + excluded.stock_total,
+                    valeur_stock = valeur_stock + excluded.valeur_stock;
+            END''',
+            '''CREATE TRIGGER IF NOT EXISTS trg_stats_produits_update AFTER UPDATE OF stock, prix, categorie ON produits
+            BEGIN
+                INSERT INTO stats_categories (categorie, nb_produits, ruptures, stock_faible, stock_total, valeur_stock)
+                VALUES (COALESCE(OLD.categorie, ''), -1, -(OLD.stock = 0), -(OLD.stock > 0 AND OLD.stock <= 5),
+                        -OLD.stock, -(OLD.stock * OLD.prix))
+                ON CONFLICT (categorie) DO UPDATE SET
+                    nb_produits = nb_produits + excluded.nb_produits,
+                    ruptures = ruptures + excluded.ruptures,
+                    stock_faible = stock_faible + excluded.stock_faible,
+                    stock_total = stock_total + excluded.stock_total,
+                    valeur_stock = valeur_stock + excluded.valeur_stock;
+                INSERT INTO stats_categories (categorie, nb_produits, ruptures, stock_faible, stock_total, valeur_stock)
+                VALUES (COALESCE(NEW.categorie, ''), 1, NEW.stock = 0, NEW.stock > 0 AND NEW.stock <= 5,
+                        NEW.stock, NEW.stock * NEW.prix)
+                ON CONFLICT (categorie) DO UPDATE SET
+                    nb_produits = nb_produits + excluded.nb_produits,
+                    ruptures = ruptures + excluded.ruptures,
+                    stock_faible = stock_faible + excluded.stock_faible,
+                    stock_total = stock_total + excluded.stock_total,
+                    valeur_stock = valeur_stock + excluded.valeur_stock;
+                DELETE FROM stats_categories WHERE nb_produits <= 0;
+            END''',
+            '''CREATE TRIGGER IF NOT EXISTS trg_stats_produits_delete AFTER DELETE ON produits
+            BEGIN
+                UPDATE stats_categories SET
+                    nb_produits = nb_produits - 1,
+                    ruptures = ruptures - (OLD.stock = 0),
+                    stock_faible = stock_faible - (OLD.stock > 0 AND OLD.stock <= 5),
+                    stock_total = stock_total - OLD.stock,
+                    valeur_stock = valeur_stock - OLD.stock * OLD.prix
+                WHERE categorie = COALESCE(OLD.categorie, '');
+                DELETE FROM stats_categories WHERE nb_produits <= 0;
+            END''',
+            *RECONSTRUCTION_STATS,
+        ],
+    }),
+    (4, 'Index (colonne de tri, id) pour la pagination par curseur', {
+        # PostgreSQL : un index (colonne, id) sert directement ORDER BY colonne, id
+        # et la comparaison (colonne, id) > (?, ?) ; il rend l'index simple inutile.
+        'postgres': [
+            'CREATE INDEX IF NOT EXISTS idx_produits_nom_id ON produits (nom, id)',
+            'CREATE INDEX IF NOT EXISTS idx_produits_prix_id ON produits (prix, id)',
+            'CREATE INDEX IF NOT EXISTS idx_produits_stock_id ON produits (stock, id)',
+            'CREATE INDEX IF NOT EXISTS idx_produits_categorie_id ON produits (categorie, id)',
+            'CREATE INDEX IF NOT EXISTS idx_produits_date_creation_id ON produits (date_creation, id)',
+            'DROP INDEX IF EXISTS idx_produits_nom',
+            'DROP INDEX IF EXISTS idx_produits_prix',
+            'DROP INDEX IF EXISTS idx_produits_stock',
+            'DROP INDEX IF EXISTS idx_produits_date_creation',
+        ],
+        # SQLite : chaque index contient déjà le rowid (= id) ; seul le tri par
+        # catégorie (sans nom) n'a pas d'index dans le bon ordre.
+        'sqlite': [
+            'CREATE INDEX IF NOT EXISTS idx_produits_categorie_id ON produits (categorie, id)',
+        ],
+    }),
+    (5, 'Recherche plein texte (FTS5 / tsvector + pg_trgm)', {
+        'postgres': [creer_recherche_postgres],
+        'sqlite': [creer_recherche_sqlite],
+    }),
+    (6, 'Numéros de version du catalogue (invalidation des caches entre workers)', {
+        'postgres': [
+            '''CREATE TABLE IF NOT EXISTS versions_catalogue (
+                nom TEXT PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0
+            )''',
+            "INSERT INTO versions_catalogue (nom, version) VALUES ('categories', 1) ON CONFLICT (nom) DO NOTHING",
+            '''CREATE OR REPLACE FUNCTION incrementer_version_catalogue() RETURNS trigger AS $$
+            BEGIN
+                UPDATE versions_catalogue SET version = version + 1 WHERE nom = TG_ARGV[0];
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql''',
+            'DROP TRIGGER IF EXISTS trg_version_categories ON categories',
+            '''CREATE TRIGGER trg_version_categories
+                AFTER INSERT OR UPDATE OR DELETE ON categories
+                FOR EACH STATEMENT EXECUTE PROCEDURE incrementer_version_catalogue('categories')''',
+        ],
+        'sqlite': [
+            '''CREATE TABLE IF NOT EXISTS versions_catalogue (
+                nom TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )''',
+            "INSERT OR IGNORE INTO versions_catalogue (nom, version) VALUES ('categories', 1)",
+            '''CREATE TRIGGER IF NOT EXISTS trg_version_categories_insert AFTER INSERT ON categories BEGIN
+                UPDATE versions_catalogue SET version = version + 1 WHERE nom = 'categories';
+            END''',
+            '''CREATE TRIGGER IF NOT EXISTS trg_version_categories_update AFTER UPDATE ON categories BEGIN
+                UPDATE versions_catalogue SET version = version + 1 WHERE nom = 'categories';
+            END''',
+            '''CREATE TRIGGER IF NOT EXISTS trg_version_categories_delete AFTER DELETE ON categories BEGIN
+                UPDATE versions_catalogue SET version = version + 1 WHERE nom = 'categories';
+            END''',
+        ],
+    }),
+    (7, 'Version et date de modification des produits (ETag / Last-Modified)', {
+        'postgres': [
+            'ALTER TABLE versions_catalogue ADD COLUMN IF NOT EXISTS modifie_le TIMESTAMP',
+            "INSERT INTO versions_catalogue (nom, version, modifie_le) VALUES ('produits', 1, now() AT TIME ZONE 'utc') ON CONFLICT (nom) DO NOTHING",
+            '''CREATE OR REPLACE FUNCTION incrementer_version_catalogue() RETURNS trigger AS $$
+            BEGIN
+                UPDATE versions_catalogue SET version = version + 1, modifie_le = now() AT TIME ZONE 'utc'
+                WHERE nom = TG_ARGV[0];
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql''',
+            'DROP TRIGGER IF EXISTS trg_version_produits ON produits',
+            '''CREATE TRIGGER trg_version_produits
+                AFTER INSERT OR UPDATE OR DELETE ON produits
+                FOR EACH STATEMENT EXECUTE PROCEDURE incrementer_version_catalogue('produits')''',
+        ],
+        'sqlite': [
+            'ALTER TABLE versions_catalogue ADD COLUMN modifie_le TIMESTAMP',
+            "INSERT OR IGNORE INTO versions_catalogue (nom, version, modifie_le) VALUES ('produits', 1, CURRENT_TIMESTAMP)",
+            '''CREATE TRIGGER IF NOT EXISTS trg_version_produits_insert AFTER INSERT ON produits BEGIN
+                UPDATE versions_catalogue SET version = version + 1, modifie_le = CURRENT_TIMESTAMP WHERE nom = 'produits';
+            END''',
+            '''CREATE TRIGGER IF NOT EXISTS trg_version_produits_update AFTER UPDATE ON produits BEGIN
+                UPDATE versions_catalogue SET version = version + 1, modifie_le = CURRENT_TIMESTAMP WHERE nom = 'produits';
+            END''',
+            '''CREATE TRIGGER IF NOT EXISTS trg_version_produits_delete AFTER DELETE ON produits BEGIN
+                UPDATE versions_catalogue SET version = version + 1, modifie_le = CURRENT_TIMESTAMP WHERE nom = 'produits';
+            END''',
+        ],
+    }),
+    # Journal des mouvements de stock (ajout seul) et son compactage par jour.
+    # Sur PostgreSQL, un index BRIN suffit pour les accès par date d'une table
+    # remplie dans l'ordre chronologique, pour une fraction de la taille d'un B-tree.
+    (8, 'Journal des mouvements de stock et stock journalier', {
+        'postgres': [
+            '''CREATE TABLE IF NOT EXISTS stock_mouvements (
+                id BIGSERIAL PRIMARY KEY,
+                produit_id INTEGER NOT NULL,
+                delta INTEGER NOT NULL,
+                stock_apres INTEGER NOT NULL,
+                action TEXT NOT NULL,
+                source TEXT,
+                appareil TEXT,
+                date_mouvement TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+            )''',
+            'CREATE INDEX IF NOT EXISTS idx_mouvements_produit_date ON stock_mouvements (produit_id, date_mouvement, id)',
+            'CREATE INDEX IF NOT EXISTS idx_mouvements_date ON stock_mouvements USING brin (date_mouvement)',
+            '''CREATE TABLE IF NOT EXISTS stock_journalier (
+                produit_id INTEGER NOT NULL,
+                jour DATE NOT NULL,
+                stock_fin INTEGER NOT NULL,
+                variation INTEGER NOT NULL,
+                nb_mouvements INTEGER NOT NULL,
+                PRIMARY KEY (produit_id, jour)
+            )''',
+            'CREATE INDEX IF NOT EXISTS idx_journalier_jour ON stock_journalier (jour)',
+        ],
+        'sqlite': [
+            '''CREATE TABLE IF NOT EXISTS stock_mouvements (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                produit_id INTEGER NOT NULL,
+                delta INTEGER NOT NULL,
+                stock_apres INTEGER NOT NULL,
+                action TEXT NOT NULL,
+                source TEXT,
+                appareil TEXT,
+                date_mouvement TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )''',
+            'CREATE INDEX IF NOT EXISTS idx_mouvements_produit_date ON stock_mouvements (produit_id, date_mouvement, id)',
+            'CREATE INDEX IF NOT EXISTS idx_mouvements_date ON stock_mouvements (date_mouvement)',
+            '''CREATE TABLE IF NOT EXISTS stock_journalier (
+                produit_id INTEGER NOT NULL,
+                jour DATE NOT NULL,
+                stock_fin INTEGER NOT NULL,
+                variation INTEGER NOT NULL,
+                nb_mouvements INTEGER NOT NULL,
+                PRIMARY KEY (produit_id, jour)
+            )''',
+            'CREATE INDEX IF NOT EXISTS idx_journalier_jour ON stock_journalier (jour)',
+        ],
+    }),
+    # File d'événements diffusés en direct (/events) : partagée par tous les
+    # workers, l'id croissant sert de Last-Event-ID pour la reprise.
+    (9, "File d'événements temps réel", {
+        'postgres': [
+            '''CREATE TABLE IF NOT EXISTS evenements (
+                id BIGSERIAL PRIMARY KEY,
+                type TEXT NOT NULL,
+                donnees TEXT NOT NULL,
+                date_evenement TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+            )''',
+            'CREATE INDEX IF NOT EXISTS idx_evenements_date ON evenements USING brin (date_evenement)',
+        ],
+        'sqlite': [
+            '''CREATE TABLE IF NOT EXISTS evenements (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                type TEXT NOT NULL,
+                donnees TEXT NOT NULL,
+                date_evenement TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )''',
+            'CREATE INDEX IF NOT EXISTS idx_evenements_date ON evenements (date_evenement)',
+        ],
+    }),
+    # Tri par catégorie / date sur l'expression sans NULL de paginer() : les
+    # index (colonne, id) de la version 4 ne servaient pas ces tris.
+    (10, 'Index de tri sans NULL pour la pagination par curseur', {
+        'postgres': [
+            'DROP INDEX IF EXISTS idx_produits_categorie_id',
+            'DROP INDEX IF EXISTS idx_produits_date_creation_id',
+            INDEX_TRI_CATEGORIE,
+            INDEX_TRI_DATE,
+        ],
+        'sqlite': [
+            'DROP INDEX IF EXISTS idx_produits_categorie_id',
+            INDEX_TRI_CATEGORIE,
+            INDEX_TRI_DATE,
+        ],
+    }),
+    # PostgreSQL : le trigger par instruction verrouillait la ligne 'produits' de
+    # versions_catalogue jusqu'à la fin de chaque transaction d'écriture, ce qui
+    # sérialisait toutes les écritures. La version est désormais tirée d'une
+    # séquence, et changée au commit (migration 12).
+    (11, "Version des produits changée hors de la transaction d'écriture (PostgreSQL)", {
+        'postgres': [
+            'DROP TRIGGER IF EXISTS trg_version_produits ON produits',
+            'CREATE SEQUENCE IF NOT EXISTS seq_version_produits',
+            "SELECT setval('seq_version_produits', GREATEST((SELECT MAX(version) FROM versions_catalogue WHERE nom = 'produits'), 1))",
+        ],
+        'sqlite': [],
+    }),
+    # PostgreSQL : la version est de nouveau changée dans la transaction d'écriture,
+    # y compris pour les écritures faites hors de l'application, mais au moment du
+    # commit (trigger de contrainte différé) : le verrou de la ligne 'produits' n'est
+    # tenu que pendant la validation, et la nouvelle version devient visible en même
+    # temps que l'écriture. Une seule mise à jour par transaction, quel que soit le
+    # nombre de lignes écrites (drapeau local à la transaction).
+    (12, 'Version des produits changée au commit de chaque écriture (PostgreSQL)', {
+        'postgres': [
+            '''CREATE OR REPLACE FUNCTION changer_version_produits() RETURNS trigger AS $$
+            BEGIN
+                IF current_setting('boutique.version_produits_changee', true) IS DISTINCT FROM 'oui' THEN
+                    PERFORM set_config('boutique.version_produits_changee', 'oui', true);
+                    UPDATE versions_catalogue
+                    SET version = nextval('seq_version_produits'), modifie_le = now() AT TIME ZONE 'utc'
+                    WHERE nom = 'produits';
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql''',
+            'DROP TRIGGER IF EXISTS trg_version_produits_commit ON produits',
+            '''CREATE CONSTRAINT TRIGGER trg_version_produits_commit
+                AFTER INSERT OR UPDATE OR DELETE ON produits
+                DEFERRABLE INITIALLY DEFERRED
+                FOR EACH ROW EXECUTE PROCEDURE changer_version_produits()''',
+        ],
+        'sqlite': [],
+    }),
+    # Les produits créés avant le journal (migration 8) n'avaient aucun historique
+    (13, "Mouvement d'ouverture des produits sans historique de stock", [OUVERTURE_MOUVEMENTS]),
+    # Le compactage suivait une date (lendemain du dernier jour résumé) : un
+    # mouvement validé après coup avec une date antérieure n'était jamais résumé,
+    # puis purgé. Chaque mouvement porte désormais son état de compactage ; ceux
+    # d'avant le dernier jour résumé l'ont déjà été.
+    (14, 'Mouvements marqués une fois compactés', {
+        'postgres': [
+            'ALTER TABLE stock_mouvements ADD COLUMN IF NOT EXISTS compacte BOOLEAN NOT NULL DEFAULT FALSE',
+            '''UPDATE stock_mouvements SET compacte = TRUE
+               WHERE date_mouvement < (SELECT MAX(jour) + 1 FROM stock_journalier)''',
+            'CREATE INDEX IF NOT EXISTS idx_mouvements_a_compacter ON stock_mouvements (date_mouvement) WHERE NOT compacte',
+        ],
+        'sqlite': [
+            'ALTER TABLE stock_mouvements ADD COLUMN compacte BOOLEAN NOT NULL DEFAULT FALSE',
+            '''UPDATE stock_mouvements SET compacte = TRUE
+               WHERE date_mouvement < (SELECT DATE(MAX(jour), '+1 day') FROM stock_journalier)''',
+            'CREATE INDEX IF NOT EXISTS idx_mouvements_a_compacter ON stock_mouvements (date_mouvement) WHERE NOT compacte',
+        ],
+    }),
+]
+
+
+def get_schema_version(cursor):
+    """Version du schéma appliquée (0 si aucune migration)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            date_application TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('SELECT MAX(version) FROM schema_version')
+    return cursor.fetchone()[0] or 0
+
+def appliquer_migrations(conn):
+    """Applique les migrations en attente dans une seule transaction
+
+    Plusieurs workers gunicorn démarrent en même temps : le verrou (advisory lock
+    PostgreSQL, BEGIN IMMEDIATE SQLite) garantit qu'un seul applique les étapes.
+    Retourne la liste des versions appliquées.
+    """
+    cursor = conn.cursor()
+    if USE_POSTGRES:
+        cursor.execute('SELECT pg_advisory_xact_lock(580159)')
+    else:
+        cursor.execute('BEGIN IMMEDIATE')
+    
+    try:
+        version_actuelle = get_schema_version(cursor)
+        appliquees = []
+        for version, description, etapes in MIGRATIONS:
+            if version <= version_actuelle:
+                continue
+            if isinstance(etapes, dict):
+                etapes = etapes['postgres' if USE_POSTGRES else 'sqlite']
+            for sql in etapes:
+                if callable(sql):
+                    sql(cursor)
+                else:
+                    cursor.execute(sql)
+            cursor.execute(adapt_query('INSERT INTO schema_version (version, description) VALUES (?, ?)'),
+                           (version, description))
+            appliquees.append(version)
+        conn.commit()
+        return appliquees
+    except Exception:
+        conn.rollback()
+        raise
+
+def reconstruire_stats(conn):
+    """Recalcule stats_categories depuis produits (après un import direct en base par ex.)"""
+    cursor = conn.cursor()
+    if not USE_POSTGRES:
+        cursor.execute('BEGIN IMMEDIATE')
+    try:
+        for sql in RECONSTRUCTION_STATS:
+            cursor.execute(sql)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def init_database():
+    """Initialise la base de données (PostgreSQL ou SQLite)"""
+    conn = get_db_connection()
+    appliquer_migrations(conn)
+    cursor = conn.cursor()
+    
+    if USE_POSTGRES:
+        placeholder = '%s'
+        insert_ignore = 'INSERT INTO categories (emoji, nom, description) VALUES (%s, %s, %s) ON CONFLICT (nom) DO NOTHING'
+    else:
         placeholder = '?'
         insert_ignore = 'INSERT OR IGNORE INTO categories (emoji, nom, description) VALUES (?, ?, ?)'
     
@@ -117,15 +1314,15 @@ def init_database():
     
     if count_categories == 0:
         default_categories = [
-            ('\ud83d\udcf1', 'Screen', 'Screens and touch panels'),
-            ('\ud83d\udd0b', 'Battery', 'Batteries and accumulators'),
-            ('\ud83d\udee1\ufe0f', 'Case', 'Protective cases and covers'),
-            ('\ud83d\udd0d', 'Accessory', 'Various accessories'),
-            ('\ud83d\udd0c', 'Cable', 'Cables and chargers'),
-            ('\ud83d\udd27', 'Tool', 'Repair tools'),
-            ('\ud83d\udcbe', 'Component', 'Electronic components'),
-            ('\ud83c\udfa7', 'Audio', 'Earphones and speakers'),
-            ('\ud83d\udce6', 'Other', 'Other products')
+            ('📱', 'Screen', 'Screens and touch panels'),
+            ('🔋', 'Battery', 'Batteries and accumulators'),
+            ('🛡️', 'Case', 'Protective cases and covers'),
+            ('🔍', 'Accessory', 'Various accessories'),
+            ('🔌', 'Cable', 'Cables and chargers'),
+            ('🔧', 'Tool', 'Repair tools'),
+            ('💾', 'Component', 'Electronic components'),
+            ('🎧', 'Audio', 'Earphones and speakers'),
+            ('📦', 'Other', 'Other products')
         ]
         
         for emoji, name, desc in default_categories:
@@ -157,6 +1354,7 @@ def init_database():
                 cursor.execute(insert_produit, (nom, code, prix, stock, cat))
             except:
                 pass
+        cursor.execute(OUVERTURE_MOUVEMENTS)
     
     conn.commit()
     conn.close()
@@ -167,6 +1365,17 @@ def adapt_query(query):
         return query.replace('?', '%s')
     return query
 
+def tranches_in(valeurs, taille=500):
+    """Découpe des valeurs pour des IN (...) : SQLite avant 3.32 limite une requête à 999 paramètres
+    
+    Sur PostgreSQL, une seule tranche (pas de telle limite, et l'ordre des verrous est conservé).
+    """
+    if USE_POSTGRES:
+        yield valeurs
+        return
+    for debut in range(0, len(valeurs), taille):
+        yield valeurs[debut:debut + taille]
+
 def row_to_dict(row):
     """Convertit une ligne de résultat en dictionnaire (compatible PostgreSQL et SQLite)"""
     if USE_POSTGRES:
@@ -185,83 +1394,416 @@ def rows_to_list(rows):
         # SQLite avec row_factory = sqlite3.Row
         return [dict(row) for row in rows]
 
+# Cache des catégories (par worker), associé au numéro de version 'categories'
+# de versions_catalogue. Toute écriture sur categories incrémente ce numéro
+# (trigger) : les autres workers le relisent au plus toutes les
+# CACHE_CATEGORIES_VERIFICATION secondes et rechargent la liste s'il a changé.
+CACHE_CATEGORIES_VERIFICATION = float(os.environ.get('CACHE_CATEGORIES_VERIFICATION', '2'))
+_cache_categories = {'version': None, 'categories': [], 'verifie_le': 0.0}
+_cache_categories_verrou = threading.Lock()
+
+def get_version_catalogue(nom):
+    """Numéro de version courant d'une partie du catalogue ('categories', ...)"""
+    cursor = get_db().cursor()
+    cursor.execute(adapt_query('SELECT version FROM versions_catalogue WHERE nom = ?'), (nom,))
+    ligne = cursor.fetchone()
+    return ligne[0] if ligne else 0
+
+def get_etat_catalogue(nom):
+    """(version, date de modification UTC ou None) d'une partie du catalogue"""
+    cursor = get_db().cursor()
+    cursor.execute(adapt_query('SELECT version, modifie_le FROM versions_catalogue WHERE nom = ?'), (nom,))
+    ligne = cursor.fetchone()
+    if not ligne:
+        return 0, None
+    version, modifie_le = ligne[0], ligne[1]
+    if isinstance(modifie_le, str):
+        modifie_le = datetime.strptime(modifie_le[:19], '%Y-%m-%d %H:%M:%S')
+    return version, modifie_le
+
+def invalider_cache_categories():
+    """Force le rechargement des catégories au prochain appel (écriture locale)"""
+    with _cache_categories_verrou:
+        _cache_categories['version'] = None
+
 def get_categories():
-    """Récupérer toutes les catégories"""
+    """Récupérer toutes les catégories (cache versionné)"""
     try:
-        conn = get_db_connection()
-        if USE_POSTGRES:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-        else:
-            cursor = conn.cursor()
+        maintenant = time.monotonic()
+        with _cache_categories_verrou:
+            if (_cache_categories['version'] is not None
+                    and maintenant - _cache_categories['verifie_le'] < CACHE_CATEGORIES_VERIFICATION):
+                return _cache_categories['categories']
+            version_cache = _cache_categories['version']
+        
+        version = get_version_catalogue('categories')
+        if version == version_cache:
+            with _cache_categories_verrou:
+                _cache_categories['verifie_le'] = maintenant
+            return _cache_categories['categories']
+        
+        conn = get_db()
+        cursor = get_cursor(conn)
         cursor.execute('SELECT * FROM categories ORDER BY nom')
-        categories = cursor.fetchall()
-        conn.close()
-        return rows_to_list(categories)
+        categories = rows_to_list(cursor.fetchall())
+        with _cache_categories_verrou:
+            _cache_categories.update(version=version, categories=categories, verifie_le=maintenant)
+        return categories
     except Exception as e:
+        annuler_transaction()
         return []
 
 def get_all_products():
     """Récupérer tous les produits pour la gestion du stock"""
     try:
-        conn = get_db_connection()
-        if USE_POSTGRES:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-        else:
-            cursor = conn.cursor()
+        conn = get_db()
+        cursor = get_cursor(conn)
         cursor.execute('SELECT * FROM produits ORDER BY nom')
         produits = cursor.fetchall()
-        conn.close()
         return rows_to_list(produits)
     except Exception as e:
+        annuler_transaction()
         return []
 
+@dataclass
+class StatsInventaire:
+    """Indicateurs du tableau de bord (accueil, produits, statistiques, API)"""
+    total_produits: int = 0
+    ruptures: int = 0
+    stock_faible: int = 0
+    valeur_stock: float = 0.0
+    top_categories: list = field(default_factory=list)
+    par_categorie: dict = field(default_factory=dict)
+
+    def to_dict(self):
+        return {
+            'total_produits': self.total_produits,
+            'ruptures': self.ruptures,
+            'stock_faible': self.stock_faible,
+            'valeur_stock': self.valeur_stock,
+            'top_categories': self.top_categories
+        }
+
+def calculer_stats(nb_top_categories=5):
+    """Statistiques du tableau de bord lues dans les compteurs stats_categories
+
+    Les compteurs sont tenus à jour par triggers dans la transaction de chaque
+    écriture sur produits : une lecture de quelques lignes (une par catégorie)
+    quelle que soit la taille du catalogue. Les totaux globaux sont la somme
+    des lignes par catégorie.
+    """
+    cursor = get_cursor(get_db())
+    cursor.execute('''
+        SELECT categorie,
+               nb_produits AS count,
+               stock_total,
+               ruptures,
+               stock_faible,
+               valeur_stock AS valeur
+        FROM stats_categories
+    ''')
+    lignes = cursor.fetchall()
+    
+    stats = StatsInventaire()
+    valeur = 0
+    for ligne in lignes:
+        stats.total_produits += ligne['count']
+        stats.ruptures += ligne['ruptures']
+        stats.stock_faible += ligne['stock_faible']
+        valeur += ligne['valeur']
+        stats.par_categorie[ligne['categorie']] = ligne['count']
+    stats.valeur_stock = round(valeur, 2)
+    
+    lignes = sorted(lignes, key=lambda ligne: ligne['count'], reverse=True)
+    stats.top_categories = [
+        {'categorie': ligne['categorie'], 'count': ligne['count'], 'stock_total': ligne['stock_total']}
+        for ligne in lignes[:nb_top_categories]
+    ]
+    return stats
+
+# Pagination par curseur (keyset) : la page suivante reprend après le dernier
+# couple (colonne de tri, id) affiché, sans OFFSET ni comptage du total.
+# tri -> (colonne, valeur remplaçant NULL ou None si la colonne est NOT NULL, type PostgreSQL)
+COLONNES_TRI = {
+    'nom': ('nom', None, 'text'),
+    'prix': ('prix', None, 'real'),
+    'stock': ('stock', None, 'integer'),
+    'categorie': ('categorie', '', 'text'),
+    'date': ('date_creation', '1970-01-01 00:00:00', 'timestamp')
+}
+PAGE_TAILLE_DEFAUT = int(os.environ.get('PAGE_TAILLE_DEFAUT', '50'))
+PAGE_TAILLE_MAX = int(os.environ.get('PAGE_TAILLE_MAX', '500'))
+
+def encoder_curseur(valeur, id):
+    """Jeton opaque (base64 URL) pour la position (valeur de tri, id)"""
+    brut = json.dumps([valeur, id], default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(brut.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decoder_curseur(jeton):
+    """Décode un jeton de curseur, ValueError s'il est invalide"""
+    try:
+        brut = base64.urlsafe_b64decode(jeton + '=' * (-len(jeton) % 4))
+        valeur, id = json.loads(brut)
+        return valeur, int(id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def get_taille_page(defaut=PAGE_TAILLE_DEFAUT):
+    """Taille de page demandée (?limit=), bornée à PAGE_TAILLE_MAX"""
+    try:
+        limite = int(request.args.get('limit', defaut))
+    except ValueError:
+        limite = defaut
+    return max(1, min(limite, PAGE_TAILLE_MAX))
+
+def paginer(cursor, query, params, tri, ordre, limite, jeton=None):
+    """Exécute `query` (SELECT ... WHERE ...) page par page
+
+    Trie par (colonne, id) pour que l'ordre soit total, reprend après le jeton
+    fourni et lit une ligne de plus que la page pour savoir s'il y a une suite.
+    Une colonne nullable est triée sur COALESCE (une comparaison avec NULL n'est
+    jamais vraie) ; sur PostgreSQL la valeur du jeton est convertie au type de
+    la colonne (un prix REAL comparé en float8 répéterait des lignes).
+    Retourne (produits, jeton_suivant ou None).
+    """
+    colonne, defaut, type_pg = COLONNES_TRI.get(tri, COLONNES_TRI['nom'])
+    expression = colonne if defaut is None else f"COALESCE({colonne}, '{defaut}')"
+    ordre_sql = 'DESC' if ordre == 'desc' else 'ASC'
+    params = list(params)
+    
+    if jeton:
+        valeur, dernier_id = decoder_curseur(jeton)
+        comparaison = '<' if ordre_sql == 'DESC' else '>'
+        marque = f'?::{type_pg}' if USE_POSTGRES else '?'
+        query += f' AND ({expression}, id) {comparaison} ({marque}, ?)'
+        params.extend([valeur, dernier_id])
+    
+    query += f' ORDER BY {expression} {ordre_sql}, id {ordre_sql} LIMIT ?'
+    params.append(limite + 1)
+    
+    cursor.execute(adapt_query(query), params)
+    produits = rows_to_list(cursor.fetchall())
+    
+    jeton_suivant = None
+    if len(produits) > limite:
+        produits = produits[:limite]
+        dernier = produits[-1]
+        valeur = dernier[colonne] if dernier[colonne] is not None else defaut
+        jeton_suivant = encoder_curseur(valeur, dernier['id'])
+    return produits, jeton_suivant
+
+def get_version_produits():
+    """Version des produits, lue au plus une fois par requête"""
+    if g.get('version_produits') is None:
+        g.version_produits = get_version_catalogue('produits')
+    return g.version_produits
+
+def produit_en_cache(code_barres):
+    """(trouve, produit ou None) depuis le cache du scanner
+
+    Une entrée mise en cache sous une autre version des produits est ignorée
+    quand cette version est déjà connue (g.version_produits, routes
+    conditionnelles). Un code inconnu est toujours revérifié contre la version
+    courante : le produit a pu être créé depuis par un autre worker.
+    """
+    trouve, entree = cache_produits.get(code_barres)
+    if not trouve:
+        return False, None
+    version_entree, produit = entree
+    version = get_version_produits() if produit is None else g.get('version_produits')
+    if version is not None and version_entree != version:
+        cache_produits.invalider(code_barres)
+        return False, None
+    return True, produit
+
+def trouver_produit_par_code(code_barres):
+    """Produit (dict) ayant ce code-barres ou None, via le cache du scanner"""
+    trouve, produit = produit_en_cache(code_barres)
+    if trouve:
+        return produit
+    # Version lue avant le produit : une écriture concurrente invalide l'entrée
+    version = get_version_produits()
+    cursor = get_cursor(get_db())
+    cursor.execute(adapt_query('SELECT * FROM produits WHERE code_barres = ?'), (code_barres,))
+    ligne = cursor.fetchone()
+    produit = row_to_dict(ligne) if ligne else None
+    cache_produits.set(code_barres, (version, produit), negatif=produit is None)
+    return produit
+
+# Recherche produits : index plein texte (FTS5 sur SQLite, tsvector + trigrammes
+# sur PostgreSQL), insensible à la casse et aux accents ("ecran" trouve "Écran"),
+# chaque mot étant traité comme un préfixe. Sans index, repli sur LIKE.
+_recherche_plein_texte = None
+
+def recherche_plein_texte_disponible():
+    """Vrai si l'index de recherche a été créé par la migration 5 (résultat mis en cache)"""
+    global _recherche_plein_texte
+    if _recherche_plein_texte is None:
+        cursor = get_db().cursor()
+        if USE_POSTGRES:
+            cursor.execute("SELECT COUNT(*) FROM pg_proc WHERE proname = 'f_unaccent'")
+        else:
+            cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'produits_fts'")
+        _recherche_plein_texte = cursor.fetchone()[0] > 0
+    return _recherche_plein_texte
+
+def normaliser_recherche(texte):
+    """Mots de la recherche en minuscules, sans accents ni ponctuation"""
+    texte = unicodedata.normalize('NFKD', texte.lower())
+    texte = ''.join(c for c in texte if not unicodedata.combining(c))
+    return re.findall(r'\w+', texte)
+
+def filtre_recherche(recherche):
+    """Fragment WHERE (' AND ...') et paramètres filtrant les produits sur la recherche"""
+    mots = normaliser_recherche(recherche)
+    if not mots:
+        return '', []
+    
+    if recherche_plein_texte_disponible():
+        if USE_POSTGRES:
+            return (" AND (to_tsvector('simple', f_unaccent(nom || ' ' || code_barres))"
+                    " @@ to_tsquery('simple', ?) OR f_unaccent(lower(nom)) LIKE ?)",
+                    [' & '.join(f'{mot}:*' for mot in mots), f'%{" ".join(mots)}%'])
+        return (' AND id IN (SELECT rowid FROM produits_fts WHERE produits_fts MATCH ?)',
+                [' '.join(f'"{mot}"*' for mot in mots)])
+    
+    return ' AND (lower(nom) LIKE ? OR code_barres LIKE ?)', [f'%{recherche.lower()}%', f'%{recherche}%']
+
+def rechercher_produits(recherche, categorie='', limite=12):
+    """Produits correspondant à la recherche, les plus pertinents d'abord"""
+    mots = normaliser_recherche(recherche)
+    cursor = get_cursor(get_db())
+    
+    if mots and recherche_plein_texte_disponible():
+        if USE_POSTGRES:
+            tsquery = ' & '.join(f'{mot}:*' for mot in mots)
+            texte = ' '.join(mots)
+            query = '''
+                SELECT * FROM produits
+                WHERE (to_tsvector('simple', f_unaccent(nom || ' ' || code_barres))
+                       @@ to_tsquery('simple', %s) OR f_unaccent(lower(nom)) LIKE %s)
+            '''
+            params = [tsquery, f'%{texte}%']
+            if categorie:
+                query += ' AND categorie = %s'
+                params.append(categorie)
+            query += '''
+                ORDER BY ts_rank(to_tsvector('simple', f_unaccent(nom || ' ' || code_barres)),
+                                 to_tsquery('simple', %s))
+                         + similarity(f_unaccent(lower(nom)), %s) DESC, nom
+                LIMIT %s
+            '''
+            params.extend([tsquery, texte, limite])
+        else:
+            match = ' '.join(f'"{mot}"*' for mot in mots)
+            if categorie:
+                query = '''
+                    SELECT p.* FROM produits_fts f JOIN produits p ON p.id = f.rowid
+                    WHERE produits_fts MATCH ? AND p.categorie = ?
+                    ORDER BY f.rank LIMIT ?
+                '''
+                params = [match, categorie, limite]
+            else:
+                # ORDER BY rank LIMIT directement sur la table FTS : FTS5 ne trie
+                # que les meilleurs résultats au lieu de toutes les correspondances
+                query = '''
+                    SELECT p.* FROM (
+                        SELECT rowid, rank FROM produits_fts
+                        WHERE produits_fts MATCH ? ORDER BY rank LIMIT ?
+                    ) f JOIN produits p ON p.id = f.rowid
+                    ORDER BY f.rank
+                '''
+                params = [match, limite]
+    else:
+        clause, params = filtre_recherche(recherche)
+        query = 'SELECT * FROM produits WHERE 1=1' + clause
+        if categorie:
+            query += ' AND categorie = ?'
+            params.append(categorie)
+        query += ' ORDER BY nom LIMIT ?'
+        params.append(limite)
+        query = adapt_query(query)
+    
+    cursor.execute(query, params)
+    return rows_to_list(cursor.fetchall())
+
+# Réponses conditionnelles de l'API : l'ETag dérive du numéro de version des
+# produits (incrémenté par trigger à chaque écriture) et de l'URL demandée.
+# Si le client (ou un proxy) renvoie le même ETag, on répond 304 après une
+# seule lecture de versions_catalogue, sans toucher à la table produits.
+API_CACHE_MAX_AGE = int(os.environ.get('API_CACHE_MAX_AGE', '0'))
+
+def reponse_conditionnelle(vue):
+    """Décorateur : ETag / Last-Modified / Cache-Control et 304 pour une route dérivée des produits"""
+    @wraps(vue)
+    def enveloppe(*args, **kwargs):
+        try:
+            version, modifie_le = get_etat_catalogue('produits')
+        except Exception:
+            annuler_transaction()
+            return vue(*args, **kwargs)
+        g.version_produits = version
+        empreinte = hashlib.blake2s(request.full_path.encode('utf-8'), digest_size=6).hexdigest()
+        etag = f'p{version}-{empreinte}'
+        
+        non_modifie = False
+        if request.if_none_match:
+            non_modifie = request.if_none_match.contains(etag)
+        elif request.if_modified_since and modifie_le:
+            non_modifie = modifie_le.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+        
+        if non_modifie:
+            reponse = make_response('', 304)
+        else:
+            reponse = make_response(vue(*args, **kwargs))
+            if reponse.status_code != 200 or g.get('api_erreur'):
+                return reponse
+        
+        reponse.set_etag(etag)
+        if modifie_le:
+            reponse.last_modified = modifie_le
+        reponse.headers['Cache-Control'] = f'public, max-age={API_CACHE_MAX_AGE}, must-revalidate'
+        return reponse
+    return enveloppe
+
 @app.route('/')
 def index():
     """Page d'accueil avec recherche et aperÃ§u produits"""
     try:
-        conn = get_db_connection()
+        conn = get_db()
         cursor = get_cursor(conn)
         
         # ParamÃ¨tres de recherche
         recherche = request.args.get('q', '').strip()
         categorie = request.args.get('cat', '').strip()
         
-        # Construction de la requÃªte
-        query = 'SELECT * FROM produits WHERE 1=1'
-        params = []
-        
         if recherche:
-            query += ' AND (nom LIKE ? OR code_barres LIKE ?)'
-            params.extend([f'%{recherche}%', f'%{recherche}%'])
-        
-        if categorie:
-            query += ' AND categorie = ?'
-            params.append(categorie)
-        
-        query += ' ORDER BY nom LIMIT 12'
-        
-        query = adapt_query(query)
-        cursor.execute(query, params)
-        produits = cursor.fetchall()
+            # Recherche plein texte, résultats par pertinence
+            produits = rechercher_produits(recherche, categorie, limite=12)
+        else:
+            query = 'SELECT * FROM produits WHERE 1=1'
+            params = []
+            
+            if categorie:
+                query += ' AND categorie = ?'
+                params.append(categorie)
+            
+            query += ' ORDER BY nom LIMIT 12'
+            
+            query = adapt_query(query)
+            cursor.execute(query, params)
+            produits = rows_to_list(cursor.fetchall())
         
         # Stats rapides
-        cursor.execute('SELECT COUNT(*) as total FROM produits')
-        result = cursor.fetchone()
-        total = result['total'] if USE_POSTGRES else result[0]
-        
-        cursor.execute('SELECT COUNT(*) as ruptures FROM produits WHERE stock = 0')
-        result = cursor.fetchone()
-        ruptures = result['ruptures'] if USE_POSTGRES else result[0]
-        
-        conn.close()
+        stats = calculer_stats()
         
         return render_template('index.html', 
-                             produits=rows_to_list(produits),
+                             produits=produits,
                              categories=get_categories(),
                              recherche=recherche,
                              categorie_filtre=categorie,
-                             total=total,
-                             ruptures=ruptures)
+                             total=stats.total_produits,
+                             ruptures=stats.ruptures)
         
     except Exception as e:
         return render_template('error.html', error=str(e))
@@ -270,7 +1812,7 @@ def index():
 def voir_produits():
     """Page complÃ¨te des produits avec filtres avancÃ©s"""
     try:
-        conn = get_db_connection()
+        conn = get_db()
         cursor = get_cursor(conn)
         
         # ParamÃ¨tres de filtrage
@@ -287,8 +1829,9 @@ def voir_produits():
         params = []
         
         if recherche:
-            query += ' AND (nom LIKE ? OR code_barres LIKE ?)'
-            params.extend([f'%{recherche}%', f'%{recherche}%'])
+            clause, params_recherche = filtre_recherche(recherche)
+            query += clause
+            params.extend(params_recherche)
         
         if categorie:
             query += ' AND categorie = ?'
@@ -309,49 +1852,35 @@ def voir_produits():
             query += ' AND prix <= ?'
             params.append(float(prix_max))
         
-        # Tri
-        colonnes_tri = {
-            'nom': 'nom',
-            'prix': 'prix',
-            'stock': 'stock',
-            'categorie': 'categorie',
-            'date': 'date_creation'
-        }
-        
-        colonne_tri = colonnes_tri.get(tri, 'nom')
-        ordre_sql = 'DESC' if ordre == 'desc' else 'ASC'
-        query += f' ORDER BY {colonne_tri} {ordre_sql}'
-        
-        query = adapt_query(query)
-        cursor.execute(query, params)
-        produits = cursor.fetchall()
+        # Tri et pagination
+        curseur = request.args.get('curseur', '').strip()
+        produits, curseur_suivant = paginer(cursor, query, params, tri, ordre,
+                                            get_taille_page(), curseur)
         
         # Statistiques
-        cursor.execute('SELECT COUNT(*) as total FROM produits')
-        result = cursor.fetchone()
-        total = result['total'] if USE_POSTGRES else result[0]
-        
-        cursor.execute('SELECT COUNT(*) as ruptures FROM produits WHERE stock = 0')
-        result = cursor.fetchone()
-        ruptures = result['ruptures'] if USE_POSTGRES else result[0]
-        
-        cursor.execute('SELECT COUNT(*) as stock_faible FROM produits WHERE stock > 0 AND stock <= 5')
-        result = cursor.fetchone()
-        stock_faible = result['stock_faible'] if USE_POSTGRES else result[0]
-        
-        conn.close()
+        stats_inventaire = calculer_stats()
         
         stats = {
-            'total': total,
-            'ruptures': ruptures,
-            'stock_faible': stock_faible,
+            'total': stats_inventaire.total_produits,
+            'ruptures': stats_inventaire.ruptures,
+            'stock_faible': stats_inventaire.stock_faible,
+            'par_categorie': stats_inventaire.par_categorie,
             'resultats': len(produits)
         }
         
-        return render_template('products.html', 
-                             produits=rows_to_list(produits),
+        # Liens de pagination (mêmes filtres, curseur remplacé)
+        args_page = request.args.to_dict()
+        args_page.pop('curseur', None)
+        pagination = {
+            'suivante': url_for('voir_produits', curseur=curseur_suivant, **args_page) if curseur_suivant else None,
+            'premiere': url_for('voir_produits', **args_page) if curseur else None
+        }
+        
+        return render_template('products.html', 
+                             produits=produits,
                              categories=get_categories(),
                              stats=stats,
+                             pagination=pagination,
                              filtres={
                                  'recherche': recherche,
                                  'categorie': categorie,
@@ -385,16 +1914,20 @@ def ajouter_produit():
             if not code_barres:
                 code_barres = str(int(datetime.now().timestamp() * 1000))[-13:]
             
-            conn = get_db_connection()
+            conn = get_db()
             cursor = get_cursor(conn)
-            query = adapt_query('INSERT INTO produits (nom, code_barres, prix, stock, categorie) VALUES (?, ?, ?, ?, ?)')
+            query = adapt_query('INSERT INTO produits (nom, code_barres, prix, stock, categorie) VALUES (?, ?, ?, ?, ?) RETURNING id')
             cursor.execute(query, (nom, code_barres, prix, stock, categorie))
+            produit_id = cursor.fetchone()['id']
+            journaliser_mouvements(cursor, [(produit_id, stock, stock, 'creation')])
+            emettre_evenements(cursor, [('catalogue', {'action': 'ajout', 'id': produit_id, 'categorie': categorie})])
             conn.commit()
-            conn.close()
+            cache_produits.invalider(code_barres)
             
             return redirect(url_for('index'))
             
         except Exception as e:
+            annuler_transaction()
             return render_template('add_product.html', 
                                  categories=get_categories(),
                                  error=f"Error: {str(e)}")
@@ -413,35 +1946,47 @@ def modifier_produit(id):
             
             if not nom:
                 # Récupérer le produit pour réafficher le formulaire
-                conn = get_db_connection()
+                conn = get_db()
                 cursor = get_cursor(conn)
                 query = adapt_query('SELECT * FROM produits WHERE id = ?')
                 cursor.execute(query, (id,))
                 produit = cursor.fetchone()
-                conn.close()
                 
                 return render_template('edit_product.html', 
                                      produit=row_to_dict(produit),
                                      categories=get_categories(),
                                      error="Product name is required")
             
-            conn = get_db_connection()
+            conn = get_db()
             cursor = get_cursor(conn)
+            # Stock précédent lu sous verrou pour journaliser la variation
+            if USE_POSTGRES:
+                cursor.execute('SELECT stock, categorie FROM produits WHERE id = %s FOR UPDATE', (id,))
+            else:
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute('SELECT stock, categorie FROM produits WHERE id = ?', (id,))
+            avant = cursor.fetchone()
             query = adapt_query('UPDATE produits SET nom=?, prix=?, stock=?, categorie=? WHERE id=?')
             cursor.execute(query, (nom, prix, stock, categorie, id))
+            if avant:
+                journaliser_mouvements(cursor, [(id, stock - avant['stock'], stock, 'modification')])
+                evenement = {'action': 'modification', 'id': id, 'categorie': categorie}
+                if avant['categorie'] != categorie:
+                    evenement['ancienne_categorie'] = avant['categorie']
+                emettre_evenements(cursor, [('catalogue', evenement)])
             conn.commit()
-            conn.close()
+            cache_produits.invalider()
             
             return redirect(url_for('voir_produits'))
             
         except Exception as e:
             # Récupérer le produit pour réafficher le formulaire avec l'erreur
-            conn = get_db_connection()
+            annuler_transaction()
+            conn = get_db()
             cursor = get_cursor(conn)
             query = adapt_query('SELECT * FROM produits WHERE id = ?')
             cursor.execute(query, (id,))
             produit = cursor.fetchone()
-            conn.close()
             
             return render_template('edit_product.html', 
                                  produit=row_to_dict(produit),
@@ -450,12 +1995,11 @@ def modifier_produit(id):
     
     # GET - Afficher le formulaire
     try:
-        conn = get_db_connection()
+        conn = get_db()
         cursor = get_cursor(conn)
         query = adapt_query('SELECT * FROM produits WHERE id = ?')
         cursor.execute(query, (id,))
         produit = cursor.fetchone()
-        conn.close()
         
         if not produit:
             return render_template('error.html', error="Product not found")
@@ -471,14 +2015,19 @@ def modifier_produit(id):
 def supprimer_produit(id):
     """Supprimer un produit"""
     try:
-        conn = get_db_connection()
+        conn = get_db()
         cursor = get_cursor(conn)
-        query = adapt_query('DELETE FROM produits WHERE id = ?')
+        query = adapt_query('DELETE FROM produits WHERE id = ? RETURNING stock, categorie')
         cursor.execute(query, (id,))
+        supprime = cursor.fetchone()
+        if supprime:
+            journaliser_mouvements(cursor, [(id, -supprime['stock'], 0, 'suppression')], diffuser=False)
+            emettre_evenements(cursor, [('catalogue', {'action': 'suppression', 'id': id,
+                                                       'categorie': supprime['categorie']})])
         conn.commit()
-        conn.close()
+        cache_produits.invalider()
     except Exception as e:
-        pass
+        annuler_transaction()
     
     return redirect(url_for('voir_produits'))
 
@@ -501,12 +2050,11 @@ def scanner_simple():
 def afficher_code_barres(id):
     """Afficher le code-barres d'un produit"""
     try:
-        conn = get_db_connection()
+        conn = get_db()
         cursor = get_cursor(conn)
         query = adapt_query('SELECT * FROM produits WHERE id = ?')
         cursor.execute(query, (id,))
         produit = cursor.fetchone()
-        conn.close()
         
         if not produit:
             return render_template('error.html', error="Product not found")
@@ -521,7 +2069,7 @@ def imprimer_codes_barres():
     try:
         categorie = request.args.get('categorie', '')
         
-        conn = get_db_connection()
+        conn = get_db()
         cursor = get_cursor(conn)
         
         if categorie:
@@ -531,7 +2079,6 @@ def imprimer_codes_barres():
             cursor.execute('SELECT * FROM produits ORDER BY categorie, nom')
         
         produits = cursor.fetchall()
-        conn.close()
         
         from datetime import datetime
         date_aujourd_hui = datetime.now().strftime('%d/%m/%Y %H:%M')
@@ -539,15 +2086,202 @@ def imprimer_codes_barres():
         return render_template('print_barcodes.html', 
                              produits=rows_to_list(produits),
                              categories=get_categories(),
+                             categorie=categorie,
+                             planches=etiquettes.PLANCHES,
                              date=date_aujourd_hui)
     except Exception as e:
         return render_template('error.html', error=str(e))
 
+@app.route('/imprimer-codes-barres/thermique')
+def imprimer_codes_barres_thermique():
+    """Travail d'impression ZPL/EPL pour imprimante thermique, en un seul flux
+
+    ?langage=zpl|epl, ?largeur= et ?hauteur= (mm), ?dpi=203|300|600, ?copies=
+    par produit, même filtre ?categorie= que la page d'impression.
+    """
+    try:
+        langage = request.args.get('langage', 'zpl')
+        morceaux = etiquettes.travail_thermique(
+            itertools.chain.from_iterable(iterer_lots_produits(
+                categorie=request.args.get('categorie', ''), ordre='categorie, nom')),
+            langage,
+            largeur_mm=float(request.args.get('largeur', 50)),
+            hauteur_mm=float(request.args.get('hauteur', 30)),
+            dpi=int(request.args.get('dpi', 203)),
+            copies=int(request.args.get('copies', 1)))
+    except ValueError as e:
+        return f"Error: {str(e)}", 400
+    
+    charset = 'utf-8' if langage == 'zpl' else 'windows-1252'
+    return reponse_flux(morceaux, f'text/plain; charset={charset}', langage)
+
+# Chemins PDF des barres par code : réutilisés d'une planche à l'autre
+CACHE_GLYPHES_TAILLE = int(os.environ.get('CACHE_GLYPHES_TAILLE', '8192'))
+cache_glyphes = CacheLRU(CACHE_GLYPHES_TAILLE, float('inf'))
+
+def get_glyphe_pdf(code):
+    """(nb de modules, chemin PDF) du code-barres, None si le code n'est pas encodable"""
+    trouve, glyphe = cache_glyphes.get(code)
+    if not trouve:
+        try:
+            _, modules, _ = etiquettes.encoder(code)
+            glyphe = (len(modules), etiquettes.chemin_pdf(modules))
+        except ValueError:
+            glyphe = None
+        cache_glyphes.set(code, glyphe)
+    return glyphe
+
+@app.route('/imprimer-codes-barres/pdf')
+def imprimer_codes_barres_pdf():
+    """Planches d'étiquettes PDF générées côté serveur et envoyées page par page
+
+    ?planche=a4-3x8 (défaut) ou a4-4x10, même filtre ?categorie= que la page d'impression.
+    """
+    try:
+        planche = etiquettes.PLANCHES.get(request.args.get('planche', 'a4-3x8'))
+        if not planche:
+            return render_template('error.html', error="Unknown label sheet format")
+        
+        categorie = request.args.get('categorie', '')
+        lots = iterer_lots_produits(categorie=categorie, ordre='categorie, nom')
+        premier_lot = next(lots, None)
+        
+        if not premier_lot:
+            return render_template('error.html', error="No product to print")
+        
+        produits = itertools.chain.from_iterable(itertools.chain([premier_lot], lots))
+        morceaux = etiquettes.pdf_planches(produits, planche, get_glyphe_pdf)
+        return reponse_flux(morceaux, 'application/pdf', 'pdf', compresser=False)
+        
+    except Exception as e:
+        annuler_transaction()
+        return render_template('error.html', error=str(e))
+
 @app.route('/gestion-stock')
 def gestion_stock():
     """Page de gestion du stock (quantitÃ©s, rÃ©approvisionnement)"""
     return redirect(url_for('index'))
 
+def contexte_mouvement():
+    """(source, appareil) d'un mouvement : route appelée et appareil à l'origine (en-tête X-Appareil)"""
+    if not has_request_context():
+        return 'cli', None
+    appareil = request.headers.get('X-Appareil') or request.remote_addr
+    return request.endpoint, (appareil or '')[:100] or None
+
+def emettre_evenements(cursor, evenements):
+    """Ajoute des événements (type, dict) à la file diffusée par /events, dans la transaction en cours
+
+    Sur PostgreSQL, des transactions concurrentes peuvent valider leurs id dans
+    le désordre : le diffuseur ne publie un id qu'une fois terminées toutes les
+    transactions qui ont pu le tirer (voir Diffuseur._horizon). txid_current()
+    attribue à la transaction son numéro avant le tirage de l'id.
+    """
+    lignes = [(type_evenement, json.dumps(donnees, separators=(',', ':')))
+              for type_evenement, donnees in evenements]
+    if not lignes:
+        return
+    if USE_POSTGRES:
+        from psycopg2.extras import execute_values
+        execute_values(cursor, 'SELECT txid_current(); INSERT INTO evenements (type, donnees) VALUES %s', lignes)
+    else:
+        cursor.executemany('INSERT INTO evenements (type, donnees) VALUES (?, ?)', lignes)
+
+def journaliser_mouvements(cursor, mouvements, diffuser=True):
+    """Ajoute des lignes au journal stock_mouvements, dans la transaction en cours
+
+    mouvements : liste de (produit_id, delta, stock_apres, action) ; les deltas nuls sont ignorés.
+    Chaque mouvement est aussi émis en événement 'stock' {id, stock, delta} sauf si diffuser=False.
+    """
+    source, appareil = contexte_mouvement()
+    lignes = [(produit_id, delta, stock_apres, action, source, appareil)
+              for produit_id, delta, stock_apres, action in mouvements if delta]
+    if not lignes:
+        return
+    if USE_POSTGRES:
+        from psycopg2.extras import execute_values
+        execute_values(cursor, '''
+            INSERT INTO stock_mouvements (produit_id, delta, stock_apres, action, source, appareil) VALUES %s
+        ''', lignes)
+    else:
+        cursor.executemany('''
+            INSERT INTO stock_mouvements (produit_id, delta, stock_apres, action, source, appareil)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', lignes)
+    if diffuser:
+        emettre_evenements(cursor, [('stock', {'id': produit_id, 'stock': stock_apres, 'delta': delta})
+                                    for produit_id, delta, stock_apres, _, _, _ in lignes])
+
+def appliquer_mouvement_stock(conn, action, quantite, produit_id=None, code_barres=None):
+    """Modifie le stock d'un produit (par id ou code-barres) en une seule requête atomique
+
+    'ajouter' / 'retirer' : UPDATE ... SET stock = stock +/- ? RETURNING, le retrait
+    n'est appliqué que si le stock suffit (WHERE stock >= ?), sans lecture préalable :
+    deux scanners sur le même produit ne peuvent plus s'écraser.
+    'definir' : le stock précédent est lu sous verrou (FOR UPDATE / BEGIN IMMEDIATE).
+
+    Retourne {'id', 'nom', 'code_barres', 'stock_precedent', 'nouveau_stock'} ou None si aucun
+    produit n'a été modifié (introuvable ou stock insuffisant). Le mouvement est
+    journalisé dans stock_mouvements et validé dans la même transaction.
+    """
+    cle, valeur = ('id', produit_id) if produit_id is not None else ('code_barres', code_barres)
+    cursor = get_cursor(conn)
+    
+    if action == 'definir':
+        if USE_POSTGRES:
+            cursor.execute(f'''
+                UPDATE produits p SET stock = %s
+                FROM (SELECT id, stock FROM produits WHERE {cle} = %s FOR UPDATE) avant
+                WHERE p.id = avant.id
+                RETURNING p.id, p.nom, p.code_barres, avant.stock AS stock_precedent, p.stock AS nouveau_stock
+            ''', (quantite, valeur))
+            ligne = cursor.fetchone()
+            mouvement = dict(ligne) if ligne else None
+        else:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute(f'SELECT id, nom, code_barres, stock FROM produits WHERE {cle} = ?', (valeur,))
+            ligne = cursor.fetchone()
+            mouvement = None
+            if ligne:
+                cursor.execute('UPDATE produits SET stock = ? WHERE id = ?', (quantite, ligne['id']))
+                mouvement = {'id': ligne['id'], 'nom': ligne['nom'], 'code_barres': ligne['code_barres'],
+                             'stock_precedent': ligne['stock'], 'nouveau_stock': quantite}
+    else:
+        if action == 'ajouter':
+            query = f'UPDATE produits SET stock = stock + ? WHERE {cle} = ? RETURNING id, nom, code_barres, stock'
+            params = (quantite, valeur)
+        else:
+            query = f'UPDATE produits SET stock = stock - ? WHERE {cle} = ? AND stock >= ? RETURNING id, nom, code_barres, stock'
+            params = (quantite, valeur, quantite)
+        cursor.execute(adapt_query(query), params)
+        lignes = cursor.fetchall()
+        mouvement = None
+        if lignes:
+            ligne = lignes[0]
+            delta = quantite if action == 'ajouter' else -quantite
+            mouvement = {'id': ligne['id'], 'nom': ligne['nom'], 'code_barres': ligne['code_barres'],
+                         'stock_precedent': ligne['stock'] - delta, 'nouveau_stock': ligne['stock']}
+    
+    if mouvement:
+        journaliser_mouvements(cursor, [(mouvement['id'], mouvement['nouveau_stock'] - mouvement['stock_precedent'],
+                                         mouvement['nouveau_stock'], action)])
+    conn.commit()
+    if mouvement:
+        cache_produits.invalider(mouvement['code_barres'])
+    return mouvement
+
+def lire_quantite(valeur, minimum=1):
+    """Quantité de scan ou d'ajustement : entier >= minimum, sinon None"""
+    if isinstance(valeur, bool):
+        return None
+    if isinstance(valeur, float) and valeur.is_integer():
+        valeur = int(valeur)
+    try:
+        quantite = int(valeur) if isinstance(valeur, (int, str)) else None
+    except ValueError:
+        return None
+    return quantite if quantite is not None and quantite >= minimum else None
+
 @app.route('/ajuster-stock', methods=['POST'])
 def ajuster_stock():
     """API pour ajuster le stock manuellement"""
@@ -555,45 +2289,28 @@ def ajuster_stock():
         data = request.get_json()
         produit_id = data.get('produit_id')
         action = data.get('action')  # 'ajouter', 'retirer', 'definir'
-        quantite = int(data.get('quantite', 1))
-        
-        conn = get_db_connection()
-        cursor = get_cursor(conn)
-        query = adapt_query('SELECT * FROM produits WHERE id = ?')
-        cursor.execute(query, (produit_id,))
-        produit = cursor.fetchone()
-        
-        if not produit:
-            conn.close()
-            return jsonify({'success': False, 'message': 'Product not found'})
-        
-        produit_dict = row_to_dict(produit)
-        stock_actuel = produit_dict['stock']
         
-        if action == 'ajouter':
-            nouveau_stock = stock_actuel + quantite
-            action_text = f'added {quantite}'
-        elif action == 'retirer':
-            if stock_actuel < quantite:
-                conn.close()
-                return jsonify({
-                    'success': False, 
-                    'message': f'Not enough stock! Current stock: {stock_actuel}, requested: {quantite}'
-                })
-            nouveau_stock = stock_actuel - quantite
-            action_text = f'removed {quantite}'
-        elif action == 'definir':
-            nouveau_stock = quantite
-            action_text = f'set to {quantite}'
-        else:
-            conn.close()
+        if action not in ('ajouter', 'retirer', 'definir'):
             return jsonify({'success': False, 'message': 'Invalid action'})
+        # Un stock peut être défini à 0, une variation est toujours positive
+        quantite = lire_quantite(data.get('quantite', 1), minimum=0 if action == 'definir' else 1)
+        if quantite is None:
+            return jsonify({'success': False, 'message': 'Invalid quantity (positive integer expected)'})
         
-        # Mise à jour du stock
-        query = adapt_query('UPDATE produits SET stock = ? WHERE id = ?')
-        cursor.execute(query, (nouveau_stock, produit_id))
-        conn.commit()
-        conn.close()
+        conn = get_db()
+        mouvement = appliquer_mouvement_stock(conn, action, quantite, produit_id=produit_id)
+        
+        if not mouvement:
+            # Aucune ligne modifiée : produit inconnu ou stock insuffisant
+            cursor = get_cursor(conn)
+            cursor.execute(adapt_query('SELECT stock FROM produits WHERE id = ?'), (produit_id,))
+            produit = cursor.fetchone()
+            if not produit:
+                return jsonify({'success': False, 'message': 'Product not found'})
+            return jsonify({
+                'success': False, 
+                'message': f'Not enough stock! Current stock: {produit["stock"]}, requested: {quantite}'
+            })
         
         action_text = {
             'ajouter': f'added {quantite}',
@@ -603,15 +2320,16 @@ def ajuster_stock():
         
         return jsonify({
             'success': True,
-            'message': f'✅ {produit_dict["nom"]}: {action_text} unit(s)',
-            'produit': produit_dict['nom'],
+            'message': f'✅ {mouvement["nom"]}: {action_text} unit(s)',
+            'produit': mouvement['nom'],
             'action': action,
             'quantite': quantite,
-            'stock_precedent': stock_actuel,
-            'nouveau_stock': nouveau_stock
+            'stock_precedent': mouvement['stock_precedent'],
+            'nouveau_stock': mouvement['nouveau_stock']
         })
         
     except Exception as e:
+        annuler_transaction()
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
 @app.route('/scan', methods=['POST'])
@@ -621,26 +2339,22 @@ def scan():
         data = request.get_json()
         code = data.get('code', '').strip()
         action = data.get('action', '').strip()  # 'retirer', 'ajouter', ou vide pour demander
-        quantite = data.get('quantite', 1)
+        quantite = lire_quantite(data.get('quantite', 1))
         
         if not code:
             return jsonify({'success': False, 'message': 'Empty code'})
         
-        conn = get_db_connection()
-        cursor = get_cursor(conn)
-        query = adapt_query('SELECT * FROM produits WHERE code_barres = ?')
-        cursor.execute(query, (code,))
-        produit = cursor.fetchone()
-        
-        if not produit:
-            conn.close()
-            return jsonify({'success': False, 'message': f'Product not found: {code}'})
-        
-        produit_dict = row_to_dict(produit)
-        
-        # Si aucune action spécifiée, retourner les infos du produit pour demander l'action
-        if not action:
-            conn.close()
+        # Si aucune action spécifiée (ou action inconnue), lire le produit (cache du scanner)
+        if action not in ('retirer', 'ajouter'):
+            produit_dict = trouver_produit_par_code(code)
+            
+            if not produit_dict:
+                return jsonify({'success': False, 'message': f'Product not found: {code}'})
+            
+            if action:
+                return jsonify({'success': False, 'message': 'Action non valide'})
+            
+            # Retourner les infos du produit pour demander l'action
             return jsonify({
                 'success': True,
                 'ask_action': True,
@@ -655,89 +2369,603 @@ def scan():
                 'message': f'Product found: {produit_dict["nom"]}'
             })
         
-        # Traitement de l'action
-        stock_actuel = produit_dict['stock']
+        if quantite is None:
+            return jsonify({'success': False, 'message': 'Invalid quantity (positive integer expected)'})
         
-        if action == 'retirer':
-            if stock_actuel < quantite:
-                conn.close()
-                return jsonify({
-                    'success': False, 
-                    'message': f'❌ Not enough stock! Current stock: {stock_actuel}, requested: {quantite}'
-                })
-            nouveau_stock = stock_actuel - quantite
-            action_text = f'removed {quantite}'
+        # Code connu comme inexistant : inutile de tenter la mise à jour
+        trouve, produit_cache = produit_en_cache(code)
+        if trouve and produit_cache is None:
+            return jsonify({'success': False, 'message': f'Product not found: {code}'})
         
-        elif action == 'ajouter':
-            nouveau_stock = stock_actuel + quantite
-            action_text = f'added {quantite}'
+        # Mise Ã  jour atomique du stock
+        conn = get_db()
+        cursor = get_cursor(conn)
+        mouvement = appliquer_mouvement_stock(conn, action, quantite, code_barres=code)
         
-        else:
-            conn.close()
-            return jsonify({'success': False, 'message': 'Action non valide'})
+        if not mouvement:
+            # Aucune ligne modifiée : produit inconnu ou stock insuffisant
+            cursor.execute(adapt_query('SELECT stock FROM produits WHERE code_barres = ?'), (code,))
+            produit = cursor.fetchone()
+            if not produit:
+                return jsonify({'success': False, 'message': f'Product not found: {code}'})
+            return jsonify({
+                'success': False, 
+                'message': f'❌ Not enough stock! Current stock: {produit["stock"]}, requested: {quantite}'
+            })
         
-        # Mise Ã  jour du stock
-        query = adapt_query('UPDATE produits SET stock = ? WHERE id = ?')
-        cursor.execute(query, (nouveau_stock, produit_dict['id']))
-        conn.commit()
-        conn.close()
+        action_text = f'removed {quantite}' if action == 'retirer' else f'added {quantite}'
         
         return jsonify({
             'success': True,
-            'message': f'âœ… {produit_dict["nom"]}: {action_text} unitÃ©(s)',
-            'produit': produit_dict['nom'],
+            'message': f'âœ… {mouvement["nom"]}: {action_text} unitÃ©(s)',
+            'produit': mouvement['nom'],
             'action': action,
             'quantite': quantite,
-            'stock_precedent': stock_actuel,
-            'nouveau_stock': nouveau_stock
+            'stock_precedent': mouvement['stock_precedent'],
+            'nouveau_stock': mouvement['nouveau_stock']
         })
         
     except Exception as e:
+        annuler_transaction()
         return jsonify({'success': False, 'message': f'Erreur: {str(e)}'})
 
-@app.route('/statistiques')
-def statistiques():
-    """Page statistiques"""
+SCAN_BATCH_MAX = int(os.environ.get('SCAN_BATCH_MAX', '1000'))
+
+@app.route('/scan/batch', methods=['POST'])
+def scan_batch():
+    """API de scan groupé : applique une liste de scans dans une seule transaction
+
+    Corps : {"scans": [{"code": ..., "action": "retirer"|"ajouter", "quantite": 1}, ...]}
+    Les codes sont résolus en une requête (IN), les lignes sont traitées dans
+    l'ordre contre le stock lu sous verrou, puis les variations nettes par
+    produit sont appliquées d'un coup et validées par un seul commit.
+    """
     try:
-        conn = get_db_connection()
+        data = request.get_json()
+        scans = data.get('scans', []) if isinstance(data, dict) else data
+        
+        if not isinstance(scans, list) or not scans:
+            return jsonify({'success': False, 'message': 'No scan to apply'})
+        if len(scans) > SCAN_BATCH_MAX:
+            return jsonify({'success': False, 'message': f'Too many scans (max {SCAN_BATCH_MAX})'})
+        
+        lignes = []
+        for scan_ligne in scans:
+            scan_ligne = scan_ligne if isinstance(scan_ligne, dict) else {}
+            lignes.append({
+                'code': str(scan_ligne.get('code', '')).strip(),
+                'action': str(scan_ligne.get('action', '')).strip(),
+                'quantite': lire_quantite(scan_ligne.get('quantite', 1)),
+                'quantite_brute': scan_ligne.get('quantite', 1)
+            })
+        
+        codes = sorted({ligne['code'] for ligne in lignes if ligne['code']})
+        
+        conn = get_db()
         cursor = get_cursor(conn)
         
-        # Stats gÃ©nÃ©rales
-        cursor.execute('SELECT COUNT(*) as total FROM produits')
-        result = cursor.fetchone()
-        total = result['total'] if USE_POSTGRES else result[0]
+        # Lecture des produits sous verrou : le stock ne peut pas changer avant le commit
+        produits = {}
+        if codes:
+            if not USE_POSTGRES:
+                cursor.execute('BEGIN IMMEDIATE')
+            for tranche in tranches_in(codes):
+                placeholders = ', '.join(['?'] * len(tranche))
+                query = f'SELECT id, nom, code_barres, stock FROM produits WHERE code_barres IN ({placeholders})'
+                if USE_POSTGRES:
+                    query += ' ORDER BY id FOR UPDATE'
+                cursor.execute(adapt_query(query), tranche)
+                produits.update((produit['code_barres'], row_to_dict(produit)) for produit in cursor.fetchall())
         
-        cursor.execute('SELECT COUNT(*) as ruptures FROM produits WHERE stock = 0')
-        result = cursor.fetchone()
-        ruptures = result['ruptures'] if USE_POSTGRES else result[0]
+        stocks = {produit['id']: produit['stock'] for produit in produits.values()}
+        resultats = []
+        mouvements = []
         
-        cursor.execute('SELECT COUNT(*) as stock_faible FROM produits WHERE stock > 0 AND stock <= 5')
-        result = cursor.fetchone()
-        stock_faible = result['stock_faible'] if USE_POSTGRES else result[0]
+        for index, ligne in enumerate(lignes):
+            resultat = {'index': index, 'code': ligne['code'], 'action': ligne['action'],
+                        'quantite': ligne['quantite'] or ligne['quantite_brute'], 'success': False}
+            produit = produits.get(ligne['code'])
+            
+            if not ligne['code']:
+                resultat['message'] = 'Empty code'
+            elif not produit:
+                resultat['message'] = f'Product not found: {ligne["code"]}'
+            elif ligne['action'] not in ('retirer', 'ajouter'):
+                resultat['message'] = 'Invalid action'
+            elif ligne['quantite'] is None:
+                resultat['message'] = 'Invalid quantity (positive integer expected)'
+            elif ligne['action'] == 'retirer' and stocks[produit['id']] < ligne['quantite']:
+                resultat['produit'] = produit['nom']
+                resultat['message'] = f'Not enough stock! Current stock: {stocks[produit["id"]]}, requested: {ligne["quantite"]}'
+            else:
+                delta = ligne['quantite'] if ligne['action'] == 'ajouter' else -ligne['quantite']
+                resultat.update({
+                    'success': True,
+                    'produit': produit['nom'],
+                    'stock_precedent': stocks[produit['id']],
+                    'nouveau_stock': stocks[produit['id']] + delta
+                })
+                stocks[produit['id']] += delta
+                mouvements.append((produit['id'], delta, stocks[produit['id']], ligne['action']))
+            
+            resultats.append(resultat)
         
-        cursor.execute('SELECT SUM(stock * prix) as valeur FROM produits')
-        result = cursor.fetchone()
-        valeur_stock = (result['valeur'] if USE_POSTGRES else result[0]) or 0
+        # Variations nettes par produit
+        variations = [(stocks[produit['id']] - produit['stock'], produit['id'])
+                      for produit in produits.values()
+                      if stocks[produit['id']] != produit['stock']]
         
-        # Top catÃ©gories
+        if variations:
+            if USE_POSTGRES:
+                from psycopg2.extras import execute_values
+                execute_values(cursor, '''
+                    UPDATE produits p SET stock = p.stock + v.delta
+                    FROM (VALUES %s) AS v(delta, id)
+                    WHERE p.id = v.id
+                ''', variations)
+            else:
+                cursor.executemany('UPDATE produits SET stock = stock + ? WHERE id = ?', variations)
+        journaliser_mouvements(cursor, mouvements)
+        conn.commit()
+        for produit in produits.values():
+            if stocks[produit['id']] != produit['stock']:
+                cache_produits.invalider(produit['code_barres'])
+        
+        appliques = sum(1 for resultat in resultats if resultat['success'])
+        return jsonify({
+            'success': True,
+            'message': f'{appliques}/{len(resultats)} scan(s) applied',
+            'appliques': appliques,
+            'erreurs': len(resultats) - appliques,
+            'resultats': resultats
+        })
+        
+    except Exception as e:
+        annuler_transaction()
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
+# Journal des mouvements : stock_mouvements reçoit une ligne par variation de
+# stock ; compacter_mouvements() résume chaque jour écoulé dans stock_journalier
+# (stock de fin de journée par produit) et peut purger le détail ancien.
+MOUVEMENTS_RETENTION_JOURS = int(os.environ.get('MOUVEMENTS_RETENTION_JOURS', '0'))
+MOUVEMENTS_PURGE_LOT = 10000
+
+def compacter_mouvements(conn, retention_jours=MOUVEMENTS_RETENTION_JOURS):
+    """Résume dans stock_journalier les mouvements pas encore compactés des jours complets
+    
+    Un mouvement validé après le compactage de son jour (transaction longue) est
+    ajouté au résumé existant : variation et nombre cumulés, stock de fin repris
+    du dernier mouvement résumé. Si retention_jours > 0, supprime ensuite (par
+    lots) le détail déjà compacté plus ancien. Retourne (lignes de résumé écrites,
+    mouvements supprimés).
+    """
+    cursor = get_cursor(conn)
+    aujourd_hui = datetime.utcnow().date()
+    
+    fusion = '''
+        ON CONFLICT (produit_id, jour) DO UPDATE SET
+            stock_fin = EXCLUDED.stock_fin,
+            variation = stock_journalier.variation + EXCLUDED.variation,
+            nb_mouvements = stock_journalier.nb_mouvements + EXCLUDED.nb_mouvements
+    '''
+    if USE_POSTGRES:
+        # Marquage et résumé dans la même requête : un mouvement validé entre
+        # les deux ne peut pas être marqué sans avoir été résumé
         cursor.execute('''
-            SELECT categorie, COUNT(*) as count, SUM(stock) as stock_total 
-            FROM produits 
-            GROUP BY categorie 
-            ORDER BY count DESC 
-            LIMIT 5
-        ''')
-        top_categories = cursor.fetchall()
+            WITH marques AS (
+                UPDATE stock_mouvements SET compacte = TRUE
+                WHERE NOT compacte AND date_mouvement < %s
+                RETURNING id, produit_id, DATE(date_mouvement) AS jour, delta, stock_apres
+            )
+            INSERT INTO stock_journalier (produit_id, jour, stock_fin, variation, nb_mouvements)
+            SELECT produit_id, jour, (array_agg(stock_apres ORDER BY id DESC))[1], SUM(delta), COUNT(*)
+            FROM marques
+            GROUP BY produit_id, jour
+        ''' + fusion, (aujourd_hui.isoformat(),))
+        resumes = cursor.rowcount
+    else:
+        # Verrou d'écriture : aucun mouvement ne s'intercale entre résumé et marquage
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            INSERT INTO stock_journalier (produit_id, jour, stock_fin, variation, nb_mouvements)
+            SELECT j.produit_id, j.jour, m.stock_apres, j.variation, j.nb_mouvements
+            FROM (
+                SELECT produit_id, DATE(date_mouvement) AS jour, SUM(delta) AS variation,
+                       COUNT(*) AS nb_mouvements, MAX(id) AS dernier_id
+                FROM stock_mouvements
+                WHERE NOT compacte AND date_mouvement < ?
+                GROUP BY produit_id, DATE(date_mouvement)
+            ) j
+            JOIN stock_mouvements m ON m.id = j.dernier_id
+        ''' + fusion, (aujourd_hui.isoformat(),))
+        resumes = cursor.rowcount
+        cursor.execute('UPDATE stock_mouvements SET compacte = TRUE WHERE NOT compacte AND date_mouvement < ?',
+                       (aujourd_hui.isoformat(),))
+    conn.commit()
+    
+    supprimes = 0
+    if retention_jours > 0:
+        limite = (aujourd_hui - timedelta(days=retention_jours)).isoformat()
+        while True:
+            cursor.execute(adapt_query('''
+                DELETE FROM stock_mouvements WHERE id IN (
+                    SELECT id FROM stock_mouvements WHERE compacte AND date_mouvement < ? ORDER BY id LIMIT ?
+                )
+            '''), (limite, MOUVEMENTS_PURGE_LOT))
+            supprimes += cursor.rowcount
+            conn.commit()
+            if cursor.rowcount < MOUVEMENTS_PURGE_LOT:
+                break
+    return resumes, supprimes
+
+def stock_a_date(cursor, produit_id, instant):
+    """(stock, précision) d'un produit juste avant un instant UTC ('YYYY-MM-DD HH:MM:SS', exclu)
+    
+    Dernier mouvement antérieur à l'instant (index produit/date), sinon stock de fin
+    du dernier jour compacté terminé à l'instant, sinon stock d'avant le premier jour ou mouvement connu.
+    Retourne (None, None) si le produit n'a aucun historique.
+    """
+    cursor.execute(adapt_query('''
+        SELECT stock_apres FROM stock_mouvements
+        WHERE produit_id = ? AND date_mouvement < ?
+        ORDER BY date_mouvement DESC, id DESC LIMIT 1
+    '''), (produit_id, instant))
+    ligne = cursor.fetchone()
+    if ligne:
+        return row_to_dict(ligne)['stock_apres'], 'mouvement'
+    
+    # Le résumé d'un jour donne le stock de fin de journée : il vaut à partir
+    # du minuit suivant, donc pour les jours antérieurs à celui de l'instant
+    cursor.execute(adapt_query('''
+        SELECT stock_fin FROM stock_journalier
+        WHERE produit_id = ? AND jour < ?
+        ORDER BY jour DESC LIMIT 1
+    '''), (produit_id, instant[:10]))
+    ligne = cursor.fetchone()
+    if ligne:
+        return row_to_dict(ligne)['stock_fin'], 'jour'
+    
+    # Avant tout historique : stock qui précédait le premier jour ou mouvement connu
+    for query in ('''SELECT stock_fin - variation AS stock_avant FROM stock_journalier
+                     WHERE produit_id = ? ORDER BY jour LIMIT 1''',
+                  '''SELECT stock_apres - delta AS stock_avant FROM stock_mouvements
+                     WHERE produit_id = ? ORDER BY date_mouvement, id LIMIT 1'''):
+        cursor.execute(adapt_query(query), (produit_id,))
+        ligne = cursor.fetchone()
+        if ligne:
+            return row_to_dict(ligne)['stock_avant'], 'mouvement'
+    return None, None
+
+@app.route('/api/produit/<int:produit_id>/mouvements')
+def api_mouvements_produit(produit_id):
+    """Historique des mouvements d'un produit, du plus récent au plus ancien (?limit=, ?curseur=)"""
+    try:
+        limite = get_taille_page()
+        query = '''
+            SELECT id, delta, stock_apres, action, source, appareil, date_mouvement
+            FROM stock_mouvements WHERE produit_id = ?
+        '''
+        params = [produit_id]
+        jeton = request.args.get('curseur')
+        if jeton:
+            date_mouvement, dernier_id = decoder_curseur(jeton)
+            query += ' AND (date_mouvement, id) < (?, ?)'
+            params.extend([date_mouvement, dernier_id])
+        query += ' ORDER BY date_mouvement DESC, id DESC LIMIT ?'
+        params.append(limite + 1)
         
-        conn.close()
+        cursor = get_cursor(get_db())
+        cursor.execute(adapt_query(query), params)
+        mouvements = rows_to_list(cursor.fetchall())
         
-        stats = {
-            'total_produits': total,
-            'ruptures': ruptures,
-            'stock_faible': stock_faible,
-            'valeur_stock': round(valeur_stock, 2),
-            'top_categories': rows_to_list(top_categories)
-        }
+        curseur_suivant = None
+        if len(mouvements) > limite:
+            mouvements = mouvements[:limite]
+            curseur_suivant = encoder_curseur(mouvements[-1]['date_mouvement'], mouvements[-1]['id'])
+        
+        return jsonify({'success': True, 'mouvements': mouvements, 'curseur_suivant': curseur_suivant})
+    
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return erreur_api(e)
+
+@app.route('/api/produit/<int:produit_id>/stock-a-date')
+def api_stock_a_date(produit_id):
+    """Stock d'un produit à une date passée (?date=YYYY-MM-DD[THH:MM:SS], UTC ; fin de journée par défaut)"""
+    try:
+        valeur = request.args.get('date', '')
+        try:
+            instant = datetime.fromisoformat(valeur)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Invalid date'}), 400
+        # Borne exclue : minuit suivant pour une date, seconde suivante pour une heure
+        # (les dates de mouvement ont des fractions de seconde sur PostgreSQL)
+        if len(valeur) == 10:
+            borne = instant + timedelta(days=1)
+            instant = instant.replace(hour=23, minute=59, second=59)
+        else:
+            borne = instant.replace(microsecond=0) + timedelta(seconds=1)
+        
+        stock, precision = stock_a_date(get_cursor(get_db()), produit_id, borne.strftime('%Y-%m-%d %H:%M:%S'))
+        if stock is None:
+            return jsonify({'success': False, 'message': 'No stock history for this product'})
+        return jsonify({'success': True, 'produit_id': produit_id, 'date': instant.isoformat(),
+                        'stock': stock, 'precision': precision})
+
+    except Exception as e:
+        return erreur_api(e)
+
+# Événements temps réel : les écritures ajoutent des lignes à la table evenements
+# (emettre_evenements) ; dans chaque worker, un seul thread lit les nouvelles
+# lignes et les redistribue à tous les flux /events ouverts de ce worker.
+EVENEMENTS_INTERVALLE = float(os.environ.get('EVENEMENTS_INTERVALLE', '0.5'))
+EVENEMENTS_TAMPON = int(os.environ.get('EVENEMENTS_TAMPON', '1000'))
+EVENEMENTS_RETENTION = int(os.environ.get('EVENEMENTS_RETENTION', '3600'))
+EVENEMENTS_PING = float(os.environ.get('EVENEMENTS_PING', '15'))
+EVENEMENTS_DUREE_MAX = float(os.environ.get('EVENEMENTS_DUREE_MAX', '300'))
+# Chaque flux ouvert occupe un thread du worker : au-delà, le navigateur est
+# invité à se reconnecter plus tard pour laisser des threads aux autres requêtes.
+EVENEMENTS_FLUX_MAX = int(os.environ.get('EVENEMENTS_FLUX_MAX', '16'))
+EVENEMENTS_LOT = 500
+
+def lire_evenements(cursor, depuis, limite=EVENEMENTS_LOT, jusqu_a=None):
+    """Événements d'id > depuis (et <= jusqu_a), dans l'ordre : liste de (id, type, donnees JSON)"""
+    if jusqu_a is None:
+        cursor.execute(adapt_query('SELECT id, type, donnees FROM evenements WHERE id > ? ORDER BY id LIMIT ?'),
+                       (depuis, limite))
+    else:
+        cursor.execute(adapt_query('SELECT id, type, donnees FROM evenements WHERE id > ? AND id <= ? ORDER BY id LIMIT ?'),
+                       (depuis, jusqu_a, limite))
+    return [(ligne['id'], ligne['type'], ligne['donnees']) for ligne in cursor.fetchall()]
+
+def purger_evenements(conn, retention=EVENEMENTS_RETENTION):
+    """Supprime les événements plus vieux que retention secondes ; retourne le nombre supprimé"""
+    limite = (datetime.utcnow() - timedelta(seconds=retention)).strftime('%Y-%m-%d %H:%M:%S')
+    cursor = get_cursor(conn)
+    cursor.execute(adapt_query('DELETE FROM evenements WHERE date_evenement < ?'), (limite,))
+    supprimes = cursor.rowcount
+    conn.commit()
+    return supprimes
+
+class Diffuseur:
+    """Relais des événements d'un worker vers ses abonnés /events
+
+    Le thread de lecture ne tourne que tant qu'il y a des abonnés. Les derniers
+    événements sont gardés en mémoire : le tampon couvre tous les id de
+    ]debut, dernier_id] ; un abonné plus en retard relit la base.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.condition = threading.Condition()
+        self.tampon = []
+        self.debut = None
+        self.dernier_id = None
+        self.abonnes = 0
+        self.actif = False
+        self.reperes = deque()  # PostgreSQL : (xmax de l'instantané, dernier id tiré)
+        self.stats = {'lectures': 0, 'evenements': 0, 'erreurs': 0, 'purges': 0, 'refus': 0}
+
+    def abonner(self, attente_max=10):
+        """Enregistre un abonné (démarre le thread au besoin) ; retourne le dernier id connu
+
+        Lève FluxSature au-delà de EVENEMENTS_FLUX_MAX abonnés dans ce worker.
+        """
+        with self.condition:
+            if self.abonnes >= EVENEMENTS_FLUX_MAX:
+                self.stats['refus'] += 1
+                raise FluxSature('Too many event streams')
+            self.abonnes += 1
+            if not self.actif:
+                self.actif = True
+                self.dernier_id = None
+                threading.Thread(target=self._boucle, name='diffuseur-evenements', daemon=True).start()
+            self.condition.wait_for(lambda: self.dernier_id is not None, attente_max)
+            if self.dernier_id is None:
+                self.abonnes -= 1
+                raise RuntimeError('Event stream unavailable')
+            return self.dernier_id
+
+    def desabonner(self):
+        with self.condition:
+            self.abonnes -= 1
+
+    def attendre(self, depuis, delai):
+        """Événements d'id > depuis, après au plus delai secondes d'attente
+
+        Retourne None si le tampon ne remonte pas jusqu'à depuis (relire la base).
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: (self.dernier_id or 0) > depuis, delai)
+            if self.debut is None or depuis < self.debut:
+                return None
+            return [evenement for evenement in self.tampon if evenement[0] > depuis]
+
+    def _horizon(self, cursor):
+        """PostgreSQL : plus grand id d'événement définitif, ou None
+
+        Un id tiré par une transaction en cours peut être validé après un id plus
+        grand. Chaque lecture note la valeur de la séquence puis le xmax d'un
+        instantané pris juste après : quand le xmin courant l'atteint, toutes les
+        transactions qui ont pu tirer un id jusqu'à cette valeur sont terminées.
+        Une longue transaction d'écriture retarde donc la diffusion, pas les écritures.
+        """
+        # Tant que la séquence n'a servi aucune valeur, last_value vaut déjà la première
+        cursor.execute('SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END AS last_value '
+                       'FROM evenements_id_seq')
+        derniere_valeur = row_to_dict(cursor.fetchone())['last_value']
+        cursor.execute('SELECT txid_snapshot_xmin(s) AS xmin, txid_snapshot_xmax(s) AS xmax '
+                       'FROM txid_current_snapshot() s')
+        instantane = row_to_dict(cursor.fetchone())
+        if len(self.reperes) >= 100:
+            # Repère plus récent : attendre plus longtemps couvre aussi le précédent
+            self.reperes.pop()
+        self.reperes.append((instantane['xmax'], derniere_valeur))
+        horizon = None
+        while self.reperes and self.reperes[0][0] <= instantane['xmin']:
+            horizon = self.reperes.popleft()[1]
+        return horizon
+
+    def _boucle(self):
+        conn = None
+        derniere_purge = 0
+        try:
+            while True:
+                with self.condition:
+                    if self.abonnes <= 0:
+                        self.actif = False
+                        return
+                try:
+                    if conn is None:
+                        conn = get_db_connection()
+                        if USE_POSTGRES:
+                            conn.autocommit = True
+                    cursor = get_cursor(conn)
+                    horizon = None
+                    if USE_POSTGRES:
+                        horizon = self._horizon(cursor)
+                    if self.dernier_id is None:
+                        if USE_POSTGRES:
+                            dernier = horizon
+                        else:
+                            cursor.execute('SELECT COALESCE(MAX(id), 0) AS dernier FROM evenements')
+                            dernier = row_to_dict(cursor.fetchone())['dernier']
+                        if dernier is None:
+                            time.sleep(EVENEMENTS_INTERVALLE)
+                            continue
+                        with self.condition:
+                            self.tampon, self.debut, self.dernier_id = [], dernier, dernier
+                            self.condition.notify_all()
+                    nouveaux = []
+                    if not USE_POSTGRES or (horizon is not None and horizon > self.dernier_id):
+                        nouveaux = lire_evenements(cursor, self.dernier_id, jusqu_a=horizon)
+                    self.stats['lectures'] += 1
+                    if nouveaux:
+                        with self.condition:
+                            self.tampon.extend(nouveaux)
+                            if len(self.tampon) > EVENEMENTS_TAMPON:
+                                self.debut = self.tampon[-EVENEMENTS_TAMPON - 1][0]
+                                del self.tampon[:-EVENEMENTS_TAMPON]
+                            self.dernier_id = nouveaux[-1][0]
+                            self.stats['evenements'] += len(nouveaux)
+                            self.condition.notify_all()
+                    if time.monotonic() - derniere_purge > 60:
+                        derniere_purge = time.monotonic()
+                        self.stats['purges'] += purger_evenements(conn)
+                except Exception:
+                    self.stats['erreurs'] += 1
+                    if conn is not None:
+                        try:
+                            conn.close()
+                        except Exception:
+                            pass
+                        conn = None
+                    self.reperes.clear()
+                    time.sleep(min(5, EVENEMENTS_INTERVALLE * 10))
+                    continue
+                if len(nouveaux) < EVENEMENTS_LOT:
+                    time.sleep(EVENEMENTS_INTERVALLE)
+        finally:
+            if conn is not None:
+                conn.close()
+
+class FluxSature(RuntimeError):
+    """Trop de flux /events ouverts dans ce worker"""
+
+_diffuseur = None
+_diffuseur_verrou = threading.Lock()
+
+def get_diffuseur():
+    """Diffuseur du processus courant (recréé après un fork de gunicorn)"""
+    global _diffuseur
+    if _diffuseur is None or _diffuseur.pid != os.getpid():
+        with _diffuseur_verrou:
+            if _diffuseur is None or _diffuseur.pid != os.getpid():
+                _diffuseur = Diffuseur()
+    return _diffuseur
+
+def message_sse(id_evenement, type_evenement, donnees):
+    return f'id: {id_evenement}\nevent: {type_evenement}\ndata: {donnees}\n\n'
+
+@app.route('/events')
+def flux_evenements():
+    """Flux Server-Sent Events des changements de stock ('stock') et du catalogue ('catalogue')
+
+    Reprise avec l'en-tête Last-Event-ID (envoyé par EventSource à la reconnexion)
+    ou ?depuis=<id> ; sans id, seuls les événements à venir sont envoyés. Le flux
+    est fermé après EVENEMENTS_DUREE_MAX secondes, le navigateur se reconnecte seul.
+    """
+    try:
+        depuis = request.headers.get('Last-Event-ID') or request.args.get('depuis')
+        depuis = int(depuis) if depuis not in (None, '') else None
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid event id'}), 400
+
+    diffuseur = get_diffuseur()
+    try:
+        dernier_id = diffuseur.abonner()
+    except FluxSature:
+        # Flux vide avec un délai de reconnexion (EventSource abandonne sur une erreur HTTP),
+        # étalé pour que les navigateurs refusés ne reviennent pas tous ensemble
+        delai = int(EVENEMENTS_PING * random.uniform(1, 3) * 1000)
+        reponse = Response(f'retry: {delai}\n\n', mimetype='text/event-stream')
+        reponse.headers['Cache-Control'] = 'no-cache'
+        return reponse
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 503
+
+    def rattraper(depuis):
+        """Relit en base les événements manquants au tampon ; None si déjà purgés"""
+        pool = get_pool()
+        conn = pool.acquerir()
+        try:
+            cursor = get_cursor(conn)
+            cursor.execute('SELECT MIN(id) AS premier FROM evenements')
+            premier = row_to_dict(cursor.fetchone())['premier']
+            if (premier if premier is not None else diffuseur.dernier_id + 1) > depuis + 1:
+                return None
+            return lire_evenements(cursor, depuis, jusqu_a=diffuseur.dernier_id)
+        finally:
+            pool.liberer(conn)
+
+    def generer(depuis):
+        try:
+            fin = time.monotonic() + EVENEMENTS_DUREE_MAX
+            yield f'retry: {int(EVENEMENTS_INTERVALLE * 4000)}\n\n'
+            while diffuseur.actif:
+                restant = fin - time.monotonic()
+                if restant <= 0:
+                    break
+                evenements = diffuseur.attendre(depuis, min(EVENEMENTS_PING, restant))
+                if evenements is None:
+                    evenements = rattraper(depuis)
+                    if evenements is None:
+                        # Historique purgé : le client doit tout recharger
+                        depuis = diffuseur.dernier_id
+                        yield message_sse(depuis, 'reinitialiser', '{}')
+                        continue
+                if not evenements:
+                    yield ': ping\n\n'
+                    continue
+                for id_evenement, type_evenement, donnees in evenements:
+                    yield message_sse(id_evenement, type_evenement, donnees)
+                depuis = evenements[-1][0]
+        finally:
+            diffuseur.desabonner()
+
+    # Id inconnu (base réinitialisée) : reprise à partir des événements à venir
+    depuis = dernier_id if depuis is None or depuis > dernier_id else depuis
+    reponse = Response(generer(depuis), mimetype='text/event-stream')
+    reponse.headers['Cache-Control'] = 'no-cache'
+    reponse.headers['X-Accel-Buffering'] = 'no'
+    return reponse
+
+@app.route('/statistiques')
+def statistiques():
+    """Page statistiques"""
+    try:
+        stats = calculer_stats().to_dict()
         
         return render_template('statistics.html', stats=stats, categories=get_categories())
         
@@ -748,11 +2976,10 @@ def statistiques():
 def ruptures():
     """Produits en rupture"""
     try:
-        conn = get_db_connection()
+        conn = get_db()
         cursor = get_cursor(conn)
         cursor.execute('SELECT * FROM produits WHERE stock = 0 ORDER BY nom')
         produits = cursor.fetchall()
-        conn.close()
         
         return render_template('ruptures.html', 
                              produits=rows_to_list(produits),
@@ -765,11 +2992,10 @@ def ruptures():
 def stock_faible():
     """Produits Ã  stock faible"""
     try:
-        conn = get_db_connection()
+        conn = get_db()
         cursor = get_cursor(conn)
         cursor.execute('SELECT * FROM produits WHERE stock > 0 AND stock <= 5 ORDER BY stock ASC')
         produits = cursor.fetchall()
-        conn.close()
         
         return render_template('stock_faible.html', 
                              produits=rows_to_list(produits),
@@ -778,141 +3004,343 @@ def stock_faible():
     except Exception as e:
         return render_template('error.html', error=str(e))
 
+def get_produits_codes_barres():
+    """Produits filtrés par ?categorie= ou ?ids=1,2,3 (liste d'identifiants), triés par nom"""
+    categorie = request.args.get('categorie', '').strip()
+    ids = [int(id) for id in request.args.get('ids', '').split(',') if id.strip()]
+    
+    conditions, params = [], []
+    if categorie:
+        conditions.append('categorie = ?')
+        params.append(categorie)
+    if ids:
+        conditions.append(f'id IN ({", ".join(["?"] * len(ids))})')
+        params.extend(ids)
+    
+    query = 'SELECT id, nom, code_barres, prix, stock, categorie FROM produits'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    
+    cursor = get_cursor(get_db())
+    cursor.execute(adapt_query(query + ' ORDER BY nom'), params)
+    return rows_to_list(cursor.fetchall())
+
+def construire_sprite(produits, autonome=True):
+    """(sprite SVG, {id produit: (largeur, hauteur)}) des codes-barres de produits déjà lus
+
+    Chaque code devient un <symbol id="cb-<id>"> ; les codes non encodables sont ignorés.
+    """
+    options = get_options_code_barres()
+    symboles, dimensions = [], {}
+    for produit in produits:
+        try:
+            dessin = get_dessin_code_barres(produit['code_barres'], *options)
+        except ValueError:
+            continue
+        symboles.append(etiquettes.symbole_svg(f'cb-{produit["id"]}', dessin))
+        dimensions[produit['id']] = dessin[:2]
+    return etiquettes.sprite_svg(symboles, autonome), dimensions
+
 @app.route('/codes-barres')
 def codes_barres():
-    """GÃ©nÃ©rateur de codes-barres"""
+    """Générateur de codes-barres : tous les codes de la page dans un sprite SVG en ligne"""
     try:
-        conn = get_db_connection()
-        cursor = get_cursor(conn)
-        cursor.execute('SELECT * FROM produits ORDER BY nom')
-        produits = cursor.fetchall()
-        conn.close()
+        produits = get_produits_codes_barres()
+        sprite, dimensions = construire_sprite(produits, autonome=False)
         
         return render_template('barcodes.html', 
-                             produits=rows_to_list(produits),
+                             produits=produits,
+                             sprite=sprite,
+                             dimensions=dimensions,
                              categories=get_categories())
         
     except Exception as e:
+        annuler_transaction()
         return render_template('error.html', error=str(e))
 
+@app.route('/codes-barres/sprite.svg')
+@reponse_conditionnelle
+def sprite_codes_barres():
+    """Sprite SVG (<symbol id="cb-<id>">) des codes-barres filtrés, en une seule réponse"""
+    try:
+        sprite, _ = construire_sprite(get_produits_codes_barres())
+    except ValueError as e:
+        return f"Error: {str(e)}", 400
+    
+    response = make_response(sprite)
+    response.headers['Content-Type'] = 'image/svg+xml'
+    return response
+
+# Codes-barres SVG : le rendu ne dépend que de (code, format, module, hauteur),
+# il est donc mis en cache sans expiration et servi comme ressource immuable.
+CACHE_SVG_TAILLE = int(os.environ.get('CACHE_SVG_TAILLE', '4096'))
+cache_svg = CacheLRU(CACHE_SVG_TAILLE, float('inf'))
+
+def get_options_code_barres():
+    """(format, module, hauteur) lus dans la requête ; ValueError si hors bornes"""
+    format_code = request.args.get('format', 'auto')
+    module = int(request.args.get('module', 2))
+    hauteur = int(request.args.get('hauteur', 60))
+    if format_code not in etiquettes.FORMATS:
+        raise ValueError(f'Unknown barcode format: {format_code}')
+    if not 1 <= module <= 4 or not 20 <= hauteur <= 300:
+        raise ValueError('module must be 1-4 and hauteur 20-300')
+    return format_code, module, hauteur
+
+def get_dessin_code_barres(code, format_code='auto', module=2, hauteur=60):
+    """(largeur, hauteur, éléments SVG) du code-barres, depuis le cache par worker"""
+    cle = (code, format_code, module, hauteur)
+    trouve, dessin = cache_svg.get(cle)
+    if not trouve:
+        dessin = etiquettes.dessin_code_barres(code, format_code, module, hauteur)
+        cache_svg.set(cle, dessin)
+    return dessin
+
+def reponse_svg(code, cache_control):
+    """Réponse SVG du code-barres, 304 si l'ETag du client correspond"""
+    try:
+        options = get_options_code_barres()
+        svg = etiquettes.svg_code_barres(get_dessin_code_barres(code, *options))
+    except ValueError as e:
+        return f"Error: {str(e)}", 400
+    
+    etag = hashlib.blake2s(repr((etiquettes.VERSION_ENCODEUR, code) + options).encode('utf-8'),
+                           digest_size=12).hexdigest()
+    response = make_response(svg)
+    response.headers['Content-Type'] = 'image/svg+xml'
+    response.headers['Cache-Control'] = cache_control
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+# Une URL portant la version courante de l'encodeur (?v=) ne changera jamais de
+# contenu ; sans elle, le navigateur revalide chaque jour par ETag.
+CACHE_CODE_IMMUABLE = 'public, max-age=31536000, immutable'
+CACHE_CODE_REVALIDE = 'public, max-age=86400'
+
+def url_versionnee():
+    """Vrai si la requête porte la version courante de l'encodeur (?v=)"""
+    return request.args.get('v') == str(etiquettes.VERSION_ENCODEUR)
+
+@app.route('/generer-code/code/<path:code>')
+def generer_code_barres_par_code(code):
+    """Code-barres SVG d'un code donné, sans accès à la base (immuable avec ?v=)"""
+    return reponse_svg(code, CACHE_CODE_IMMUABLE if url_versionnee() else CACHE_CODE_REVALIDE)
+
 @app.route('/generer-code/<int:produit_id>')
 def generer_code_barres(produit_id):
-    """GÃ©nÃ¨re et retourne l'image du code-barres (version simplifiÃ©e)"""
+    """Génère et retourne l'image SVG du code-barres d'un produit (Code128 ou EAN-13)"""
     try:
-        conn = get_db_connection()
+        conn = get_db()
         cursor = get_cursor(conn)
-        query = adapt_query('SELECT * FROM produits WHERE id = ?')
+        query = adapt_query('SELECT code_barres FROM produits WHERE id = ?')
         cursor.execute(query, (produit_id,))
         produit = cursor.fetchone()
-        conn.close()
         
         if not produit:
             return "Product not found", 404
         
-        produit_dict = row_to_dict(produit)
-        
-        # GÃ©nÃ©rer une image SVG simple du code-barres
-        code = produit_dict['code_barres']
-        
-        # SVG simple reprÃ©sentant un code-barres
-        svg_content = f'''<?xml version="1.0" encoding="UTF-8"?>
-<svg width="300" height="100" xmlns="http://www.w3.org/2000/svg">
-  <rect width="300" height="100" fill="white"/>
-  
-  <!-- Barres du code-barres (pattern simple) -->
-  <rect x="20" y="10" width="2" height="60" fill="black"/>
-  <rect x="25" y="10" width="1" height="60" fill="black"/>
-  <rect x="29" y="10" width="3" height="60" fill="black"/>
-  <rect x="35" y="10" width="1" height="60" fill="black"/>
-  <rect x="39" y="10" width="2" height="60" fill="black"/>
-  <rect x="44" y="10" width="1" height="60" fill="black"/>
-  <rect x="48" y="10" width="1" height="60" fill="black"/>
-  <rect x="52" y="10" width="2" height="60" fill="black"/>
-  <rect x="57" y="10" width="3" height="60" fill="black"/>
-  <rect x="63" y="10" width="1" height="60" fill="black"/>
-  <rect x="67" y="10" width="2" height="60" fill="black"/>
-  <rect x="72" y="10" width="1" height="60" fill="black"/>
-  <rect x="76" y="10" width="1" height="60" fill="black"/>
-  <rect x="80" y="10" width="3" height="60" fill="black"/>
-  <rect x="86" y="10" width="2" height="60" fill="black"/>
-  <rect x="91" y="10" width="1" height="60" fill="black"/>
-  <rect x="95" y="10" width="2" height="60" fill="black"/>
-  <rect x="100" y="10" width="1" height="60" fill="black"/>
-  <rect x="104" y="10" width="3" height="60" fill="black"/>
-  <rect x="110" y="10" width="1" height="60" fill="black"/>
-  <rect x="114" y="10" width="2" height="60" fill="black"/>
-  <rect x="119" y="10" width="1" height="60" fill="black"/>
-  <rect x="123" y="10" width="1" height="60" fill="black"/>
-  <rect x="127" y="10" width="2" height="60" fill="black"/>
-  <rect x="132" y="10" width="3" height="60" fill="black"/>
-  <rect x="138" y="10" width="1" height="60" fill="black"/>
-  <rect x="142" y="10" width="2" height="60" fill="black"/>
-  <rect x="147" y="10" width="1" height="60" fill="black"/>
-  <rect x="151" y="10" width="1" height="60" fill="black"/>
-  <rect x="155" y="10" width="3" height="60" fill="black"/>
-  <rect x="161" y="10" width="2" height="60" fill="black"/>
-  <rect x="166" y="10" width="1" height="60" fill="black"/>
-  <rect x="170" y="10" width="2" height="60" fill="black"/>
-  <rect x="175" y="10" width="1" height="60" fill="black"/>
-  <rect x="179" y="10" width="3" height="60" fill="black"/>
-  <rect x="185" y="10" width="1" height="60" fill="black"/>
-  <rect x="189" y="10" width="2" height="60" fill="black"/>
-  <rect x="194" y="10" width="1" height="60" fill="black"/>
-  <rect x="198" y="10" width="1" height="60" fill="black"/>
-  <rect x="202" y="10" width="2" height="60" fill="black"/>
-  <rect x="207" y="10" width="3" height="60" fill="black"/>
-  <rect x="213" y="10" width="1" height="60" fill="black"/>
-  <rect x="217" y="10" width="2" height="60" fill="black"/>
-  <rect x="222" y="10" width="1" height="60" fill="black"/>
-  <rect x="226" y="10" width="1" height="60" fill="black"/>
-  <rect x="230" y="10" width="3" height="60" fill="black"/>
-  <rect x="236" y="10" width="2" height="60" fill="black"/>
-  <rect x="241" y="10" width="1" height="60" fill="black"/>
-  <rect x="245" y="10" width="2" height="60" fill="black"/>
-  <rect x="250" y="10" width="1" height="60" fill="black"/>
-  <rect x="254" y="10" width="3" height="60" fill="black"/>
-  <rect x="260" y="10" width="1" height="60" fill="black"/>
-  <rect x="264" y="10" width="2" height="60" fill="black"/>
-  <rect x="269" y="10" width="1" height="60" fill="black"/>
-  <rect x="273" y="10" width="1" height="60" fill="black"/>
-  <rect x="277" y="10" width="2" height="60" fill="black"/>
-  
-  <!-- Texte du code-barres -->
-  <text x="150" y="85" text-anchor="middle" font-family="monospace" font-size="12" fill="black">{code}</text>
-  
-  <!-- Nom du produit -->
-  <text x="150" y="98" text-anchor="middle" font-family="Arial" font-size="10" fill="black">{produit_dict['nom'][:30]}</text>
-</svg>'''
-        
-        response = make_response(svg_content)
-        response.headers['Content-Type'] = 'image/svg+xml'
-        return response
-        
+        # Le code d'un produit peut changer : revalidation à chaque affichage
+        return reponse_svg(row_to_dict(produit)['code_barres'], 'no-cache')
+
     except Exception as e:
         return f"Error: {str(e)}", 500
 
-@app.route('/export')
-def export_csv():
-    """Export CSV des produits"""
+# Codes-barres PNG : cache disque adressé par le contenu (code, format, dpi),
+# partagé par les workers gunicorn de la machine. Les fichiers sont écrits de
+# façon atomique ; au-delà de CACHE_PNG_TAILLE_MAX, les moins récemment servis
+# sont supprimés.
+CACHE_PNG_DIR = os.environ.get('CACHE_PNG_DIR', 'cache_png')
+CACHE_PNG_TAILLE_MAX = int(os.environ.get('CACHE_PNG_TAILLE_MAX', '200')) * 1024 * 1024
+PNG_THREADS = int(os.environ.get('PNG_THREADS', '4'))
+_png_octets_ecrits = 0
+_png_verrou = threading.Lock()
+_png_executeur = None
+_png_executeur_pid = None
+
+def get_executeur_png():
+    """Pool de threads de rendu PNG du processus courant (recréé après un fork de gunicorn)"""
+    global _png_executeur, _png_executeur_pid
+    with _png_verrou:
+        if _png_executeur is None or _png_executeur_pid != os.getpid():
+            _png_executeur = ThreadPoolExecutor(max_workers=PNG_THREADS, thread_name_prefix='png')
+            _png_executeur_pid = os.getpid()
+        return _png_executeur
+
+def nettoyer_cache_png(taille_max=CACHE_PNG_TAILLE_MAX):
+    """Supprime les PNG les moins récemment servis jusqu'à 90 % de taille_max"""
+    fichiers = []
+    for racine, _, noms in os.walk(CACHE_PNG_DIR):
+        for nom in noms:
+            if nom.endswith('.png'):
+                try:
+                    infos = os.stat(os.path.join(racine, nom))
+                except FileNotFoundError:
+                    continue
+                fichiers.append((infos.st_mtime, infos.st_size, os.path.join(racine, nom)))
+    
+    total = sum(taille for _, taille, _ in fichiers)
+    for _, taille, chemin in sorted(fichiers):
+        if total <= taille_max * 0.9:
+            break
+        try:
+            os.remove(chemin)
+        except FileNotFoundError:
+            pass
+        total -= taille
+
+def get_png_code_barres(code, format_code='auto', dpi=300):
+    """Chemin du PNG en cache disque, rendu au premier appel ; ValueError si non encodable"""
+    global _png_octets_ecrits
+    empreinte = hashlib.blake2s(f'{etiquettes.VERSION_ENCODEUR}|{format_code}|{dpi}|{code}'.encode('utf-8'),
+                                digest_size=16).hexdigest()
+    chemin = os.path.join(CACHE_PNG_DIR, empreinte[:2], f'{empreinte}.png')
+    
     try:
-        conn = get_db_connection()
+        os.utime(chemin)  # date de dernier accès pour l'éviction
+        return chemin
+    except FileNotFoundError:
+        pass
+    
+    png = etiquettes.png_code_barres(code, format_code, dpi)
+    os.makedirs(os.path.dirname(chemin), exist_ok=True)
+    temporaire = f'{chemin}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporaire, 'wb') as fichier:
+        fichier.write(png)
+    os.replace(temporaire, chemin)
+    
+    with _png_verrou:
+        _png_octets_ecrits += len(png)
+        nettoyer = _png_octets_ecrits > CACHE_PNG_TAILLE_MAX // 20
+        if nettoyer:
+            _png_octets_ecrits = 0
+    if nettoyer:
+        nettoyer_cache_png()
+    return chemin
+
+def get_options_png():
+    """(format, dpi) lus dans la requête ; ValueError si invalides"""
+    format_code = request.args.get('format', 'auto')
+    dpi = int(request.args.get('dpi', 300))
+    if format_code not in etiquettes.FORMATS:
+        raise ValueError(f'Unknown barcode format: {format_code}')
+    if dpi not in etiquettes.RESOLUTIONS_PNG:
+        raise ValueError(f'Unsupported resolution: {dpi} dpi')
+    return format_code, dpi
+
+@app.route('/generer-code/png/<path:code>')
+def generer_code_barres_png(code):
+    """Code-barres PNG d'un code donné (?dpi=, ?format=), servi depuis le cache disque (immuable avec ?v=)"""
+    try:
+        chemin = get_png_code_barres(code, *get_options_png())
+        reponse = send_file(os.path.abspath(chemin), mimetype='image/png', conditional=True)
+        reponse.headers['Cache-Control'] = CACHE_CODE_IMMUABLE if url_versionnee() else CACHE_CODE_REVALIDE
+        return reponse
+    except ValueError as e:
+        return f"Error: {str(e)}", 400
+
+@app.route('/codes-barres/png.zip')
+def codes_barres_png_zip():
+    """Archive ZIP des PNG des produits filtrés (?categorie=, ?ids=), rendus en parallèle"""
+    try:
+        options = get_options_png()
+        produits = get_produits_codes_barres()
+    except ValueError as e:
+        return f"Error: {str(e)}", 400
+    
+    def rendre(produit):
+        try:
+            return produit, get_png_code_barres(produit['code_barres'], *options)
+        except ValueError:
+            return produit, None
+    
+    def morceaux():
+        tampon = TamponFlux()
+        with zipfile.ZipFile(tampon, 'w', zipfile.ZIP_STORED) as archive:
+            for produit, chemin in get_executeur_png().map(rendre, produits):
+                if chemin:
+                    nom = f'{produit["id"]}_{re.sub(r"[^A-Za-z0-9_-]", "_", produit["code_barres"])}.png'
+                    try:
+                        archive.write(chemin, nom)
+                    except FileNotFoundError:
+                        # Évincé entre le rendu et l'archivage
+                        archive.writestr(nom, etiquettes.png_code_barres(produit['code_barres'], *options))
+                    yield tampon.vider()
+        yield tampon.vider()
+    
+    response = Response(morceaux(), content_type='application/zip')
+    response.headers['Content-Disposition'] = 'attachment; filename=codes_barres_png.zip'
+    return response
+
+# Export en flux : les produits sont lus par lots (curseur serveur nommé sur
+# PostgreSQL, fetchmany sur SQLite) et envoyés au fur et à mesure, la mémoire
+# reste constante quelle que soit la taille du catalogue.
+EXPORT_TAILLE_LOT = int(os.environ.get('EXPORT_TAILLE_LOT', '2000'))
+COLONNES_EXPORT = ['id', 'nom', 'code_barres', 'prix', 'stock', 'categorie', 'date_creation']
+
+def iterer_lots_produits(taille_lot=EXPORT_TAILLE_LOT, categorie='', ordre='nom'):
+    """Générateur de lots (listes de dicts) des produits, tous ou d'une catégorie
+
+    ordre est une clause ORDER BY fixée par l'appelant (jamais issue de la requête).
+    """
+    conn = get_db()
+    if USE_POSTGRES:
+        cursor = conn.cursor(name=f'export_produits_{os.getpid()}_{id(conn)}', cursor_factory=CurseurDictPGMesure)
+        cursor.itersize = taille_lot
+    else:
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM produits ORDER BY nom')
-        produits = cursor.fetchall()
-        conn.close()
-        
-        if not produits:
-            return render_template('error.html', error="No product to export")
-        
-        # CrÃ©er le CSV en mÃ©moire
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Headers
-        writer.writerow(['ID', 'Name', 'Barcode', 'Price ($)', 'Stock', 'Category', 'Created at'])
-        
-        # DonnÃ©es
-        for produit in produits:
+    try:
+        query = f'SELECT {", ".join(COLONNES_EXPORT)} FROM produits'
+        params = ()
+        if categorie:
+            query += ' WHERE categorie = ?'
+            params = (categorie,)
+        cursor.execute(adapt_query(f'{query} ORDER BY {ordre}'), params)
+        while True:
+            lot = cursor.fetchmany(taille_lot)
+            if not lot:
+                break
+            yield rows_to_list(lot)
+    finally:
+        cursor.close()
+
+def client_accepte_gzip():
+    """Vrai si le client accepte Content-Encoding: gzip (désactivable avec ?gzip=0)"""
+    return request.args.get('gzip', '1') != '0' and 'gzip' in request.headers.get('Accept-Encoding', '')
+
+def compresser_flux(morceaux):
+    """Compresse à la volée un flux de bytes au format gzip"""
+    compresseur = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for morceau in morceaux:
+        donnees = compresseur.compress(morceau)
+        if donnees:
+            yield donnees
+    yield compresseur.flush()
+
+def reponse_flux(morceaux, content_type, extension, compresser=True):
+    """Réponse de téléchargement en flux, compressée en gzip si le client l'accepte
+
+    compresser=False pour les formats déjà compressés (Parquet, XLSX)
+    """
+    headers = {
+        'Content-Disposition': f'attachment; filename=produits_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}',
+        'X-Accel-Buffering': 'no',
+        'Vary': 'Accept-Encoding'
+    }
+    if compresser and client_accepte_gzip():
+        morceaux = compresser_flux(morceaux)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(morceaux), content_type=content_type, headers=headers)
+
+def generer_csv(premier_lot, lots):
+    """Lignes CSV encodées, lot par lot"""
+    tampon = io.StringIO()
+    writer = csv.writer(tampon)
+    
+    # Headers
+    writer.writerow(['ID', 'Name', 'Barcode', 'Price ($)', 'Stock', 'Category', 'Created at'])
+    
+    for lot in itertools.chain([premier_lot], lots):
+        for produit in lot:
             writer.writerow([
                 produit['id'],
                 produit['nom'],
@@ -922,53 +3350,519 @@ def export_csv():
                 produit['categorie'],
                 produit['date_creation']
             ])
+        yield tampon.getvalue().encode('utf-8')
+        tampon.seek(0)
+        tampon.truncate()
+
+class TamponFlux(io.RawIOBase):
+    """Fichier en écriture seule (non repositionnable) vidé au fur et à mesure par un générateur"""
+
+    def __init__(self):
+        super().__init__()
+        self._morceaux = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, donnees):
+        self._morceaux.append(bytes(donnees))
+        self._position += len(donnees)
+        return len(donnees)
+
+    def tell(self):
+        return self._position
+
+    def vider(self):
+        donnees = b''.join(self._morceaux)
+        self._morceaux = []
+        return donnees
+
+def convertir_date(valeur):
+    """date_creation (datetime PostgreSQL ou texte SQLite) en datetime"""
+    if valeur is None or isinstance(valeur, datetime):
+        return valeur
+    try:
+        return datetime.fromisoformat(str(valeur))
+    except ValueError:
+        return None
+
+def generer_arrow(premier_lot, lots, format_fichier):
+    """Fichier Parquet ou Arrow IPC construit lot par lot (un record batch par lot)"""
+    schema = pyarrow.schema([
+        ('id', pyarrow.int64()),
+        ('nom', pyarrow.string()),
+        ('code_barres', pyarrow.string()),
+        ('prix', pyarrow.float64()),
+        ('stock', pyarrow.int64()),
+        ('categorie', pyarrow.string()),
+        ('date_creation', pyarrow.timestamp('us'))
+    ])
+    tampon = TamponFlux()
+    if format_fichier == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(tampon, schema, compression='zstd')
+    else:
+        writer = pyarrow.ipc.new_file(tampon, schema)
+    
+    for lot in itertools.chain([premier_lot], lots):
+        colonnes = {colonne: [produit[colonne] for produit in lot] for colonne in COLONNES_EXPORT}
+        colonnes['date_creation'] = [convertir_date(valeur) for valeur in colonnes['date_creation']]
+        batch = pyarrow.RecordBatch.from_pydict(colonnes, schema=schema)
+        if format_fichier == 'parquet':
+            writer.write_batch(batch)
+        else:
+            writer.write(batch)
+        yield tampon.vider()
+    
+    writer.close()
+    yield tampon.vider()
+
+# Classeur XLSX minimal écrit en flux (chaînes en ligne, sans table partagée)
+XLSX_FICHIERS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Products" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'),
+    # Styles : 0 = défaut, 1 = prix (0.00), 2 = date (numFmt 22)
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="4"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="2" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+        '</styleSheet>'),
+}
+_XML_INTERDITS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_EPOQUE_EXCEL = datetime(1899, 12, 30)
+
+def _cellule_texte(valeur, style=0):
+    texte = echapper_xml(_XML_INTERDITS.sub('', '' if valeur is None else str(valeur)))
+    attribut_style = f' s="{style}"' if style else ''
+    return f'<c t="inlineStr"{attribut_style}><is><t>{texte}</t></is></c>'
+
+def _cellule_nombre(valeur, style=0):
+    if valeur is None:
+        return '<c/>'
+    attribut_style = f' s="{style}"' if style else ''
+    return f'<c{attribut_style}><v>{valeur}</v></c>'
+
+def generer_xlsx(premier_lot, lots):
+    """Classeur XLSX écrit dans un zip en flux : une ligne par produit, types numériques et dates"""
+    tampon = TamponFlux()
+    with zipfile.ZipFile(tampon, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for nom, contenu in XLSX_FICHIERS.items():
+            archive.writestr(nom, contenu)
+        yield tampon.vider()
         
-        # PrÃ©parer la rÃ©ponse
-        output.seek(0)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as feuille:
+            entete = ''.join(_cellule_texte(titre, 3) for titre in
+                             ['ID', 'Name', 'Barcode', 'Price ($)', 'Stock', 'Category', 'Created at'])
+            feuille.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                f'<sheetData><row>{entete}</row>').encode('utf-8'))
+            
+            for lot in itertools.chain([premier_lot], lots):
+                lignes = []
+                for produit in lot:
+                    date = convertir_date(produit['date_creation'])
+                    serie = (date - _EPOQUE_EXCEL).total_seconds() / 86400 if date else None
+                    lignes.append(
+                        '<row>'
+                        + _cellule_nombre(produit['id'])
+                        + _cellule_texte(produit['nom'])
+                        + _cellule_texte(produit['code_barres'])
+                        + _cellule_nombre(produit['prix'], 1)
+                        + _cellule_nombre(produit['stock'])
+                        + _cellule_texte(produit['categorie'])
+                        + _cellule_nombre(serie, 2)
+                        + '</row>')
+                feuille.write(''.join(lignes).encode('utf-8'))
+                yield tampon.vider()
+            
+            feuille.write(b'</sheetData></worksheet>')
+    yield tampon.vider()
+
+FORMATS_EXPORT = {
+    # format: (type MIME, extension, compression gzip du flux)
+    'csv': ('text/csv; charset=utf-8', 'csv', True),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx', False),
+    'parquet': ('application/vnd.apache.parquet', 'parquet', False),
+    'arrow': ('application/vnd.apache.arrow.file', 'arrow', True),
+}
+
+@app.route('/export')
+def export_csv():
+    """Export des produits en flux (?format=csv|xlsx|parquet|arrow, CSV par défaut)"""
+    try:
+        format_fichier = request.args.get('format', 'csv').strip().lower()
+        if format_fichier not in FORMATS_EXPORT:
+            return render_template('error.html', error=f"Unknown export format: {format_fichier}")
+        if format_fichier in ('parquet', 'arrow') and pyarrow is None:
+            return render_template('error.html', error=f"The {format_fichier} export requires pyarrow")
         
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'text/csv; charset=utf-8'
-        response.headers['Content-Disposition'] = f'attachment; filename=produits_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        lots = iterer_lots_produits()
+        premier_lot = next(lots, None)
         
-        return response
+        if not premier_lot:
+            return render_template('error.html', error="No product to export")
+        
+        if format_fichier == 'csv':
+            morceaux = generer_csv(premier_lot, lots)
+        elif format_fichier == 'xlsx':
+            morceaux = generer_xlsx(premier_lot, lots)
+        else:
+            morceaux = generer_arrow(premier_lot, lots, format_fichier)
+        
+        content_type, extension, compresser = FORMATS_EXPORT[format_fichier]
+        return reponse_flux(morceaux, content_type, extension, compresser)
         
     except Exception as e:
+        annuler_transaction()
         return render_template('error.html', error=str(e))
 
+# Import groupé du catalogue (upsert sur code_barres)
+IMPORT_TAILLE_LOT = int(os.environ.get('IMPORT_TAILLE_LOT', '1000'))
+IMPORT_ERREURS_MAX = int(os.environ.get('IMPORT_ERREURS_MAX', '1000'))
+
+# En-têtes acceptés : noms des colonnes ou en-têtes de l'export CSV
+ALIAS_IMPORT = {
+    'nom': 'nom', 'name': 'nom',
+    'code_barres': 'code_barres', 'barcode': 'code_barres', 'code': 'code_barres',
+    'prix': 'prix', 'price': 'prix', 'price ($)': 'prix',
+    'stock': 'stock',
+    'categorie': 'categorie', 'category': 'categorie',
+}
+
+def lire_lignes_import(flux, format_fichier):
+    """Itère (numéro de ligne, dict, erreur) depuis un flux texte CSV ou NDJSON"""
+    if format_fichier == 'ndjson':
+        for numero, texte in enumerate(flux, start=1):
+            if not texte.strip():
+                continue
+            try:
+                ligne = json.loads(texte)
+            except ValueError as e:
+                yield numero, None, f'Invalid JSON: {e}'
+                continue
+            if not isinstance(ligne, dict):
+                yield numero, None, 'Expected a JSON object'
+                continue
+            yield numero, {ALIAS_IMPORT.get(str(cle).strip().lower(), cle): valeur
+                           for cle, valeur in ligne.items()}, None
+    else:
+        reader = csv.reader(flux)
+        entete = next(reader, None) or []
+        colonnes = [ALIAS_IMPORT.get(colonne.strip().lower()) for colonne in entete]
+        for numero, valeurs in enumerate(reader, start=2):
+            if not any(valeur.strip() for valeur in valeurs):
+                continue
+            yield numero, {colonne: valeur for colonne, valeur in zip(colonnes, valeurs) if colonne}, None
+
+def valider_ligne_import(ligne):
+    """(nom, code_barres, prix, stock ou None, categorie) ; ValueError avec le message sinon"""
+    nom = str(ligne.get('nom') or '').strip()
+    code_barres = str(ligne.get('code_barres') or '').strip()
+    categorie = str(ligne.get('categorie') or '').strip() or 'Other'
+    prix = str(ligne.get('prix') if ligne.get('prix') is not None else '').strip()
+    stock = str(ligne.get('stock') if ligne.get('stock') is not None else '').strip()
+    
+    if not nom:
+        raise ValueError('Product name is required')
+    if not code_barres:
+        raise ValueError('Barcode is required')
+    try:
+        prix = float(prix or 0)
+    except ValueError:
+        raise ValueError(f'Invalid price: {prix}')
+    if prix < 0:
+        raise ValueError(f'Invalid price: {prix}')
+    
+    # Stock absent : conservé pour un produit existant, 0 pour un nouveau
+    if stock:
+        try:
+            stock = int(stock)
+        except ValueError:
+            raise ValueError(f'Invalid stock: {stock}')
+        if stock < 0:
+            raise ValueError(f'Invalid stock: {stock}')
+    else:
+        stock = None
+    
+    return nom, code_barres, prix, stock, categorie
+
+# Clause d'upsert selon que la ligne fournit le stock ou non
+UPSERT_PRODUITS = {
+    True: ''' ON CONFLICT (code_barres) DO UPDATE SET
+        nom = EXCLUDED.nom, prix = EXCLUDED.prix, stock = EXCLUDED.stock, categorie = EXCLUDED.categorie''',
+    False: ''' ON CONFLICT (code_barres) DO UPDATE SET
+        nom = EXCLUDED.nom, prix = EXCLUDED.prix, categorie = EXCLUDED.categorie'''
+}
+
+def ecrire_lot_import_sqlite(cursor, valides):
+    """SQLite : upsert d'un lot validé et journal de ses variations, dans la transaction en cours"""
+    # Stock actuel des codes du lot, pour journaliser les variations
+    stocks = {}
+    for tranche in tranches_in(sorted({valeurs[2] for valeurs in valides})):
+        cursor.execute(f'SELECT code_barres, stock FROM produits WHERE code_barres IN ({", ".join("?" * len(tranche))})',
+                       tranche)
+        stocks.update((ligne['code_barres'], ligne['stock']) for ligne in cursor.fetchall())
+    variations = {}
+    for _, _, code_barres, _, stock, _ in valides:
+        avant = stocks.get(code_barres, 0)
+        apres = avant if stock is None else stock
+        variations[code_barres] = variations.get(code_barres, 0) + apres - avant
+        stocks[code_barres] = apres
+    
+    # Suites consécutives avec / sans stock, pour garder l'ordre du fichier
+    for avec_stock, suite in itertools.groupby(valides, key=lambda valeurs: valeurs[4] is not None):
+        cursor.executemany(
+            'INSERT INTO produits (nom, code_barres, prix, stock, categorie) VALUES (?, ?, ?, ?, ?)'
+            + UPSERT_PRODUITS[avec_stock],
+            [(nom, code_barres, prix, stock or 0, categorie)
+             for _, nom, code_barres, prix, stock, categorie in suite])
+    
+    modifies = [code_barres for code_barres, delta in variations.items() if delta]
+    for tranche in tranches_in(modifies):
+        cursor.execute(f'SELECT id, code_barres FROM produits WHERE code_barres IN ({", ".join("?" * len(tranche))})',
+                       tranche)
+        journaliser_mouvements(cursor, [
+            (ligne['id'], variations[ligne['code_barres']], stocks[ligne['code_barres']], 'import')
+            for ligne in cursor.fetchall()], diffuser=False)
+
+def importer_produits(conn, lignes, taille_lot=IMPORT_TAILLE_LOT):
+    """Importe des lignes (numéro, dict, erreur) en upsert sur code_barres, en une transaction
+    
+    PostgreSQL : COPY par lots dans une table temporaire puis INSERT ... ON CONFLICT.
+    SQLite : tout le fichier est lu et validé avant de prendre le verrou d'écriture,
+    pour ne pas bloquer les scans pendant l'envoi, puis écrit par lots (gardés en
+    mémoire jusque-là) dans une seule transaction : un échec n'importe rien.
+    Si un même code apparaît plusieurs fois, la dernière ligne l'emporte.
+    La variation nette de stock de chaque produit est journalisée (action 'import'),
+    puis un seul événement 'catalogue' est émis pour tout l'import.
+    """
+    rapport = {'lignes': 0, 'importees': 0, 'nb_erreurs': 0, 'erreurs': []}
+    cursor = get_cursor(conn)
+    
+    def noter_erreur(numero, ligne, message):
+        rapport['nb_erreurs'] += 1
+        if len(rapport['erreurs']) < IMPORT_ERREURS_MAX:
+            rapport['erreurs'].append({
+                'ligne': numero,
+                'code_barres': (ligne or {}).get('code_barres'),
+                'message': message
+            })
+    
+    try:
+        if USE_POSTGRES:
+            cursor.execute('''
+                CREATE TEMP TABLE import_produits (
+                    ligne INTEGER, nom TEXT, code_barres TEXT, prix REAL, stock INTEGER, categorie TEXT
+                ) ON COMMIT DROP
+            ''')
+        
+        codes = set()
+        lots_valides = []
+        lignes = iter(lignes)
+        while True:
+            lot = list(itertools.islice(lignes, taille_lot))
+            if not lot:
+                break
+            
+            valides = []
+            for numero, ligne, erreur in lot:
+                rapport['lignes'] += 1
+                if erreur:
+                    noter_erreur(numero, ligne, erreur)
+                    continue
+                try:
+                    valides.append((numero,) + valider_ligne_import(ligne))
+                except ValueError as e:
+                    noter_erreur(numero, ligne, str(e))
+            
+            if USE_POSTGRES:
+                tampon = io.StringIO()
+                csv.writer(tampon).writerows(valides)
+                tampon.seek(0)
+                cursor.copy_expert('COPY import_produits (ligne, nom, code_barres, prix, stock, categorie) '
+                                   'FROM STDIN WITH (FORMAT csv)', tampon)
+            elif valides:
+                lots_valides.append(valides)
+            codes.update(valeurs[2] for valeurs in valides)
+        
+        if USE_POSTGRES:
+            # Upsert et journal en une requête : avant lit l'état précédant l'upsert
+            source, appareil = contexte_mouvement()
+            for avec_stock in (True, False):
+                cursor.execute('''
+                    WITH dernieres AS (
+                        SELECT DISTINCT ON (code_barres) *
+                        FROM import_produits
+                        ORDER BY code_barres, ligne DESC
+                    ), avant AS (
+                        SELECT p.code_barres, p.stock FROM produits p JOIN dernieres d USING (code_barres)
+                    ), ecrits AS (
+                        INSERT INTO produits (nom, code_barres, prix, stock, categorie)
+                        SELECT nom, code_barres, prix, COALESCE(stock, 0), categorie
+                        FROM dernieres
+                        WHERE (stock IS NOT NULL) = %s
+                ''' + UPSERT_PRODUITS[avec_stock] + '''
+                        RETURNING id, code_barres, stock
+                    )
+                    INSERT INTO stock_mouvements (produit_id, delta, stock_apres, action, source, appareil)
+                    SELECT e.id, e.stock - COALESCE(a.stock, 0), e.stock, 'import', %s, %s
+                    FROM ecrits e LEFT JOIN avant a USING (code_barres)
+                    WHERE e.stock <> COALESCE(a.stock, 0)
+                ''', (avec_stock, source, appareil))
+        elif lots_valides:
+            # Verrou d'écriture pris une fois le fichier entièrement lu et validé
+            cursor.execute('BEGIN IMMEDIATE')
+            for valides in lots_valides:
+                ecrire_lot_import_sqlite(cursor, valides)
+        
+        # Un seul événement pour tout l'import : les écrans rechargent le catalogue
+        if codes:
+            emettre_evenements(cursor, [('catalogue', {'action': 'import', 'nb': len(codes)})])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    
+    rapport['importees'] = len(codes)
+    cache_produits.invalider()
+    return rapport
+
+def format_import(nom_fichier, content_type):
+    """Format d'import (csv ou ndjson) d'après ?format=, l'extension ou le type MIME"""
+    format_fichier = request.args.get('format', '').strip().lower()
+    if format_fichier:
+        return format_fichier
+    if (nom_fichier or '').lower().endswith(('.ndjson', '.jsonl')) or 'ndjson' in (content_type or ''):
+        return 'ndjson'
+    return 'csv'
+
+@app.route('/import', methods=['POST'])
+def import_produits():
+    """Import groupé CSV/NDJSON (fichier multipart « fichier » ou corps brut) avec rapport par ligne"""
+    try:
+        fichier = request.files.get('fichier')
+        if fichier:
+            flux, format_fichier = fichier.stream, format_import(fichier.filename, fichier.mimetype)
+        else:
+            flux, format_fichier = request.stream, format_import('', request.mimetype)
+        if format_fichier not in ('csv', 'ndjson'):
+            return jsonify({'success': False, 'message': f'Unknown import format: {format_fichier}'}), 400
+        
+        texte = io.TextIOWrapper(flux, encoding='utf-8-sig', newline='')
+        rapport = importer_produits(get_db(), lire_lignes_import(texte, format_fichier))
+        
+        return jsonify({
+            'success': True,
+            'message': f"{rapport['importees']} product(s) imported, {rapport['nb_erreurs']} error(s)",
+            **rapport
+        })
+    
+    except Exception as e:
+        annuler_transaction()
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
+
+def erreur_api(e):
+    """Réponse JSON d'erreur (jamais mise en cache)"""
+    g.api_erreur = True
+    return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/api/produits')
+@reponse_conditionnelle
 def api_produits():
-    """API JSON des produits"""
+    """API JSON des produits, paginée (?limit=, ?curseur=, ?sort=, ?order=, ?cat=)"""
     try:
-        conn = get_db_connection()
+        conn = get_db()
         cursor = get_cursor(conn)
-        cursor.execute('SELECT * FROM produits ORDER BY nom')
-        produits = cursor.fetchall()
-        conn.close()
         
+        query = 'SELECT * FROM produits WHERE 1=1'
+        params = []
+        categorie = request.args.get('cat', '').strip()
+        if categorie:
+            query += ' AND categorie = ?'
+            params.append(categorie)
+        
+        produits, curseur_suivant = paginer(cursor, query, params,
+                                            request.args.get('sort', 'nom').strip(),
+                                            request.args.get('order', 'asc').strip(),
+                                            get_taille_page(defaut=100),
+                                            request.args.get('curseur', '').strip())
+        
+        return jsonify({
+            'success': True,
+            'count': len(produits),
+            'produits': produits,
+            'curseur_suivant': curseur_suivant
+        })
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return erreur_api(e)
+
+@app.route('/api/recherche')
+@reponse_conditionnelle
+def api_recherche():
+    """API JSON de recherche (?q=, ?cat=, ?limit=), résultats par pertinence"""
+    try:
+        recherche = request.args.get('q', '').strip()
+        if not recherche:
+            return jsonify({'success': True, 'count': 0, 'produits': []})
+        
+        produits = rechercher_produits(recherche,
+                                       request.args.get('cat', '').strip(),
+                                       limite=get_taille_page(defaut=20))
         return jsonify({
             'success': True,
             'count': len(produits),
-            'produits': rows_to_list(produits)
+            'produits': produits
         })
         
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
+        return erreur_api(e)
 
 @app.route('/api/produit/<code_barres>')
+@reponse_conditionnelle
 def api_produit_by_barcode(code_barres):
     """API pour rechercher un produit par code-barres"""
     try:
-        conn = get_db_connection()
-        cursor = get_cursor(conn)
-        query = adapt_query('SELECT * FROM produits WHERE code_barres = ?')
-        cursor.execute(query, (code_barres,))
-        produit = cursor.fetchone()
-        conn.close()
+        produit = trouver_produit_par_code(code_barres)
         
         if produit:
             return jsonify({
                 'success': True,
-                'produit': row_to_dict(produit)
+                'produit': produit
             })
         else:
             return jsonify({
@@ -977,57 +3871,86 @@ def api_produit_by_barcode(code_barres):
             })
         
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
+        return erreur_api(e)
 
 @app.route('/api/stats')
+@reponse_conditionnelle
 def api_stats():
     """API JSON des statistiques"""
     try:
-        conn = get_db_connection()
-        cursor = get_cursor(conn)
-        
-        # Stats gÃ©nÃ©rales
-        cursor.execute('SELECT COUNT(*) as total FROM produits')
-        result = cursor.fetchone()
-        total = result['total'] if USE_POSTGRES else result[0]
-        
-        cursor.execute('SELECT COUNT(*) as ruptures FROM produits WHERE stock = 0')
-        result = cursor.fetchone()
-        ruptures = result['ruptures'] if USE_POSTGRES else result[0]
-        
-        cursor.execute('SELECT COUNT(*) as stock_faible FROM produits WHERE stock > 0 AND stock <= 5')
-        result = cursor.fetchone()
-        stock_faible = result['stock_faible'] if USE_POSTGRES else result[0]
-        
-        cursor.execute('SELECT SUM(stock * prix) as valeur FROM produits')
-        result = cursor.fetchone()
-        valeur_stock = (result['valeur'] if USE_POSTGRES else result[0]) or 0
-        
-        # Top catÃ©gories
-        cursor.execute('''
-            SELECT categorie, COUNT(*) as count, SUM(stock) as stock_total 
-            FROM produits 
-            GROUP BY categorie 
-            ORDER BY count DESC 
-            LIMIT 5
-        ''')
-        top_categories = cursor.fetchall()
-        
-        conn.close()
-        
         return jsonify({
             'success': True,
-            'stats': {
-                'total_produits': total,
-                'ruptures': ruptures,
-                'stock_faible': stock_faible,
-                'valeur_stock': round(valeur_stock, 2),
-                'top_categories': rows_to_list(top_categories)
-            }
+            'stats': calculer_stats().to_dict()
         })
         
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
+        return erreur_api(e)
+
+# Routes d'exploitation (compteurs, métriques, requêtes lentes) : elles exposent
+# le SQL et l'activité de la boutique. Avec ADMIN_TOKEN, elles demandent l'en-tête
+# « Authorization: Bearer <jeton> » ; sans, elles ne répondent qu'en local.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+def acces_admin(vue):
+    """Décorateur : 403 sans le jeton ADMIN_TOKEN (ou hors de la machine s'il n'est pas défini)"""
+    @wraps(vue)
+    def enveloppe(*args, **kwargs):
+        if ADMIN_TOKEN:
+            schema, _, jeton = request.headers.get('Authorization', '').partition(' ')
+            autorise = schema.lower() == 'bearer' and hmac.compare_digest(jeton.encode('utf-8'),
+                                                                          ADMIN_TOKEN.encode('utf-8'))
+        else:
+            autorise = request.remote_addr in ('127.0.0.1', '::1')
+        if not autorise:
+            return jsonify({'success': False, 'message': 'Admin access required'}), 403
+        return vue(*args, **kwargs)
+    return enveloppe
+
+@app.route('/api/cache')
+@acces_admin
+def api_cache():
+    """Compteurs des caches et du diffuseur d'événements du worker courant"""
+    return jsonify({'success': True, 'pid': os.getpid(), 'produits': cache_produits.get_stats(),
+                    'codes_barres_svg': cache_svg.get_stats(), 'glyphes_pdf': cache_glyphes.get_stats(),
+                    'evenements': dict(get_diffuseur().stats, abonnes=get_diffuseur().abonnes)})
+
+@app.route('/metrics')
+@acces_admin
+def metrics():
+    """Métriques Prometheus (requêtes HTTP et SQL par endpoint), additionnées sur tous les workers"""
+    texte = format_prometheus(agreger_metriques(get_metriques()))
+    return Response(texte, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/admin/requetes-lentes', methods=['GET', 'DELETE'])
+@acces_admin
+def admin_requetes_lentes():
+    """Requêtes SQL lentes du worker courant, des plus récentes aux plus anciennes (DELETE : vider)
+
+    resume regroupe les entrées par SQL normalisé, de la plus coûteuse au total à la moins coûteuse.
+    """
+    if request.method == 'DELETE':
+        requetes_lentes.clear()
+        cache_plans.invalider()
+        return jsonify({'success': True})
+    
+    entrees = list(requetes_lentes)[::-1]
+    resume = {}
+    for entree in entrees:
+        groupe = resume.setdefault(entree['sql'], {'sql': entree['sql'], 'nombre': 0, 'duree_totale_ms': 0,
+                                                   'duree_max_ms': 0, 'endpoints': []})
+        groupe['nombre'] += 1
+        groupe['duree_totale_ms'] = round(groupe['duree_totale_ms'] + entree['duree_ms'], 2)
+        groupe['duree_max_ms'] = max(groupe['duree_max_ms'], entree['duree_ms'])
+        if entree['endpoint'] not in groupe['endpoints']:
+            groupe['endpoints'].append(entree['endpoint'])
+    
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'seuil_ms': REQUETES_LENTES_SEUIL_MS,
+        'resume': sorted(resume.values(), key=lambda groupe: groupe['duree_totale_ms'], reverse=True),
+        'requetes': entrees
+    })
 
 @app.route('/recherche')
 def recherche_avancee():
@@ -1048,16 +3971,17 @@ def gerer_categories():
                                      categories=get_categories(),
                                      error="Category name is required")
             
-            conn = get_db_connection()
+            conn = get_db()
             cursor = get_cursor(conn)
             query = adapt_query('INSERT INTO categories (nom, emoji, description) VALUES (?, ?, ?)')
             cursor.execute(query, (nom, emoji, description))
             conn.commit()
-            conn.close()
+            invalider_cache_categories()
             
             return redirect(url_for('gerer_categories'))
             
         except Exception as e:
+            annuler_transaction()
             return render_template('categories.html', 
                                  categories=get_categories(),
                                  error=f"Error: {str(e)}")
@@ -1068,14 +3992,14 @@ def gerer_categories():
 def supprimer_categorie(id):
     """Supprimer une catÃ©gorie"""
     try:
-        conn = get_db_connection()
+        conn = get_db()
         cursor = get_cursor(conn)
         query = adapt_query('DELETE FROM categories WHERE id = ?')
         cursor.execute(query, (id,))
         conn.commit()
-        conn.close()
+        invalider_cache_categories()
     except Exception as e:
-        pass
+        annuler_transaction()
     
     return redirect(url_for('gerer_categories'))
 
@@ -1089,6 +4013,92 @@ def favicon():
     """Favicon simple"""
     return '', 204
 
+@app.cli.command('migrer')
+def commande_migrer():
+    """Applique les migrations du schéma en attente"""
+    conn = get_db_connection()
+    appliquees = appliquer_migrations(conn)
+    version = get_schema_version(conn.cursor())
+    conn.close()
+    if appliquees:
+        print(f"✅ Migration(s) appliquée(s) : {', '.join(map(str, appliquees))}")
+    print(f"🗄️ Schema version: {version}")
+
+@app.cli.command('recalculer-stats')
+def commande_recalculer_stats():
+    """Recalcule entièrement les compteurs stats_categories"""
+    conn = get_db_connection()
+    reconstruire_stats(conn)
+    conn.close()
+    print("✅ Statistics counters rebuilt")
+
+@app.cli.command('compacter-mouvements')
+@click.option('--retention', type=int, default=MOUVEMENTS_RETENTION_JOURS, show_default=True,
+              help='Jours de mouvements détaillés conservés (0 : tout conserver)')
+def commande_compacter_mouvements(retention):
+    """Résume les mouvements par jour dans stock_journalier et purge le détail ancien"""
+    conn = get_db_connection()
+    try:
+        resumes, supprimes = compacter_mouvements(conn, retention)
+    finally:
+        conn.close()
+    print(f"✅ {resumes} daily stock row(s) written, {supprimes} movement(s) purged")
+
+@app.cli.command('importer')
+@click.argument('fichier', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'format_fichier', type=click.Choice(['csv', 'ndjson']),
+              help="Format du fichier (déduit de l'extension par défaut)")
+def commande_importer(fichier, format_fichier):
+    """Importe un catalogue CSV/NDJSON en upsert sur code_barres"""
+    if not format_fichier:
+        format_fichier = 'ndjson' if fichier.lower().endswith(('.ndjson', '.jsonl')) else 'csv'
+    
+    debut = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        with open(fichier, encoding='utf-8-sig', newline='') as flux:
+            rapport = importer_produits(conn, lire_lignes_import(flux, format_fichier))
+    finally:
+        conn.close()
+    
+    for erreur in rapport['erreurs']:
+        print(f"❌ Line {erreur['ligne']}: {erreur['message']}")
+    print(f"✅ {rapport['importees']} product(s) imported from {rapport['lignes']} line(s), "
+          f"{rapport['nb_erreurs']} error(s) in {time.perf_counter() - debut:.1f}s")
+
+@app.cli.command('etiquettes')
+@click.option('--langage', type=click.Choice(etiquettes.LANGAGES_THERMIQUES), default='zpl', show_default=True)
+@click.option('--categorie', default='', help='Ne garder que les produits de cette catégorie')
+@click.option('--largeur', type=float, default=50, show_default=True, help="Largeur de l'étiquette (mm)")
+@click.option('--hauteur', type=float, default=30, show_default=True, help="Hauteur de l'étiquette (mm)")
+@click.option('--dpi', type=click.Choice(['203', '300', '600']), default='203', show_default=True)
+@click.option('--copies', type=int, default=1, show_default=True, help='Copies par produit')
+@click.option('--sortie', type=click.File('wb'), default='-', show_default=True, help='Fichier du travail (- : sortie standard)')
+@click.option('--imprimante', help='Envoi direct en RAW à HOTE[:PORT] (port 9100 par défaut)')
+def commande_etiquettes(langage, categorie, largeur, hauteur, dpi, copies, sortie, imprimante):
+    """Génère un travail ZPL/EPL pour imprimante thermique"""
+    lots = iterer_lots_produits(categorie=categorie, ordre='categorie, nom')
+    ignorees = []
+    try:
+        morceaux = etiquettes.travail_thermique(itertools.chain.from_iterable(lots), langage,
+                                                largeur, hauteur, int(dpi), copies, ignorees)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    
+    if imprimante:
+        import socket
+        hote, _, port = imprimante.partition(':')
+        with socket.create_connection((hote, int(port or 9100)), timeout=30) as connexion:
+            for morceau in morceaux:
+                connexion.sendall(morceau)
+        print(f"✅ Labels sent to {imprimante}", file=sys.stderr)
+    else:
+        for morceau in morceaux:
+            sortie.write(morceau)
+    if ignorees:
+        print(f"⚠️ {len(ignorees)} label(s) skipped (barcode not encodable or too wide): "
+              f"{', '.join(ignorees[:etiquettes.IGNOREES_LISTEES_MAX])}", file=sys.stderr)
+
 # Initialisation de la base de données au démarrage de l'application
 try:
     init_database()
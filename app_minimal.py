@@ -13,10 +13,52 @@ import csv
 
 app = Flask(__name__)
 
+# Profil de performance SQLite (mêmes profils que app.py, voir SQLITE_PROFILS)
+#   - standard : WAL + synchronous=NORMAL (lectures et scans en parallèle)
+#   - kiosque  : WAL + synchronous=FULL, peu de mémoire (chaque commit est durable)
+#   - defaut   : réglages d'origine de SQLite
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'boutique_mobile.db')
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'standard')
+SQLITE_STATEMENT_CACHE = int(os.environ.get('SQLITE_STATEMENT_CACHE', '256'))
+
+SQLITE_PROFILS = {
+    'standard': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 268435456,   # 256 Mo
+        'cache_size': -65536,     # 64 Mo
+        'temp_store': 'MEMORY',
+    },
+    'kiosque': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'busy_timeout': 10000,
+        'mmap_size': 33554432,    # 32 Mo
+        'cache_size': -8192,      # 8 Mo
+        'temp_store': 'MEMORY',
+    },
+    'defaut': {},
+}
+
+def get_sqlite_pragmas():
+    """Réglages PRAGMA du profil SQLite actif, surcharges SQLITE_PRAGMAS comprises"""
+    pragmas = dict(SQLITE_PROFILS.get(SQLITE_PROFILE, SQLITE_PROFILS['standard']))
+    for reglage in os.environ.get('SQLITE_PRAGMAS', '').split(','):
+        if '=' in reglage:
+            nom, valeur = reglage.split('=', 1)
+            pragmas[nom.strip()] = valeur.strip()
+    return pragmas
+
 def get_db_connection():
-    """Connexion SQLite locale"""
-    conn = sqlite3.connect('boutique_mobile.db')
+    """Connexion SQLite locale (profil de performance appliqué)"""
+    pragmas = get_sqlite_pragmas()
+    conn = sqlite3.connect(SQLITE_PATH,
+                           timeout=int(pragmas.get('busy_timeout', 5000)) / 1000,
+                           cached_statements=SQLITE_STATEMENT_CACHE)
     conn.row_factory = sqlite3.Row
+    for nom, valeur in pragmas.items():
+        conn.execute(f'PRAGMA {nom} = {valeur}')
     return conn
 
 def init_database():
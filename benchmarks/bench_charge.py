@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark : charge HTTP sur les routes chaudes
+
+Lance l'application dans un processus séparé (serveur WSGI multi-thread) sur une
+base SQLite temporaire remplie d'un catalogue synthétique, puis simule en parallèle :
+  - des sessions scanner : GET /api/produit/<code> puis POST /ajuster-stock
+  - la navigation dans le catalogue : /produits et /api/produits, filtres et tris
+  - le rafraîchissement des statistiques : GET /api/stats
+  - des exports : GET /export (CSV, puis XLSX)
+
+Le débit et les latences p50/p95/p99 de chaque route sont écrits en JSON et
+comparés à la référence enregistrée (benchmarks/reference_charge.json).
+
+    python benchmarks/bench_charge.py                                  # SQLite temporaire
+    python benchmarks/bench_charge.py --postgres postgresql:///bench   # base PostgreSQL JETABLE
+    python benchmarks/bench_charge.py --url http://127.0.0.1:8000      # serveur déjà lancé (gunicorn)
+    python benchmarks/bench_charge.py --enregistrer-reference          # remplace la référence
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REFERENCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reference_charge.json')
+CATEGORIES = ['Screen', 'Battery', 'Case', 'Accessory', 'Cable', 'Tool', 'Component', 'Audio', 'Other']
+MOTS = ['iPhone', 'Samsung', 'Xiaomi', 'Pixel', 'Huawei', 'Oppo']
+TRIS = ['nom', 'prix', 'stock', 'date']
+
+def code_produit(i):
+    return f'29{i:011d}'
+
+def lignes_catalogue(nb_produits):
+    """Lignes d'import (numéro, dict, erreur) du catalogue synthétique, déterministe"""
+    for i in range(nb_produits):
+        yield i + 2, {
+            'nom': f'{MOTS[i % len(MOTS)]} {CATEGORIES[i % len(CATEGORIES)]} {i}',
+            'code_barres': code_produit(i),
+            'prix': f'{(i * 37) % 20000 / 100 + 0.5:.2f}',
+            'stock': str((i * 7) % 60),
+            'categorie': CATEGORIES[i % len(CATEGORIES)]
+        }, None
+
+def servir(port, nb_produits):
+    """Processus serveur : remplit le catalogue puis sert l'application en HTTP/1.1"""
+    sys.path.insert(0, RACINE)
+    import app as boutique
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    conn = boutique.get_db_connection()
+    try:
+        rapport = boutique.importer_produits(conn, lignes_catalogue(nb_produits))
+    finally:
+        conn.close()
+    print(f"📦 {rapport['importees']} synthetic products loaded", file=sys.stderr)
+
+    class Gestionnaire(WSGIRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    make_server('127.0.0.1', port, boutique.app, threaded=True, request_handler=Gestionnaire).serve_forever()
+
+def port_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def demarrer_serveur(args):
+    """Lance le processus serveur dans un dossier temporaire ; retourne (processus, url)"""
+    dossier = tempfile.mkdtemp(prefix='bench_charge_')
+    port = port_libre()
+    env = dict(os.environ, SQLITE_PATH=os.path.join(dossier, 'bench.db'))
+    env.pop('DATABASE_URL', None)
+    if args.postgres:
+        env['DATABASE_URL'] = args.postgres
+    processus = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serveur', str(port),
+                                  '--produits', str(args.produits)],
+                                 cwd=dossier, env=env, stdout=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    limite = time.monotonic() + 300
+    while time.monotonic() < limite:
+        if processus.poll() is not None:
+            raise RuntimeError(f'Server exited with code {processus.returncode}')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/api/stats')
+            if conn.getresponse().status == 200:
+                return processus, url
+        except OSError:
+            pass
+        time.sleep(0.2)
+    processus.terminate()
+    raise RuntimeError('Server did not start in time')
+
+class Mesures:
+    """Durées par route, hors période d'échauffement"""
+
+    def __init__(self):
+        self.verrou = threading.Lock()
+        self.durees = {}
+        self.erreurs = {}
+        self.debut_mesure = float('inf')
+
+    def noter(self, route, debut, duree, statut):
+        if debut < self.debut_mesure:
+            return
+        with self.verrou:
+            self.durees.setdefault(route, []).append(duree)
+            if statut == 0 or statut >= 400:
+                self.erreurs[route] = self.erreurs.get(route, 0) + 1
+
+class Client:
+    """Utilisateur simulé : une connexion HTTP/1.1 persistante"""
+
+    def __init__(self, url, mesures):
+        adresse = urlsplit(url)
+        self.conn = http.client.HTTPConnection(adresse.hostname, adresse.port or 80, timeout=120)
+        self.mesures = mesures
+
+    def requete(self, route, methode, chemin, corps=None):
+        entetes, donnees = {}, None
+        if corps is not None:
+            donnees = json.dumps(corps).encode()
+            entetes['Content-Type'] = 'application/json'
+        debut = time.perf_counter()
+        try:
+            self.conn.request(methode, chemin, donnees, entetes)
+            reponse = self.conn.getresponse()
+            contenu = reponse.read()
+            statut = reponse.status
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            statut, contenu = 0, b''
+        self.mesures.noter(route, debut, time.perf_counter() - debut, statut)
+        return statut, contenu
+
+# Scénarios : une itération par appel
+def scenario_scanner(client, aleatoire, codes):
+    code = aleatoire.choice(codes)
+    statut, contenu = client.requete('GET /api/produit/<code>', 'GET', f'/api/produit/{code}')
+    produit = json.loads(contenu).get('produit') if statut == 200 else None
+    if produit:
+        client.requete('POST /ajuster-stock', 'POST', '/ajuster-stock', {
+            'produit_id': produit['id'],
+            'action': aleatoire.choice(('ajouter', 'retirer')),
+            'quantite': 1
+        })
+
+def scenario_navigation(client, aleatoire, codes):
+    params = {'cat': aleatoire.choice(CATEGORIES + ['']), 'sort': aleatoire.choice(TRIS),
+              'order': aleatoire.choice(('asc', 'desc'))}
+    if aleatoire.random() < 0.5:
+        params['stock'] = aleatoire.choice(('', 'out', 'low', 'ok'))
+        if aleatoire.random() < 0.3:
+            params['q'] = aleatoire.choice(MOTS)
+        client.requete('GET /produits', 'GET', '/produits?' + urlencode(params))
+        return
+    params['limit'] = 50
+    statut, contenu = client.requete('GET /api/produits', 'GET', '/api/produits?' + urlencode(params))
+    curseur = json.loads(contenu).get('curseur_suivant') if statut == 200 else None
+    if curseur and aleatoire.random() < 0.5:
+        params['curseur'] = curseur
+        client.requete('GET /api/produits', 'GET', '/api/produits?' + urlencode(params))
+
+def scenario_stats(client, aleatoire, codes):
+    client.requete('GET /api/stats', 'GET', '/api/stats')
+
+def scenario_export(client, aleatoire, codes):
+    format_export = aleatoire.choice(('csv', 'xlsx'))
+    client.requete(f'GET /export?format={format_export}', 'GET', f'/export?format={format_export}')
+
+def charger_codes(url, maximum=5000):
+    """Codes-barres du catalogue servi, lus via /api/produits"""
+    client = Client(url, Mesures())
+    codes, curseur = [], ''
+    while len(codes) < maximum:
+        statut, contenu = client.requete('', 'GET', '/api/produits?' + urlencode({'limit': 500, 'curseur': curseur}))
+        if statut != 200:
+            break
+        page = json.loads(contenu)
+        codes.extend(produit['code_barres'] for produit in page['produits'])
+        curseur = page.get('curseur_suivant')
+        if not curseur:
+            break
+    if not codes:
+        raise RuntimeError('No product to scan on the server')
+    return codes
+
+def percentile(durees, p):
+    """Percentile au rang le plus proche d'une liste triée"""
+    return durees[max(0, min(len(durees) - 1, -(-len(durees) * p // 100) - 1))]
+
+def resumer(durees, erreurs, fenetre):
+    durees = sorted(durees)
+    return {
+        'requetes': len(durees),
+        'erreurs': erreurs,
+        'debit_rps': round(len(durees) / fenetre, 2),
+        'p50_ms': round(percentile(durees, 50) * 1000, 2),
+        'p95_ms': round(percentile(durees, 95) * 1000, 2),
+        'p99_ms': round(percentile(durees, 99) * 1000, 2),
+        'moyenne_ms': round(sum(durees) / len(durees) * 1000, 2),
+        'max_ms': round(durees[-1] * 1000, 2)
+    }
+
+def executer(args, url):
+    """Lance les utilisateurs simulés et retourne le rapport"""
+    codes = charger_codes(url)
+    mesures = Mesures()
+    utilisateurs = ([(scenario_scanner, 0)] * args.scanners + [(scenario_navigation, 0)] * args.navigateurs
+                    + [(scenario_stats, args.pause_stats)] * args.stats + [(scenario_export, args.pause_export)] * args.exports)
+    fin = time.monotonic() + args.echauffement + args.duree
+
+    def utilisateur(numero, scenario, pause):
+        client = Client(url, mesures)
+        aleatoire = random.Random(numero)
+        while time.monotonic() < fin:
+            scenario(client, aleatoire, codes)
+            if pause:
+                time.sleep(pause)
+
+    threads = [threading.Thread(target=utilisateur, args=(numero, scenario, pause), daemon=True)
+               for numero, (scenario, pause) in enumerate(utilisateurs)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.echauffement)
+    mesures.debut_mesure = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    fenetre = time.perf_counter() - mesures.debut_mesure
+
+    routes = {route: resumer(durees, mesures.erreurs.get(route, 0), fenetre)
+              for route, durees in sorted(mesures.durees.items())}
+    toutes = [duree for durees in mesures.durees.values() for duree in durees]
+    return {
+        'meta': {
+            'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'commit': version_git(),
+            'base': 'externe' if args.url else ('postgres' if args.postgres else 'sqlite'),
+            'produits': args.produits if not args.url else len(codes),
+            'duree_s': args.duree,
+            'utilisateurs': {'scanners': args.scanners, 'navigateurs': args.navigateurs,
+                             'stats': args.stats, 'exports': args.exports},
+            'python': sys.version.split()[0]
+        },
+        'total': resumer(toutes, sum(mesures.erreurs.values()), fenetre) if toutes else None,
+        'routes': routes
+    }
+
+def version_git():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RACINE, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def comparer(rapport, reference, tolerance):
+    """Écarts (%) de p95 et de débit par route par rapport à la référence ; liste des régressions"""
+    comparaison, regressions = {}, []
+    for route, actuel in rapport['routes'].items():
+        ancien = reference.get('routes', {}).get(route)
+        if not ancien or not ancien['p95_ms'] or not ancien['debit_rps']:
+            continue
+        ecart_p95 = (actuel['p95_ms'] - ancien['p95_ms']) / ancien['p95_ms']
+        ecart_debit = (actuel['debit_rps'] - ancien['debit_rps']) / ancien['debit_rps']
+        comparaison[route] = {'p95_ecart_pct': round(ecart_p95 * 100, 1), 'debit_ecart_pct': round(ecart_debit * 100, 1)}
+        if ecart_p95 > tolerance or ecart_debit < -tolerance:
+            regressions.append(route)
+    return comparaison, regressions
+
+def afficher(rapport):
+    print(f"{'Route':32s} {'req/s':>9s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'erreurs':>8s} {'Δ p95':>8s} {'Δ débit':>8s}",
+          file=sys.stderr)
+    for route, resume in rapport['routes'].items():
+        ecarts = rapport.get('comparaison', {}).get(route)
+        delta_p95 = f"{ecarts['p95_ecart_pct']:+.0f}%" if ecarts else ''
+        delta_debit = f"{ecarts['debit_ecart_pct']:+.0f}%" if ecarts else ''
+        print(f"{route:32s} {resume['debit_rps']:>9.1f} {resume['p50_ms']:>9.2f} {resume['p95_ms']:>9.2f} "
+              f"{resume['p99_ms']:>9.2f} {resume['erreurs']:>8d} {delta_p95:>8s} {delta_debit:>8s}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de charge HTTP des routes chaudes')
+    parser.add_argument('--produits', type=int, default=20000, help='Taille du catalogue synthétique')
+    parser.add_argument('--duree', type=float, default=20, help='Durée de mesure (s)')
+    parser.add_argument('--echauffement', type=float, default=3, help='Durée non mesurée au démarrage (s)')
+    parser.add_argument('--scanners', type=int, default=4, help='Sessions scanner simultanées')
+    parser.add_argument('--navigateurs', type=int, default=2, help='Utilisateurs parcourant le catalogue')
+    parser.add_argument('--stats', type=int, default=1, help='Écrans rafraîchissant les statistiques')
+    parser.add_argument('--pause-stats', type=float, default=0.5, help='Intervalle de rafraîchissement des stats (s)')
+    parser.add_argument('--exports', type=int, default=1, help='Utilisateurs lançant des exports')
+    parser.add_argument('--pause-export', type=float, default=2, help='Pause entre deux exports (s)')
+    parser.add_argument('--postgres', help='URL d\'une base PostgreSQL JETABLE (le catalogue synthétique y est importé)')
+    parser.add_argument('--url', help='Serveur déjà lancé à mesurer, sans démarrage ni catalogue synthétique')
+    parser.add_argument('--reference', default=REFERENCE, help='Fichier JSON de référence')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Écart toléré avant régression (0.2 = 20%%)')
+    parser.add_argument('--enregistrer-reference', action='store_true', help='Écrit le rapport comme nouvelle référence')
+    parser.add_argument('--echouer-si-regression', action='store_true', help='Code de sortie 1 en cas de régression')
+    parser.add_argument('--sortie', help='Fichier du rapport JSON (défaut : sortie standard)')
+    parser.add_argument('--serveur', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serveur:
+        servir(args.serveur, args.produits)
+        return
+
+    processus = None
+    if args.url:
+        url = args.url.rstrip('/')
+    else:
+        processus, url = demarrer_serveur(args)
+    try:
+        rapport = executer(args, url)
+    finally:
+        if processus is not None:
+            processus.terminate()
+            processus.wait()
+
+    regressions = []
+    if args.enregistrer_reference:
+        with open(args.reference, 'w') as fichier:
+            json.dump(rapport, fichier, indent=2, ensure_ascii=False)
+            fichier.write('\n')
+    elif os.path.exists(args.reference):
+        with open(args.reference) as fichier:
+            reference = json.load(fichier)
+        rapport['comparaison'], regressions = comparer(rapport, reference, args.tolerance)
+        if {cle: reference['meta'].get(cle) for cle in ('base', 'produits', 'utilisateurs')} != \
+                {cle: rapport['meta'][cle] for cle in ('base', 'produits', 'utilisateurs')}:
+            # Mesures non comparables : écarts affichés, mais jamais comptés comme régressions
+            print('⚠️ Reference was recorded with other settings, deltas are indicative only '
+                  'and regressions are not checked', file=sys.stderr)
+            rapport['comparaison_indicative'] = True
+            regressions = []
+        rapport['regressions'] = regressions
+
+    afficher(rapport)
+    texte = json.dumps(rapport, indent=2, ensure_ascii=False)
+    if args.sortie:
+        with open(args.sortie, 'w') as fichier:
+            fichier.write(texte + '\n')
+    else:
+        print(texte)
+    if regressions:
+        print(f"❌ Regression on: {', '.join(regressions)}", file=sys.stderr)
+        if args.echouer_si_regression:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark : connexions ouvertes par requête sur les pages principales
+
+Lance l'application sur une base SQLite temporaire, compte les appels à
+sqlite3.connect() pendant N requêtes par route et affiche le nombre de
+connexions ouvertes par requête ainsi que la latence moyenne.
+
+    python benchmarks/bench_connexions.py              # pool actif (défaut)
+    DB_POOL_SIZE=0 python benchmarks/bench_connexions.py   # sans pool
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUTES = ['/', '/produits', '/statistiques', '/api/stats', '/api/produit/1234567890123']
+REQUETES_PAR_ROUTE = int(os.environ.get('BENCH_REQUETES', '200'))
+
+_connect_original = sqlite3.connect
+compteur = {'connexions': 0}
+
+def connect_compte(*args, **kwargs):
+    compteur['connexions'] += 1
+    return _connect_original(*args, **kwargs)
+
+def main():
+    dossier = tempfile.mkdtemp(prefix='bench_boutique_')
+    os.chdir(dossier)
+    sys.path.insert(0, RACINE)
+    sqlite3.connect = connect_compte
+
+    import app as boutique
+    client = boutique.app.test_client()
+
+    print(f"DB_POOL_SIZE={os.environ.get('DB_POOL_SIZE', 'défaut')} - {REQUETES_PAR_ROUTE} requêtes par route")
+    print(f"{'Route':35s} {'connexions/requête':>20s} {'ms/requête':>12s}")
+    for route in ROUTES:
+        client.get(route)  # échauffement
+        compteur['connexions'] = 0
+        debut = time.perf_counter()
+        for _ in range(REQUETES_PAR_ROUTE):
+            client.get(route)
+        duree = time.perf_counter() - debut
+        par_requete = compteur['connexions'] / REQUETES_PAR_ROUTE
+        print(f"{route:35s} {par_requete:>20.2f} {duree * 1000 / REQUETES_PAR_ROUTE:>12.3f}")
+
+if __name__ == '__main__':
+    main()
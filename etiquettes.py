@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+🏷️ Étiquettes et codes-barres (Code128 et EAN-13) en pur Python
+
+Les encodeurs produisent une suite de modules ('1' = barre, '0' = espace) ;
+les rendus (SVG, ...) travaillent ensuite sur les barres de cette suite.
+"""
+
+import itertools
+import struct
+import zlib
+from dataclasses import dataclass
+from xml.sax.saxutils import escape as echapper_xml
+
+FORMATS = ('auto', 'code128', 'ean13')
+# À incrémenter à chaque changement du rendu : fait partie des URL et ETag mis
+# en cache par les navigateurs et de la clé du cache disque des PNG
+VERSION_ENCODEUR = 1
+
+# Code128 : largeurs barre/espace des 107 symboles (valeurs 0 à 106)
+CODE128_MOTIFS = [
+    '212222', '222122', '222221', '121223', '121322', '131222', '122213', '122312', '132212', '221213',
+    '221312', '231212', '112232', '122132', '122231', '113222', '123122', '123221', '223211', '221132',
+    '221231', '213212', '223112', '312131', '311222', '321122', '321221', '312212', '322112', '322211',
+    '212123', '212321', '232121', '111323', '131123', '131321', '112313', '132113', '132311', '211313',
+    '231113', '231311', '112133', '112331', '132131', '113123', '113321', '133121', '313121', '211331',
+    '231131', '213113', '213311', '213131', '311123', '311321', '331121', '312113', '312311', '332111',
+    '314111', '221411', '431111', '111224', '111422', '121124', '121421', '141122', '141221', '112214',
+    '112412', '122114', '122411', '142112', '142211', '241211', '221114', '413111', '241112', '134111',
+    '111242', '121142', '121241', '114212', '124112', '124211', '411212', '421112', '421211', '212141',
+    '214121', '412121', '111143', '111341', '131141', '114113', '114311', '411113', '411311', '113141',
+    '114131', '311141', '411131', '211412', '211214', '211232', '2331112',
+]
+CODE128_CODE_B = 100
+CODE128_CODE_C = 99
+CODE128_START_B = 104
+CODE128_START_C = 105
+CODE128_STOP = 106
+
+# EAN-13 : jeux L et G de la partie gauche, R de la partie droite
+EAN_L = ['0001101', '0011001', '0010011', '0111101', '0100011',
+         '0110001', '0101111', '0111011', '0110111', '0001011']
+EAN_R = [''.join('1' if bit == '0' else '0' for bit in motif) for motif in EAN_L]
+EAN_G = [motif[::-1] for motif in EAN_R]
+# Parité des 6 chiffres de gauche selon le premier chiffre
+EAN_PARITES = ['LLLLLL', 'LLGLGG', 'LLGGLG', 'LLGGGL', 'LGLLGG',
+               'LGGLLG', 'LGGGLL', 'LGLGLG', 'LGLGGL', 'LGGLGL']
+
+def chiffre_controle_ean13(chiffres):
+    """Chiffre de contrôle EAN-13 des 12 premiers chiffres"""
+    somme = sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(chiffres[:12]))
+    return str((10 - somme % 10) % 10)
+
+def est_ean13(code):
+    """Vrai si code est un EAN-13 complet avec un chiffre de contrôle correct"""
+    return len(code) == 13 and code.isdigit() and chiffre_controle_ean13(code) == code[12]
+
+def encoder_ean13(code):
+    """(modules, texte) ; 12 chiffres : le contrôle est calculé, 13 chiffres : il est vérifié"""
+    if not code.isdigit() or len(code) not in (12, 13):
+        raise ValueError(f'EAN-13 needs 12 or 13 digits: {code}')
+    controle = chiffre_controle_ean13(code)
+    if len(code) == 13 and code[12] != controle:
+        raise ValueError(f'Invalid EAN-13 check digit: {code} (expected {controle})')
+    code = code[:12] + controle
+
+    parites = EAN_PARITES[int(code[0])]
+    gauche = ''.join((EAN_L if parite == 'L' else EAN_G)[int(c)] for parite, c in zip(parites, code[1:7]))
+    droite = ''.join(EAN_R[int(c)] for c in code[7:])
+    return '101' + gauche + '01010' + droite + '101', code
+
+def _longueur_chiffres(code, debut):
+    fin = debut
+    while fin < len(code) and code[fin].isdigit():
+        fin += 1
+    return fin - debut
+
+def valeurs_code128(code):
+    """Symboles Code128 (départ, données, contrôle, arrêt)
+
+    Jeu B pour le texte, bascule en jeu C (paires de chiffres) sur les suites
+    d'au moins 4 chiffres, ce qui raccourcit nettement les codes numériques.
+    """
+    if not code:
+        raise ValueError('Empty barcode')
+    for caractere in code:
+        if not 32 <= ord(caractere) <= 127:
+            raise ValueError(f'Character not encodable in Code128: {caractere!r}')
+
+    suite = _longueur_chiffres(code, 0)
+    jeu = 'C' if suite % 2 == 0 and (suite >= 4 or suite == len(code) == 2) else 'B'
+    valeurs = [CODE128_START_C if jeu == 'C' else CODE128_START_B]
+
+    i = 0
+    while i < len(code):
+        suite = _longueur_chiffres(code, i)
+        if jeu == 'C':
+            if suite >= 2:
+                valeurs.append(int(code[i:i + 2]))
+                i += 2
+                continue
+            valeurs.append(CODE128_CODE_B)
+            jeu = 'B'
+        # Jeu B : bascule en C si assez de chiffres suivent (nombre pair)
+        if suite >= 4 and (suite >= 6 or i + suite == len(code)):
+            if suite % 2:
+                valeurs.append(ord(code[i]) - 32)
+                i += 1
+            valeurs.append(CODE128_CODE_C)
+            jeu = 'C'
+            continue
+        valeurs.append(ord(code[i]) - 32)
+        i += 1
+
+    controle = (valeurs[0] + sum(position * valeur for position, valeur in enumerate(valeurs[1:], start=1))) % 103
+    return valeurs + [controle, CODE128_STOP]
+
+def encoder_code128(code):
+    """(modules, texte) du code en Code128"""
+    modules = []
+    for valeur in valeurs_code128(code):
+        for position, largeur in enumerate(CODE128_MOTIFS[valeur]):
+            modules.append(('1' if position % 2 == 0 else '0') * int(largeur))
+    return ''.join(modules), code
+
+def encoder(code, format_code='auto'):
+    """(format, modules, texte) ; 'auto' choisit EAN-13 pour un EAN-13 valide, Code128 sinon"""
+    code = str(code).strip()
+    if format_code not in FORMATS:
+        raise ValueError(f'Unknown barcode format: {format_code}')
+    if format_code == 'auto':
+        format_code = 'ean13' if est_ean13(code) else 'code128'
+    modules, texte = encoder_ean13(code) if format_code == 'ean13' else encoder_code128(code)
+    return format_code, modules, texte
+
+def barres(modules):
+    """Liste (position, largeur) des barres, en modules"""
+    resultat = []
+    debut = None
+    for position, bit in enumerate(modules + '0'):
+        if bit == '1' and debut is None:
+            debut = position
+        elif bit == '0' and debut is not None:
+            resultat.append((debut, position - debut))
+            debut = None
+    return resultat
+
+ZONE_CALME = 10  # modules blancs de part et d'autre
+
+def chemin_svg(modules, module=2, hauteur=60, x=0, y=0):
+    """Attribut d d'un <path> unique dessinant toutes les barres"""
+    return ''.join(f'M{x + debut * module} {y}h{largeur * module}v{hauteur}h{-largeur * module}z'
+                   for debut, largeur in barres(modules))
+
+def dessin_code_barres(code, format_code='auto', module=2, hauteur=60, texte=True):
+    """(largeur, hauteur totale, éléments SVG) du code-barres, sans l'élément englobant"""
+    format_code, modules, libelle = encoder(code, format_code)
+    largeur = (len(modules) + 2 * ZONE_CALME) * module
+    taille_texte = 12 if texte else 0
+    hauteur_totale = hauteur + (taille_texte + 6 if texte else 0)
+
+    elements = (f'<rect width="{largeur}" height="{hauteur_totale}" fill="#fff"/>'
+                f'<path fill="#000" d="{chemin_svg(modules, module, hauteur, x=ZONE_CALME * module)}"/>')
+    if texte:
+        elements += (f'<text x="{largeur / 2:g}" y="{hauteur + taille_texte + 2}" text-anchor="middle" '
+                     f'font-family="monospace" font-size="{taille_texte}">{echapper_xml(libelle)}</text>')
+    return largeur, hauteur_totale, elements
+
+def svg_code_barres(dessin):
+    """Document SVG autonome d'un dessin de code-barres"""
+    largeur, hauteur, elements = dessin
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{largeur}" height="{hauteur}" '
+            f'viewBox="0 0 {largeur} {hauteur}">{elements}</svg>')
+
+def symbole_svg(identifiant, dessin):
+    """<symbol> réutilisable avec <use href="#identifiant"/>"""
+    largeur, hauteur, elements = dessin
+    return f'<symbol id="{echapper_xml(identifiant)}" viewBox="0 0 {largeur} {hauteur}">{elements}</symbol>'
+
+def sprite_svg(symboles, autonome=True):
+    """Sprite SVG regroupant des <symbol> ; autonome=False pour l'inclure masqué dans une page HTML"""
+    if autonome:
+        return f'<svg xmlns="http://www.w3.org/2000/svg">{"".join(symboles)}</svg>'
+    return f'<svg xmlns="http://www.w3.org/2000/svg" style="display: none">{"".join(symboles)}</svg>'
+
+# Planches PDF : formats d'étiquettes standard (dimensions en mm)
+MM = 72 / 25.4
+A4 = (210, 297)
+
+@dataclass(frozen=True)
+class Planche:
+    colonnes: int
+    lignes: int
+    largeur: float
+    hauteur: float
+    marge_gauche: float
+    marge_haut: float
+    page: tuple = A4
+
+    @property
+    def par_page(self):
+        return self.colonnes * self.lignes
+
+PLANCHES = {
+    'a4-3x8': Planche(3, 8, 70, 37, 0, 0.5),
+    'a4-4x10': Planche(4, 10, 48.5, 25.4, 8, 21.5),
+}
+
+def texte_pdf(texte):
+    """Chaîne littérale PDF (WinAnsiEncoding) échappée"""
+    texte = str(texte).encode('cp1252', 'replace').decode('latin-1')
+    return '(' + texte.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') + ')'
+
+def chemin_pdf(modules):
+    """Rectangles des barres en unités de module (hauteur 1), à placer avec un cm"""
+    return ' '.join(f'{debut} 0 {largeur} 1 re' for debut, largeur in barres(modules)) + ' f'
+
+def contenu_etiquette(etiquette, glyphe, x, y, largeur, hauteur):
+    """Opérateurs PDF d'une étiquette (nom, code-barres, code et prix) ; x, y = coin bas gauche en pt"""
+    marge = 2 * MM
+    taille_nom = min(9, hauteur * 0.16)
+    taille_code = min(8, hauteur * 0.14)
+    utile = largeur - 2 * marge
+
+    nom = etiquette['nom']
+    max_caracteres = int(utile / (0.5 * taille_nom))
+    if len(nom) > max_caracteres:
+        nom = nom[:max_caracteres - 1] + '…'
+    ligne_code = f"{etiquette['code_barres']}  ${etiquette['prix']:.2f}"
+    largeur_code = len(ligne_code) * 0.6 * taille_code  # Courier : 0,6 em par caractère
+
+    ops = [f'BT /F1 {taille_nom:.2f} Tf {x + marge:.2f} {y + hauteur - marge - taille_nom:.2f} Td {texte_pdf(nom)} Tj ET',
+           f'BT /F2 {taille_code:.2f} Tf {x + (largeur - largeur_code) / 2:.2f} {y + marge:.2f} Td {texte_pdf(ligne_code)} Tj ET']
+
+    if glyphe:
+        nb_modules, chemin = glyphe
+        module = utile / (nb_modules + 2 * ZONE_CALME)
+        bas = y + marge + taille_code + 2
+        haut_barres = hauteur - 2 * marge - taille_nom - taille_code - 5
+        ops.append(f'q {module:.4f} 0 0 {haut_barres:.2f} {x + marge + ZONE_CALME * module:.2f} {bas:.2f} cm {chemin} Q')
+    return '\n'.join(ops)
+
+def pdf_planches(etiquettes, planche, glyphe):
+    """Génère un PDF de planches d'étiquettes page par page (morceaux de bytes)
+
+    glyphe(code) retourne (nb de modules, chemin PDF) ou None si le code n'est
+    pas encodable ; il est appelé une fois par étiquette et peut être mis en cache.
+    """
+    largeur_page, hauteur_page = planche.page[0] * MM, planche.page[1] * MM
+    position = 0
+    decalages = {}
+    pages = []
+    prochain_numero = 5  # 1 catalogue, 2 arbre des pages, 3-4 polices
+
+    def objet(numero, corps):
+        nonlocal position
+        decalages[numero] = position
+        donnees = f'{numero} 0 obj\n'.encode('latin-1') + corps + b'\nendobj\n'
+        position += len(donnees)
+        return donnees
+
+    def allouer():
+        nonlocal prochain_numero
+        prochain_numero += 1
+        return prochain_numero - 1
+
+    entete = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    position = len(entete)
+    yield entete
+    yield objet(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+    yield objet(4, b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>')
+
+    etiquettes = iter(etiquettes)
+    while True:
+        lot = list(itertools.islice(etiquettes, planche.par_page))
+        if not lot:
+            break
+
+        ops = []
+        for index, etiquette in enumerate(lot):
+            colonne, ligne = index % planche.colonnes, index // planche.colonnes
+            x = (planche.marge_gauche + colonne * planche.largeur) * MM
+            y = hauteur_page - (planche.marge_haut + (ligne + 1) * planche.hauteur) * MM
+            ops.append(contenu_etiquette(etiquette, glyphe(etiquette['code_barres']),
+                                         x, y, planche.largeur * MM, planche.hauteur * MM))
+        flux = zlib.compress('\n'.join(ops).encode('latin-1'))
+
+        numero_contenu, numero_page = allouer(), allouer()
+        yield objet(numero_contenu, f'<< /Length {len(flux)} /Filter /FlateDecode >>\nstream\n'.encode('latin-1')
+                    + flux + b'\nendstream')
+        yield objet(numero_page, (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {largeur_page:.2f} {hauteur_page:.2f}] '
+            f'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {numero_contenu} 0 R >>').encode('latin-1'))
+        pages.append(numero_page)
+
+    kids = ' '.join(f'{numero} 0 R' for numero in pages)
+    yield objet(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>'.encode('latin-1'))
+    yield objet(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+    taille = prochain_numero
+    xref = [f'xref\n0 {taille}\n', '0000000000 65535 f \n']
+    xref.extend(f'{decalages[numero]:010d} 00000 n \n' for numero in range(1, taille))
+    xref.append(f'trailer\n<< /Size {taille} /Root 1 0 R >>\nstartxref\n{position}\n%%EOF\n')
+    yield ''.join(xref).encode('latin-1')
+
+# Imprimantes thermiques : travaux ZPL / EPL, codes-barres rendus par l'imprimante
+LANGAGES_THERMIQUES = ('zpl', 'epl')
+RESOLUTIONS = (203, 300, 600)
+HAUTEUR_BARRES_MIN_MM = 5
+IGNOREES_LISTEES_MAX = 50  # codes ignorés cités dans le commentaire de fin de travail
+
+def _champ_zpl(texte):
+    """Donnée de champ ZPL encodée pour ^FH (caractères de contrôle en hexadécimal)"""
+    return ''.join(f'_{ord(c):02X}' if c in '_^~' else c for c in str(texte))
+
+def _champ_epl(texte):
+    return '"' + str(texte).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def mise_en_page_zpl(largeur, hauteur):
+    """(marge, taille du nom, hauteur des barres) d'une étiquette ZPL, en points"""
+    marge = max(8, largeur // 25)
+    taille_nom = max(16, hauteur // 7)
+    return marge, taille_nom, hauteur - 2 * marge - 2 * taille_nom - 40  # place du texte lisible sous les barres
+
+def mise_en_page_epl(largeur, hauteur):
+    """(marge, hauteur des barres) d'une étiquette EPL, en points"""
+    marge = max(8, largeur // 25)
+    return marge, hauteur - 2 * marge - 3 * 24 - 40
+
+def position_barres(code, modules, largeur, marge, hauteur_barres):
+    """(module, x) des barres centrées ; ValueError si elles ne tiennent pas sur l'étiquette"""
+    if hauteur_barres <= 0:
+        raise ValueError('Label too short for a barcode')
+    module = max(1, min(4, (largeur - 2 * marge) // (len(modules) + 2 * ZONE_CALME)))
+    x_barres = (largeur - module * len(modules)) // 2
+    if x_barres < marge:
+        raise ValueError(f'Barcode too wide for the label: {code}')
+    return module, x_barres
+
+def etiquette_zpl(etiquette, largeur, hauteur, copies):
+    """Étiquette ZPL (dimensions en points imprimante)"""
+    format_code, modules, _ = encoder(etiquette['code_barres'])
+    marge, taille_nom, hauteur_barres = mise_en_page_zpl(largeur, hauteur)
+    module, x_barres = position_barres(etiquette['code_barres'], modules, largeur, marge, hauteur_barres)
+
+    if format_code == 'ean13':
+        symbole = f'^BEN,{hauteur_barres},Y,N^FD{etiquette["code_barres"][:12]}^FS'
+    else:
+        symbole = f'^BCN,{hauteur_barres},Y,N,N,A^FH^FD{_champ_zpl(etiquette["code_barres"])}^FS'
+    return (
+        f'^XA^CI28^PW{largeur}^LL{hauteur}'
+        f'^FO{marge},{marge}^A0N,{taille_nom},{taille_nom}^FB{largeur - 2 * marge},1,0,L'
+        f'^FH^FD{_champ_zpl(etiquette["nom"])}^FS'
+        f'^FO{x_barres},{marge + taille_nom + 6}^BY{module},2,{hauteur_barres}{symbole}'
+        f'^FO{marge},{hauteur - marge - taille_nom}^A0N,{taille_nom},{taille_nom}'
+        f'^FB{largeur - 2 * marge},1,0,R^FD${etiquette["prix"]:.2f}^FS'
+        f'^PQ{copies}^XZ\n'
+    )
+
+def etiquette_epl(etiquette, largeur, hauteur, copies):
+    """Étiquette EPL2 (dimensions en points imprimante)"""
+    format_code, modules, _ = encoder(etiquette['code_barres'])
+    marge, hauteur_barres = mise_en_page_epl(largeur, hauteur)
+    module, x_barres = position_barres(etiquette['code_barres'], modules, largeur, marge, hauteur_barres)
+
+    if format_code == 'ean13':
+        symbole = f'B{x_barres},{marge + 30},0,E30,{module},{module},{hauteur_barres},B,"{etiquette["code_barres"][:12]}"'
+    else:
+        symbole = f'B{x_barres},{marge + 30},0,1,{module},{module},{hauteur_barres},B,{_champ_epl(etiquette["code_barres"])}'
+    return '\n'.join([
+        '', 'N', f'q{largeur}', f'Q{hauteur},24',
+        f'A{marge},{marge},0,3,1,1,N,{_champ_epl(etiquette["nom"])}',
+        symbole,
+        f'A{marge},{hauteur - marge - 24},0,3,1,1,N,"${etiquette["prix"]:.2f}"',
+        f'P1,{copies}', ''
+    ])
+
+def commentaire_ignorees(langage, ignorees):
+    """Commentaire de fin de travail (rien d'imprimé) listant les codes ignorés"""
+    codes = ', '.join(ignorees[:IGNOREES_LISTEES_MAX]) + (', ...' if len(ignorees) > IGNOREES_LISTEES_MAX else '')
+    texte = f'Skipped {len(ignorees)} label(s), barcode not encodable or too wide: {codes}'
+    if langage == 'zpl':
+        # Format sans champ : le commentaire ^FX n'imprime rien
+        return '^XA^FX' + ''.join(' ' if c in '^~' else c for c in texte) + '^FS^XZ\n'
+    return '\n; ' + texte.replace('\r', ' ').replace('\n', ' ') + '\n'
+
+def travail_thermique(etiquettes, langage='zpl', largeur_mm=50, hauteur_mm=30, dpi=203, copies=1, ignorees=None):
+    """Générateur de bytes d'un travail d'impression ZPL ou EPL, une étiquette par produit
+
+    Les paramètres sont vérifiés immédiatement (ValueError), y compris la place
+    laissée aux barres. Les codes non encodables ou plus larges que l'étiquette
+    sont ignorés : ajoutés à la liste ignorees si elle est fournie, et cités dans
+    un commentaire à la fin du travail.
+    """
+    if langage not in LANGAGES_THERMIQUES:
+        raise ValueError(f'Unknown printer language: {langage}')
+    if dpi not in RESOLUTIONS:
+        raise ValueError(f'Unsupported resolution: {dpi} dpi')
+    if not (20 <= largeur_mm <= 120 and 15 <= hauteur_mm <= 150):
+        raise ValueError('Label size must be 20-120 mm wide and 15-150 mm high')
+    if not 1 <= copies <= 100:
+        raise ValueError('copies must be 1-100')
+
+    largeur, hauteur = round(largeur_mm * dpi / 25.4), round(hauteur_mm * dpi / 25.4)
+    if langage == 'zpl':
+        hauteur_barres = mise_en_page_zpl(largeur, hauteur)[2]
+    else:
+        hauteur_barres = mise_en_page_epl(largeur, hauteur)[1]
+    if hauteur_barres < HAUTEUR_BARRES_MIN_MM * dpi / 25.4:
+        raise ValueError(f'Label too short: {hauteur_mm:g} mm leaves {max(0, hauteur_barres) * 25.4 / dpi:.1f} mm '
+                         f'for the bars at {largeur_mm:g} mm wide (min. {HAUTEUR_BARRES_MIN_MM} mm)')
+    generer = etiquette_zpl if langage == 'zpl' else etiquette_epl
+    encodage = 'utf-8' if langage == 'zpl' else 'cp1252'
+
+    if ignorees is None:
+        ignorees = []
+
+    def morceaux():
+        lot = []
+        for etiquette in etiquettes:
+            try:
+                lot.append(generer(etiquette, largeur, hauteur, copies))
+            except ValueError:
+                ignorees.append(str(etiquette['code_barres']))
+                continue
+            if len(lot) >= 500:
+                yield ''.join(lot).encode(encodage, 'replace')
+                lot = []
+        if ignorees:
+            lot.append(commentaire_ignorees(langage, ignorees))
+        yield ''.join(lot).encode(encodage, 'replace')
+
+    return morceaux()
+
+# Images PNG : bitmap 1 bit, module de 0,33 mm (EAN-13 à 100 %) arrondi au pixel
+RESOLUTIONS_PNG = (72, 96, 150, 203, 300, 600)
+X_DIMENSION_MM = 0.33
+
+def _bloc_png(type_bloc, donnees):
+    return (struct.pack('>I', len(donnees)) + type_bloc + donnees
+            + struct.pack('>I', zlib.crc32(type_bloc + donnees)))
+
+def png_code_barres(code, format_code='auto', dpi=300, hauteur_mm=15):
+    """PNG noir et blanc (1 bit) des barres, zones calmes comprises, avec la résolution en pHYs"""
+    if dpi not in RESOLUTIONS_PNG:
+        raise ValueError(f'Unsupported resolution: {dpi} dpi')
+    format_code, modules, _ = encoder(code, format_code)
+    pixels = max(1, round(X_DIMENSION_MM * dpi / 25.4))
+
+    # 0 = noir, 1 = blanc ; toutes les lignes de l'image sont identiques
+    bits = ''.join(('0' if bit == '1' else '1') * pixels for bit in '0' * ZONE_CALME + modules + '0' * ZONE_CALME)
+    largeur, hauteur = len(bits), max(1, round(hauteur_mm * dpi / 25.4))
+    bits += '1' * (-len(bits) % 8)
+    ligne = b'\x00' + int(bits, 2).to_bytes(len(bits) // 8, 'big')
+
+    pixels_par_metre = round(dpi / 0.0254)
+    return (b'\x89PNG\r\n\x1a\n'
+            + _bloc_png(b'IHDR', struct.pack('>IIBBBBB', largeur, hauteur, 1, 0, 0, 0, 0))
+            + _bloc_png(b'pHYs', struct.pack('>IIB', pixels_par_metre, pixels_par_metre, 1))
+            + _bloc_png(b'IDAT', zlib.compress(ligne * hauteur, 9))
+            + _bloc_png(b'IEND', b''))
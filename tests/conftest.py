@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""Application chargée une fois sur une base SQLite temporaire"""
+
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+DOSSIER = tempfile.mkdtemp(prefix='tests_boutique_')
+os.environ.pop('DATABASE_URL', None)
+os.environ['SQLITE_PATH'] = os.path.join(DOSSIER, 'test.db')
+os.environ['METRIQUES_DIR'] = os.path.join(DOSSIER, 'metriques')
+os.environ['CACHE_PNG_DIR'] = os.path.join(DOSSIER, 'cache_png')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as boutique  # noqa: E402
+
+_numeros = itertools.count(1)
+
+@pytest.fixture
+def client():
+    boutique.app.config['TESTING'] = True
+    return boutique.app.test_client()
+
+@pytest.fixture
+def conn():
+    connexion = boutique.get_db_connection()
+    yield connexion
+    connexion.close()
+
+@pytest.fixture
+def creer_produit(conn):
+    """Insère un produit (code-barres unique par défaut) et retourne son id"""
+    def creer(nom='Produit test', code_barres=None, prix=1.0, stock=0, categorie='Other'):
+        code_barres = code_barres or f'TEST{next(_numeros):09d}'
+        cursor = conn.cursor()
+        cursor.execute('INSERT INTO produits (nom, code_barres, prix, stock, categorie) VALUES (?, ?, ?, ?, ?) RETURNING id',
+                       (nom, code_barres, prix, stock, categorie))
+        produit_id = cursor.fetchone()['id']
+        conn.commit()
+        return produit_id
+    return creer
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""Routes d'exploitation : jeton ADMIN_TOKEN ou accès local"""
+
+import pytest
+
+from conftest import boutique
+
+ROUTES_ADMIN = ['/metrics', '/api/cache', '/admin/requetes-lentes']
+
+
+@pytest.fixture
+def jeton(monkeypatch):
+    monkeypatch.setattr(boutique, 'ADMIN_TOKEN', 'secret-de-test')
+    return 'secret-de-test'
+
+
+@pytest.mark.parametrize('route', ROUTES_ADMIN)
+def test_sans_jeton_local_seulement(client, route):
+    assert client.get(route).status_code == 200
+    assert client.get(route, environ_base={'REMOTE_ADDR': '10.1.2.3'}).status_code == 403
+
+
+@pytest.mark.parametrize('route', ROUTES_ADMIN)
+def test_jeton_exige_meme_en_local(client, jeton, route):
+    assert client.get(route).status_code == 403
+    assert client.get(route, headers={'Authorization': 'Bearer autre'}).status_code == 403
+    reponse = client.get(route, headers={'Authorization': f'Bearer {jeton}'},
+                         environ_base={'REMOTE_ADDR': '10.1.2.3'})
+    assert reponse.status_code == 200
+
+
+def test_vidage_des_requetes_lentes_protege(client, jeton):
+    boutique.requetes_lentes.append({'sql': 'SELECT 1', 'duree_ms': 500, 'endpoint': 'test'})
+    assert client.delete('/admin/requetes-lentes').status_code == 403
+    assert len(boutique.requetes_lentes) == 1
+    assert client.delete('/admin/requetes-lentes', headers={'Authorization': f'Bearer {jeton}'}).status_code == 200
+    assert len(boutique.requetes_lentes) == 0
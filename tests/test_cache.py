@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Cache du scanner : invalidation par version des produits"""
+
+import pytest
+
+from conftest import boutique
+
+
+@pytest.fixture(autouse=True)
+def cache_vide():
+    boutique.cache_produits.invalider()
+    yield
+    boutique.cache_produits.invalider()
+
+
+def test_code_inconnu_puis_cree_par_un_autre_worker(client, creer_produit):
+    code = 'CACHE000000001'
+    assert client.get(f'/api/produit/{code}').get_json()['success'] is False
+    # Écriture hors de ce worker : seule la version des produits change
+    creer_produit(code_barres=code, stock=4)
+
+    reponse = client.post('/scan', json={'code': code, 'action': 'ajouter', 'quantite': 1}).get_json()
+    assert reponse['success'], reponse
+    assert client.get(f'/api/produit/{code}').get_json()['produit']['stock'] == 5
+
+
+def test_scan_sans_action_voit_un_produit_cree_ailleurs(client, creer_produit):
+    code = 'CACHE000000002'
+    assert client.post('/scan', json={'code': code}).get_json()['success'] is False
+    creer_produit(code_barres=code, stock=2)
+    reponse = client.post('/scan', json={'code': code}).get_json()
+    assert reponse['success'] and reponse['produit']['stock'] == 2
+
+
+def test_entree_positive_perimee_sur_route_conditionnelle(client, conn, creer_produit):
+    code = 'CACHE000000003'
+    creer_produit(code_barres=code, stock=1)
+    assert client.get(f'/api/produit/{code}').get_json()['produit']['stock'] == 1
+    conn.cursor().execute('UPDATE produits SET stock = 9 WHERE code_barres = ?', (code,))
+    conn.commit()
+    assert client.get(f'/api/produit/{code}').get_json()['produit']['stock'] == 9
+
+
+def test_stats_des_entrees_negatives():
+    cache = boutique.CacheLRU(4, 60, 60)
+    cache.set('absent', None)
+    cache.set('present', ('v', None), negatif=True)
+    cache.set('autre', 1)
+    assert cache.get('absent') == (True, None)
+    assert cache.get('present') == (True, ('v', None))
+    assert cache.get('autre') == (True, 1)
+    assert cache.get_stats()['hits_negatifs'] == 2
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Routes des codes-barres : cache navigateur et archive PNG"""
+
+from conftest import boutique
+
+
+def test_svg_immuable_seulement_avec_la_version(client, monkeypatch):
+    version = boutique.etiquettes.VERSION_ENCODEUR
+    versionnee = client.get(f'/generer-code/code/4006381333931?v={version}')
+    simple = client.get('/generer-code/code/4006381333931')
+
+    assert 'immutable' in versionnee.headers['Cache-Control']
+    assert 'immutable' not in simple.headers['Cache-Control']
+    assert versionnee.headers['ETag'] == simple.headers['ETag']
+
+    monkeypatch.setattr(boutique.etiquettes, 'VERSION_ENCODEUR', version + 1)
+    apres = client.get('/generer-code/code/4006381333931', headers={'If-None-Match': simple.headers['ETag']})
+    assert apres.status_code == 200
+    assert apres.headers['ETag'] != simple.headers['ETag']
+    assert 'immutable' not in client.get(f'/generer-code/code/4006381333931?v={version}').headers['Cache-Control']
+
+
+def test_png_immuable_seulement_avec_la_version(client):
+    version = boutique.etiquettes.VERSION_ENCODEUR
+    versionnee = client.get(f'/generer-code/png/4006381333931?dpi=72&v={version}')
+    simple = client.get('/generer-code/png/4006381333931?dpi=72')
+
+    assert versionnee.status_code == simple.status_code == 200
+    assert versionnee.headers['Cache-Control'] == boutique.CACHE_CODE_IMMUABLE
+    assert simple.headers['Cache-Control'] == boutique.CACHE_CODE_REVALIDE
+    versionnee.close()
+    simple.close()
+
+
+def test_noms_de_l_archive_png_identiques_apres_eviction(client, creer_produit, monkeypatch):
+    produit_id = creer_produit(code_barres='ZIP-0001/A')
+    ecrire = boutique.zipfile.ZipFile.write
+
+    def evince(archive, chemin, nom):
+        if 'ZIP-0001' in nom:
+            raise FileNotFoundError(chemin)
+        return ecrire(archive, chemin, nom)
+
+    monkeypatch.setattr(boutique.zipfile.ZipFile, 'write', evince)
+    reponse = client.get(f'/codes-barres/png.zip?ids={produit_id}&dpi=72')
+    archive = boutique.zipfile.ZipFile(boutique.io.BytesIO(reponse.get_data()))
+    assert archive.namelist() == [f'{produit_id}_ZIP-0001_A.png']
+    assert archive.read(archive.namelist()[0]).startswith(b'\x89PNG')
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Module etiquettes : encodeurs Code128 / EAN-13 et travaux d'impression thermique"""
+
+import pytest
+
+import etiquettes
+
+
+@pytest.mark.parametrize('code, controle', [
+    ('400638133393', '1'), ('590123412345', '7'), ('978020137962', '4'), ('000000000000', '0'),
+])
+def test_chiffre_controle_ean13(code, controle):
+    assert etiquettes.chiffre_controle_ean13(code) == controle
+    assert etiquettes.est_ean13(code + controle)
+
+
+def test_ean13_controle_calcule_ou_verifie():
+    modules, texte = etiquettes.encoder_ean13('400638133393')
+    assert texte == '4006381333931'
+    assert len(modules) == 95 and modules.startswith('101') and modules.endswith('101')
+    assert etiquettes.encoder_ean13('4006381333931') == (modules, texte)
+    with pytest.raises(ValueError, match='check digit'):
+        etiquettes.encoder_ean13('4006381333932')
+
+
+@pytest.mark.parametrize('code, valeurs', [
+    # Jeu B : 104 + somme pondérée des caractères, modulo 103
+    ('Wikipedia', [104, 55, 73, 75, 73, 80, 69, 68, 73, 65, 88, 106]),
+    # Jeu C : paires de chiffres
+    ('123456', [105, 12, 34, 56, 44, 106]),
+    # Texte puis suite de chiffres : bascule B -> C
+    ('AB1234', [104, 33, 34, 99, 12, 34, 102, 106]),
+])
+def test_valeurs_code128_et_controle(code, valeurs):
+    assert etiquettes.valeurs_code128(code) == valeurs
+
+
+def test_encoder_code128():
+    modules, texte = etiquettes.encoder_code128('Wikipedia')
+    assert texte == 'Wikipedia'
+    assert len(modules) == 11 * 11 + 13
+    with pytest.raises(ValueError):
+        etiquettes.encoder_code128('é')
+
+
+def test_format_auto():
+    assert etiquettes.encoder('4006381333931')[0] == 'ean13'
+    assert etiquettes.encoder('4006381333932')[0] == 'code128'
+
+
+@pytest.mark.parametrize('langage', etiquettes.LANGAGES_THERMIQUES)
+def test_etiquette_trop_basse_refusee(langage):
+    with pytest.raises(ValueError, match='Label too short'):
+        etiquettes.travail_thermique([], langage, largeur_mm=50, hauteur_mm=15, dpi=203)
+
+
+@pytest.mark.parametrize('langage', etiquettes.LANGAGES_THERMIQUES)
+def test_travail_par_defaut(langage):
+    etiquette = {'nom': 'Câble', 'code_barres': '4006381333931', 'prix': 2.5}
+    travail = b''.join(etiquettes.travail_thermique([etiquette], langage)).decode('cp1252' if langage == 'epl' else 'utf-8')
+    assert '400638133393' in travail and '$2.50' in travail
+
+
+def test_code_plus_large_que_l_etiquette():
+    largeur, hauteur = 160, 240  # 20 x 30 mm à 203 dpi
+    etiquette = {'nom': 'Long', 'code_barres': 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'prix': 1}
+    with pytest.raises(ValueError, match='too wide'):
+        etiquettes.etiquette_zpl(etiquette, largeur, hauteur, 1)
+    ignorees = []
+    travail = b''.join(etiquettes.travail_thermique([etiquette], 'zpl', largeur_mm=20, hauteur_mm=30,
+                                                    ignorees=ignorees)).decode('utf-8')
+    assert ignorees == ['ABCDEFGHIJKLMNOPQRSTUVWXYZ']
+    # Aucune étiquette, un commentaire qui cite le code ignoré
+    assert '^BC' not in travail and travail.startswith('^XA^FXSkipped 1 label(s)')
+    assert 'ABCDEFGHIJKLMNOPQRSTUVWXYZ' in travail
+
+
+def test_code_ignore_cite_en_commentaire_epl():
+    etiquettes_job = [{'nom': 'Long', 'code_barres': 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'prix': 1},
+                      {'nom': 'Court', 'code_barres': '4006381333931', 'prix': 1}]
+    travail = b''.join(etiquettes.travail_thermique(etiquettes_job, 'epl', largeur_mm=20, hauteur_mm=30)).decode('cp1252')
+    assert travail.count('\nP1,1') == 1
+    assert travail.rstrip('\n').splitlines()[-1] == \
+        '; Skipped 1 label(s), barcode not encodable or too wide: ABCDEFGHIJKLMNOPQRSTUVWXYZ'
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""Flux /events : plafond de flux par worker et durée maximale"""
+
+import time
+
+from conftest import boutique
+
+
+def test_flux_au_dela_du_plafond(client, monkeypatch):
+    monkeypatch.setattr(boutique, 'EVENEMENTS_FLUX_MAX', 0)
+    reponse = client.get('/events')
+    corps = reponse.get_data(as_text=True)
+    assert reponse.status_code == 200
+    assert reponse.mimetype == 'text/event-stream'
+    assert corps.startswith('retry: ') and int(corps.split()[1]) >= boutique.EVENEMENTS_PING * 1000
+    assert boutique.get_diffuseur().stats['refus'] >= 1
+
+
+def test_flux_ferme_a_l_echeance(client, monkeypatch):
+    monkeypatch.setattr(boutique, 'EVENEMENTS_DUREE_MAX', 0.3)
+    monkeypatch.setattr(boutique, 'EVENEMENTS_PING', 60)
+    debut = time.monotonic()
+    reponse = client.get('/events')
+    reponse.get_data()
+    reponse.close()
+    assert time.monotonic() - debut < 5
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Import groupé : validation par ligne, transaction unique et verrou d'écriture SQLite"""
+
+import sqlite3
+
+import pytest
+
+from conftest import boutique
+
+
+def test_import_csv_avec_erreurs_par_ligne(client, conn):
+    fichier = ('nom,code_barres,prix,stock,categorie\n'
+               'Import A,IMPORT000000001,2.5,4,Other\n'
+               'Import B,,1,1,Other\n'
+               'Import C,IMPORT000000003,-1,1,Other\n'
+               'Import A bis,IMPORT000000001,3,,Other\n')
+    reponse = client.post('/import?format=csv', data=fichier.encode('utf-8')).get_json()
+
+    assert reponse['success'], reponse
+    assert (reponse['lignes'], reponse['importees'], reponse['nb_erreurs']) == (4, 1, 2)
+    assert [erreur['ligne'] for erreur in reponse['erreurs']] == [3, 4]
+    cursor = conn.cursor()
+    cursor.execute("SELECT nom, prix, stock FROM produits WHERE code_barres = 'IMPORT000000001'")
+    assert tuple(cursor.fetchone()) == ('Import A bis', 3.0, 4)
+
+
+def test_lecture_du_fichier_hors_verrou_d_ecriture(conn, creer_produit):
+    produit_id = creer_produit(stock=1)
+    ecritures = []
+
+    def lignes():
+        for numero in range(3):
+            yield numero + 2, {'nom': f'Lot {numero}', 'code_barres': f'IMPORT1000000{numero:02d}', 'prix': '1'}, None
+        # Pendant la lecture du lot suivant, un scan d'un autre worker doit pouvoir écrire
+        autre = sqlite3.connect(boutique.SQLITE_PATH, timeout=0.2)
+        autre.execute('UPDATE produits SET stock = stock + 1 WHERE id = ?', (produit_id,))
+        autre.commit()
+        autre.close()
+        ecritures.append(True)
+        yield 5, {'nom': 'Lot 3', 'code_barres': 'IMPORT100000003', 'prix': '1'}, None
+
+    with boutique.app.test_request_context('/import', method='POST'):
+        rapport = boutique.importer_produits(conn, lignes(), taille_lot=3)
+
+    assert ecritures and rapport['importees'] == 4
+    cursor = conn.cursor()
+    cursor.execute('SELECT stock FROM produits WHERE id = ?', (produit_id,))
+    assert cursor.fetchone()['stock'] == 2
+
+
+def test_echec_en_cours_de_lecture_n_importe_rien(conn):
+    def lignes():
+        for numero in range(4):
+            yield numero + 2, {'nom': f'Atomique {numero}', 'code_barres': f'IMPORT2000000{numero:02d}', 'prix': '1'}, None
+        raise ValueError('fichier tronqué')
+
+    with boutique.app.test_request_context('/import', method='POST'):
+        with pytest.raises(ValueError):
+            boutique.importer_produits(conn, lignes(), taille_lot=2)
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) AS nb FROM produits WHERE code_barres LIKE 'IMPORT2%'")
+    assert cursor.fetchone()['nb'] == 0
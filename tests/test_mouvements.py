@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Journal des mouvements : compactage, purge et stock à une date passée"""
+
+from conftest import boutique
+
+
+def ajouter_mouvements(conn, produit_id, mouvements):
+    conn.cursor().executemany(
+        "INSERT INTO stock_mouvements (produit_id, delta, stock_apres, action, date_mouvement) VALUES (?, ?, ?, 'test', ?)",
+        [(produit_id, delta, stock_apres, date) for date, delta, stock_apres in mouvements])
+    conn.commit()
+
+
+def test_stock_a_date_apres_compactage_et_purge(conn, client, creer_produit):
+    produit_id = creer_produit(stock=6)
+    ajouter_mouvements(conn, produit_id, [
+        ('2020-01-08 10:00:00', 10, 10),
+        ('2020-01-09 15:00:00', -2, 8),
+        ('2020-01-10 09:00:00', -1, 7),
+        ('2020-01-10 17:00:00', -1, 6),
+    ])
+    boutique.compacter_mouvements(conn, retention_jours=1)
+    cursor = boutique.get_cursor(conn)
+    cursor.execute('SELECT COUNT(*) AS n FROM stock_mouvements WHERE produit_id = ?', (produit_id,))
+    assert cursor.fetchone()['n'] == 0
+
+    # Minuit suivant le jour compacté : son propre résumé s'applique
+    assert boutique.stock_a_date(cursor, produit_id, '2020-01-11 00:00:00') == (6, 'jour')
+    assert boutique.stock_a_date(cursor, produit_id, '2020-01-10 00:00:00') == (8, 'jour')
+    # En cours de journée : fin du jour précédent
+    assert boutique.stock_a_date(cursor, produit_id, '2020-01-10 12:00:00') == (8, 'jour')
+    # Avant tout historique : stock précédant le premier jour
+    assert boutique.stock_a_date(cursor, produit_id, '2020-01-02 00:00:00') == (0, 'mouvement')
+
+    reponse = client.get(f'/api/produit/{produit_id}/stock-a-date?date=2020-01-10')
+    assert reponse.get_json()['stock'] == 6
+
+
+def test_mouvement_valide_apres_le_compactage_de_son_jour(conn, creer_produit):
+    produit_id = creer_produit(stock=4)
+    ajouter_mouvements(conn, produit_id, [('2020-02-01 10:00:00', 5, 5)])
+    boutique.compacter_mouvements(conn)
+    # Transaction longue : validée après le compactage, datée du jour déjà résumé
+    ajouter_mouvements(conn, produit_id, [('2020-02-01 23:59:59.900000', -1, 4)])
+    boutique.compacter_mouvements(conn, retention_jours=1)
+
+    cursor = boutique.get_cursor(conn)
+    cursor.execute('SELECT stock_fin, variation, nb_mouvements FROM stock_journalier WHERE produit_id = ?',
+                   (produit_id,))
+    assert tuple(cursor.fetchone()) == (4, 4, 2)
+    assert boutique.stock_a_date(cursor, produit_id, '2020-02-02 00:00:00') == (4, 'jour')
+
+
+def test_stock_a_date_depuis_le_detail(conn, creer_produit):
+    produit_id = creer_produit(stock=3)
+    ajouter_mouvements(conn, produit_id, [
+        ('2099-01-01 08:00:00', 5, 5),
+        ('2099-01-01 12:00:00', -2, 3),
+        # Fraction de seconde (PostgreSQL) juste avant minuit
+        ('2099-01-01 23:59:59.750000', -1, 2),
+    ])
+    cursor = boutique.get_cursor(conn)
+    assert boutique.stock_a_date(cursor, produit_id, '2099-01-01 10:00:00') == (5, 'mouvement')
+    # L'instant est exclu
+    assert boutique.stock_a_date(cursor, produit_id, '2099-01-01 12:00:00') == (5, 'mouvement')
+    assert boutique.stock_a_date(cursor, produit_id, '2099-01-01 23:59:59') == (3, 'mouvement')
+    assert boutique.stock_a_date(cursor, produit_id, '2099-01-02 00:00:00') == (2, 'mouvement')
+
+
+def test_mouvement_d_ouverture_des_produits_sans_historique(conn, client, creer_produit):
+    produit_id = creer_produit(stock=9)
+    conn.cursor().execute(boutique.OUVERTURE_MOUVEMENTS)
+    conn.commit()
+
+    reponse = client.get(f'/api/produit/{produit_id}/stock-a-date?date=2000-01-01').get_json()
+    assert (reponse['success'], reponse['stock']) == (True, 9)
+    # Une seule ouverture, même appliquée deux fois
+    conn.cursor().execute(boutique.OUVERTURE_MOUVEMENTS)
+    cursor = boutique.get_cursor(conn)
+    cursor.execute("SELECT COUNT(*) AS n FROM stock_mouvements WHERE produit_id = ? AND action = 'ouverture'", (produit_id,))
+    assert cursor.fetchone()['n'] == 1
+    conn.commit()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Pagination par curseur de /api/produits"""
+
+import pytest
+
+from conftest import boutique
+
+
+def parcourir(client, **params):
+    """Ids de toutes les pages, en suivant curseur_suivant"""
+    ids, curseur = [], None
+    for _ in range(1000):
+        reponse = client.get('/api/produits', query_string=dict(params, **({'curseur': curseur} if curseur else {})))
+        page = reponse.get_json()
+        assert page['success'], page
+        ids.extend(produit['id'] for produit in page['produits'])
+        curseur = page['curseur_suivant']
+        if not curseur:
+            return ids
+    raise AssertionError('Pagination does not terminate')
+
+
+@pytest.fixture
+def catalogue(conn, creer_produit):
+    """Produits avec prix en double et catégories NULL, en plus de ceux de la base"""
+    ids = [creer_produit(nom=f'Pagination {i % 7}', prix=[1.1, 2.2, 3.3][i % 3], stock=i % 4,
+                         categorie=None if i % 5 == 0 else f'Cat{i % 3}')
+           for i in range(60)]
+    cursor = conn.cursor()
+    cursor.execute('UPDATE produits SET categorie = NULL WHERE id IN (%s)' % ','.join('?' * 12), ids[::5])
+    conn.commit()
+    return ids
+
+
+@pytest.mark.parametrize('tri', sorted(boutique.COLONNES_TRI))
+@pytest.mark.parametrize('ordre', ['asc', 'desc'])
+def test_parcours_complet_sans_doublon(client, conn, catalogue, tri, ordre):
+    cursor = conn.cursor()
+    cursor.execute('SELECT id FROM produits')
+    tous = {ligne['id'] for ligne in cursor.fetchall()}
+
+    ids = parcourir(client, sort=tri, order=ordre, limit=7)
+
+    assert len(ids) == len(set(ids))
+    assert set(ids) == tous
+
+
+def test_ordre_des_pages(client, conn, catalogue):
+    ids = parcourir(client, sort='prix', order='desc', limit=5)
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, prix FROM produits')
+    prix = {ligne['id']: ligne['prix'] for ligne in cursor.fetchall()}
+    cles = [(-prix[i], -i) for i in ids]
+    assert cles == sorted(cles)
+
+
+def test_curseur_invalide(client):
+    reponse = client.get('/api/produits', query_string={'curseur': 'pas-un-curseur'})
+    assert reponse.status_code == 400
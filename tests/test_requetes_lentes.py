@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""Journal des requêtes lentes"""
+
+import pytest
+
+from conftest import boutique
+
+
+@pytest.fixture
+def journal():
+    boutique.requetes_lentes.clear()
+    boutique.cache_plans.invalider()
+    boutique._erreurs_requetes_lentes.clear()
+    yield boutique.requetes_lentes
+    boutique.requetes_lentes.clear()
+
+
+def test_sql_en_bytes_comme_execute_values(conn, journal):
+    mesure = boutique.MesureRequete('test', 'POST')
+    sql = b"INSERT INTO evenements (type, donnees) VALUES ('stock','{}'),('stock','{}')"
+    boutique.noter_requete_lente(conn.cursor(), mesure, 0.5, sql)
+
+    assert len(journal) == 1
+    # Lignes de execute_values regroupées comme celles d'une liste de paramètres
+    assert journal[0]['sql'] == 'INSERT INTO evenements (type, donnees) VALUES (?, ...), ...'
+
+
+def test_erreur_du_journal_signalee(conn, journal, caplog):
+    mesure = boutique.MesureRequete('test', 'GET')
+    boutique.noter_requete_lente(conn.cursor(), mesure, 0.5, 12345)
+    boutique.noter_requete_lente(conn.cursor(), mesure, 0.5, 12345)
+
+    assert not journal
+    assert caplog.text.count('Could not record slow query') == 1
+    assert AttributeError in boutique._erreurs_requetes_lentes
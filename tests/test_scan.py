@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Scan unitaire et scan groupé : validation des quantités"""
+
+import pytest
+
+from conftest import boutique
+
+
+def stock(conn, produit_id):
+    cursor = conn.cursor()
+    cursor.execute('SELECT stock FROM produits WHERE id = ?', (produit_id,))
+    return cursor.fetchone()['stock']
+
+
+@pytest.mark.parametrize('valeur, attendu', [
+    (1, 1), ('3', 3), (2.0, 2), (0, None), (-50, None), ('abc', None),
+    (1.5, None), (True, None), (None, None), ([2], None),
+])
+def test_lire_quantite(valeur, attendu):
+    assert boutique.lire_quantite(valeur) == attendu
+
+
+def test_batch_quantites_invalides_par_ligne(client, conn, creer_produit):
+    produit_id = creer_produit(code_barres='BATCH000000001', stock=10)
+    reponse = client.post('/scan/batch', json={'scans': [
+        {'code': 'BATCH000000001', 'action': 'retirer', 'quantite': 2},
+        {'code': 'BATCH000000001', 'action': 'retirer', 'quantite': -50},
+        {'code': 'BATCH000000001', 'action': 'ajouter', 'quantite': 'beaucoup'},
+        {'code': 'BATCH000000001', 'action': 'ajouter', 'quantite': 0},
+        {'code': 'BATCH000000001', 'action': 'ajouter', 'quantite': '3'},
+    ]}).get_json()
+
+    assert reponse['success'], reponse
+    assert [resultat['success'] for resultat in reponse['resultats']] == [True, False, False, False, True]
+    assert reponse['resultats'][1]['quantite'] == -50
+    assert 'Invalid quantity' in reponse['resultats'][2]['message']
+    assert stock(conn, produit_id) == 11
+
+
+def test_scan_quantite_negative_refusee(client, conn, creer_produit):
+    produit_id = creer_produit(code_barres='BATCH000000002', stock=5)
+    reponse = client.post('/scan', json={'code': 'BATCH000000002', 'action': 'retirer', 'quantite': -50}).get_json()
+    assert reponse['success'] is False
+    assert stock(conn, produit_id) == 5
+
+
+@pytest.mark.parametrize('action, quantite', [
+    ('retirer', -50), ('ajouter', -3), ('ajouter', 0), ('definir', -1), ('retirer', 'x'),
+])
+def test_ajuster_stock_quantite_invalide(client, conn, creer_produit, action, quantite):
+    produit_id = creer_produit(stock=5)
+    reponse = client.post('/ajuster-stock', json={'produit_id': produit_id, 'action': action, 'quantite': quantite})
+    assert reponse.get_json()['success'] is False
+    assert 'Invalid quantity' in reponse.get_json()['message']
+    assert stock(conn, produit_id) == 5
+
+
+def test_ajuster_stock_definir_a_zero(client, conn, creer_produit):
+    produit_id = creer_produit(stock=5)
+    reponse = client.post('/ajuster-stock', json={'produit_id': produit_id, 'action': 'definir', 'quantite': 0})
+    assert reponse.get_json()['success'], reponse.get_json()
+    assert stock(conn, produit_id) == 0
+
+
+def test_batch_plus_de_codes_qu_une_tranche(client, conn, creer_produit):
+    # Au-delà de 500 codes, la lecture des produits se fait en plusieurs requêtes
+    produit_id = creer_produit(code_barres='BATCH000000999', stock=5)
+    scans = [{'code': f'INCONNU{numero:07d}', 'action': 'ajouter'} for numero in range(999)]
+    scans.append({'code': 'BATCH000000999', 'action': 'retirer'})
+    reponse = client.post('/scan/batch', json={'scans': scans}).get_json()
+
+    assert reponse['success'], reponse
+    assert reponse['resultats'][-1]['success']
+    assert not any(resultat['success'] for resultat in reponse['resultats'][:-1])
+    assert stock(conn, produit_id) == 4